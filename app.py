@@ -1,255 +1,19 @@
 import streamlit as st
-import pandas as pd
-import jpholiday
-from ortools.sat.python import cp_model
 import calendar
 from datetime import datetime
 from streamlit_local_storage import LocalStorage
-from collections import defaultdict
-
-# --- 定数定義 ---
-# アプリケーション全体で共通のルールをスクリプトの先頭で定義します。
-# これにより、設定の変更が容易になり、コードの保守性が向上します。
-WORKS = {"公休": 0, "日勤": 1, "半日": 2, "当直": 3, "明け": 4}
-WORK_SYMBOLS = {"公休": "ヤ", "日勤": "", "半日": "半", "当直": "△", "明け": "▲"}
-WORK_HOURS = {"公休": 0, "日勤": 8, "半日": 4, "当直": 16, "明け": 0}
-
-# 逆引き辞書もここで定義しておくと、コード内で何度も同じ変換処理を書かなくて済みます。
-WORKS_INV_SYMBOLS = {v: WORK_SYMBOLS[k] for k, v in WORKS.items()}
-SYMBOLS_INV_WORKS = {v: k for k, v in WORK_SYMBOLS.items()}
-
-# --- 事前チェック機能 ---
-def pre_check_constraints(staff_names, holiday_requests, work_requests, fixed_shifts):
-    """ユーザー入力の矛盾を事前にチェックする"""
-    for name in staff_names:
-        holiday_set = set(holiday_requests.get(name, []))
-        work_set = set(work_requests.get(name, []))
-        if not holiday_set.isdisjoint(work_set):
-            day = holiday_set.intersection(work_set).pop()
-            return f"❌ **{name}さん**の希望休（{day}日）と出勤希望（{day}日）が重複しています。"
-
-    for fix in fixed_shifts:
-        name = fix['staff']
-        day = fix['day']
-        work_symbol = fix['work']
-        display_work = "日勤" if work_symbol == "" else work_symbol
-
-        if day in holiday_requests.get(name, []):
-            return f"❌ **{name}さん**の固定シフト（{day}日：{display_work}）と希望休（{day}日）が重複しています。"
-        
-        work_name = SYMBOLS_INV_WORKS.get(work_symbol)
-        if work_name == "公休" and day in work_requests.get(name, []):
-            return f"❌ **{name}さん**の固定シフト（{day}日：公休）と出勤希望（{day}日）が重複しています。"
-
-    fixed_duty_counts = defaultdict(int)
-    for fix in fixed_shifts:
-        if fix['work'] == WORK_SYMBOLS["当直"]:
-            fixed_duty_counts[fix['day']] += 1
-    
-    for day, count in fixed_duty_counts.items():
-        if count > 1:
-            return f"❌ **{day}日**の当直に{count}人が固定されています。当直は1日1人までです。"
-    
-    return None
-
-# --- シフト作成のコアロジック ---
-def create_shift_schedule(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input):
-    staff_count = len(staff_names)
-
-    try:
-        num_days = calendar.monthrange(year, month)[1]
-    except calendar.IllegalMonthError:
-        st.error("有効な月を入力してください（1-12）。")
-        return None, "failed", []
-
-    if month == 2:
-        target_hours = 152
-    elif month == 1:
-        target_hours = 160
-    elif num_days == 31:
-        target_hours = 168
-    else:
-        target_hours = 160
-
-    dates = [pd.Timestamp(f"{year}-{month}-{d}") for d in range(1, num_days + 1)]
-    holidays_jp = [d[0].day for d in jpholiday.month_holidays(year, month)]
-
-    model = cp_model.CpModel()
-    
-    shifts = {}
-    for s_idx in range(staff_count):
-        for d_idx in range(num_days):
-            shifts[(s_idx, d_idx)] = model.NewIntVar(0, len(WORKS) - 1, f"shift_s{s_idx}_d{d_idx}")
-
-    # --- 制約ペナルティ管理 ---
-    all_penalty_terms = []
-    missed_requests_log = []
-
-    # --- ハード制約 & 一部ソフト制約 ---
-    # C1: 日ごとの必要人数と勤務の割り当て
-    for d_idx, date in enumerate(dates):
-        is_on_duty = [model.NewBoolVar(f'd{d_idx}_s{s_idx}_is_duty') for s_idx in range(staff_count)]
-        for s_idx in range(staff_count):
-            model.Add(shifts[(s_idx, d_idx)] == WORKS["当直"]).OnlyEnforceIf(is_on_duty[s_idx])
-            model.Add(shifts[(s_idx, d_idx)] != WORKS["当直"]).OnlyEnforceIf(is_on_duty[s_idx].Not())
-        model.Add(sum(is_on_duty) == 1)
-        
-        is_holiday_or_sunday = (date.weekday() == 6) or (date.day in holidays_jp)
-        if is_holiday_or_sunday:
-            for s_idx in range(staff_count):
-                allowed_shifts = [WORKS["当直"], WORKS["明け"], WORKS["公休"]]
-                model.AddAllowedAssignments([shifts[(s_idx, d_idx)]], [(s,) for s in allowed_shifts])
-        else:
-            required_nikkin = nikkin_requirements[date.weekday()]
-            if required_nikkin > 0:
-                is_on_nikkin = [model.NewBoolVar(f'd{d_idx}_s{s_idx}_is_nikkin') for s_idx in range(staff_count)]
-                for s_idx in range(staff_count):
-                    model.Add(shifts[(s_idx, d_idx)] == WORKS["日勤"]).OnlyEnforceIf(is_on_nikkin[s_idx])
-                    model.Add(shifts[(s_idx, d_idx)] != WORKS["日勤"]).OnlyEnforceIf(is_on_nikkin[s_idx].Not())
-                
-                # ソフト制約化: 日勤不足数
-                shortage_nikkin = model.NewIntVar(0, required_nikkin, f'shortage_nikkin_d{d_idx}')
-                model.Add(sum(is_on_nikkin) + shortage_nikkin >= required_nikkin)
-                # ペナルティ (固定値150で強めに設定)
-                all_penalty_terms.append(shortage_nikkin * 150)
-                missed_requests_log.append({'type': '日勤人数不足', 'var': shortage_nikkin, 'staff': '全体', 'day': d_idx + 1})
-
-    # C2: 勤務の連続性に関するルール
-    for s_idx in range(staff_count):
-        for d_idx in range(num_days):
-            if d_idx < num_days - 1:
-                is_duty_today = model.NewBoolVar(f's{s_idx}_d{d_idx}_is_duty_c2')
-                model.Add(shifts[(s_idx, d_idx)] == WORKS["当直"]).OnlyEnforceIf(is_duty_today)
-                model.Add(shifts[(s_idx, d_idx)] != WORKS["当直"]).OnlyEnforceIf(is_duty_today.Not())
-                model.Add(shifts[(s_idx, d_idx + 1)] == WORKS["明け"]).OnlyEnforceIf(is_duty_today)
-            
-            if d_idx < num_days - 1:
-                is_ake_today = model.NewBoolVar(f's{s_idx}_d{d_idx}_is_ake_c2')
-                model.Add(shifts[(s_idx, d_idx)] == WORKS["明け"]).OnlyEnforceIf(is_ake_today)
-                model.Add(shifts[(s_idx, d_idx)] != WORKS["明け"]).OnlyEnforceIf(is_ake_today.Not())
-                model.Add(shifts[(s_idx, d_idx + 1)] == WORKS["公休"]).OnlyEnforceIf(is_ake_today)
-
-    # C3: 最大連勤日数の制限（ソフト制約に変更）
-    for s_idx in range(staff_count):
-        for d_idx in range(num_days - max_consecutive_days_input):
-            is_off_in_window = [model.NewBoolVar(f's{s_idx}_d{i}_is_off') for i in range(d_idx, d_idx + max_consecutive_days_input + 1)]
-            for i, day_index in enumerate(range(d_idx, d_idx + max_consecutive_days_input + 1)):
-                model.Add(shifts[(s_idx, day_index)] == WORKS["公休"]).OnlyEnforceIf(is_off_in_window[i])
-                model.Add(shifts[(s_idx, day_index)] != WORKS["公休"]).OnlyEnforceIf(is_off_in_window[i].Not())
-            
-            # 期間中に休みが1日もない場合(sum==0)、連勤超過フラグを立てる
-            consecutive_over = model.NewBoolVar(f's{s_idx}_d{d_idx}_consecutive_over')
-            model.Add(sum(is_off_in_window) >= 1).OnlyEnforceIf(consecutive_over.Not())
-            model.Add(sum(is_off_in_window) == 0).OnlyEnforceIf(consecutive_over)
-            
-            all_penalty_terms.append(consecutive_over * 120) # 日勤不足より少し重いペナルティ
-            missed_requests_log.append({'type': '連勤超過', 'var': consecutive_over, 'staff': staff_names[s_idx], 'day': d_idx + max_consecutive_days_input + 1})
-
-    # C4: 固定シフトの反映
-    for fix in fixed_shifts:
-        s_name = fix['staff']
-        if s_name in staff_names:
-            s_idx = staff_names.index(s_name)
-            d_idx = fix['day'] - 1
-            work_name = SYMBOLS_INV_WORKS.get(fix['work'])
-            if work_name:
-                work_id = WORKS.get(work_name)
-                if work_id is not None:
-                    model.Add(shifts[(s_idx, d_idx)] == work_id)
-    
-    # C5: 半日勤務の上限回数など
-    for s_idx in range(staff_count):
-        is_half_day_bools = [model.NewBoolVar(f's{s_idx}_d{d_idx}_is_half') for d_idx in range(num_days)]
-        for d_idx in range(num_days):
-            model.Add(shifts[(s_idx, d_idx)] == WORKS["半日"]).OnlyEnforceIf(is_half_day_bools[d_idx])
-            model.Add(shifts[(s_idx, d_idx)] != WORKS["半日"]).OnlyEnforceIf(is_half_day_bools[d_idx].Not())
-        model.Add(sum(is_half_day_bools) <= max_half_days)
-
-        is_holiday_bools = [model.NewBoolVar(f's{s_idx}_d{d_idx}_is_holiday') for d_idx in range(num_days)]
-        for d_idx in range(num_days):
-            model.Add(shifts[(s_idx, d_idx)] == WORKS["公休"]).OnlyEnforceIf(is_holiday_bools[d_idx])
-            model.Add(shifts[(s_idx, d_idx)] != WORKS["公休"]).OnlyEnforceIf(is_holiday_bools[d_idx].Not())
-        model.AddLinearConstraint(sum(is_holiday_bools), 8, 10)
-
-        total_hours_per_staff = model.NewIntVar(0, num_days * 16, f"total_hours_{s_idx}")
-        
-        hours_list = [0] * len(WORKS)
-        for name, id in WORKS.items():
-            hours_list[id] = WORK_HOURS.get(name, 0)
-
-        daily_hour_vars = [model.NewIntVar(0, 16, f's{s_idx}_d{d_idx}_hours') for d_idx in range(num_days)]
-        for d_idx in range(num_days):
-            model.AddElement(shifts[(s_idx, d_idx)], hours_list, daily_hour_vars[d_idx])
-        model.Add(total_hours_per_staff == sum(daily_hour_vars))
-        
-        # 規定時間をオーバーすることは絶対に禁止（上限をハードに固定）
-        # ただし不足分（有給で補う分）は許容範囲として設定可能
-        model.Add(total_hours_per_staff >= target_hours - work_hour_tolerance)
-        model.Add(total_hours_per_staff <= target_hours)
-
-    # --- ソフト制約 (ペナルティを最小化するルール) ---
-
-    # S1: スタッフの希望をソフト制約として反映
-    for s_idx, s_name in enumerate(staff_names):
-        for day_off in holiday_requests.get(s_name, []):
-            if 1 <= day_off <= num_days:
-                penalty_var = model.NewBoolVar(f'missed_holiday_s{s_idx}_d{day_off-1}')
-                model.Add(shifts[(s_idx, day_off - 1)] != WORKS["公休"]).OnlyEnforceIf(penalty_var)
-                model.Add(shifts[(s_idx, day_off - 1)] == WORKS["公休"]).OnlyEnforceIf(penalty_var.Not())
-                all_penalty_terms.append(penalty_var * holiday_request_priority)
-                missed_requests_log.append({'type': '希望休', 'var': penalty_var, 'staff': s_name, 'day': day_off})
-
-        for day_on in work_requests.get(s_name, []):
-            if 1 <= day_on <= num_days:
-                penalty_var = model.NewBoolVar(f'missed_work_s{s_idx}_d{day_on-1}')
-                model.Add(shifts[(s_idx, day_on - 1)] == WORKS["公休"]).OnlyEnforceIf(penalty_var)
-                model.Add(shifts[(s_idx, day_on - 1)] != WORKS["公休"]).OnlyEnforceIf(penalty_var.Not())
-                all_penalty_terms.append(penalty_var * holiday_request_priority)
-                missed_requests_log.append({'type': '出勤希望', 'var': penalty_var, 'staff': s_name, 'day': day_on})
-    
-    # S2: 当直回数の公平化
-    duty_counts = [model.NewIntVar(0, num_days, f"duty_{s_idx}") for s_idx in range(staff_count)]
-    for s_idx in range(staff_count):
-        is_duty_bools = [model.NewBoolVar(f's{s_idx}_d{d_idx}_is_duty_count') for d_idx in range(num_days)]
-        for d_idx in range(num_days):
-            model.Add(shifts[(s_idx, d_idx)] == WORKS["当直"]).OnlyEnforceIf(is_duty_bools[d_idx])
-            model.Add(shifts[(s_idx, d_idx)] != WORKS["当直"]).OnlyEnforceIf(is_duty_bools[d_idx].Not())
-        model.Add(duty_counts[s_idx] == sum(is_duty_bools))
-    
-    min_duty, max_duty = model.NewIntVar(0, 10, 'min_d'), model.NewIntVar(0, 10, 'max_d')
-    model.AddMinEquality(min_duty, duty_counts)
-    model.AddMaxEquality(max_duty, duty_counts)
-    duty_difference = model.NewIntVar(0, 10, 'duty_diff')
-    model.Add(duty_difference == max_duty - min_duty)
-    all_penalty_terms.append(duty_difference * fairness_priority)
-
-    # --- 最適化目標 ---
-    model.Minimize(sum(all_penalty_terms))
-
-    # --- ソルバーの実行 ---
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 30.0
-    status = solver.Solve(model)
-
-    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-        schedule = {}
-        for s_idx, s_name in enumerate(staff_names):
-            schedule[s_name] = [WORKS_INV_SYMBOLS[solver.Value(shifts[(s_idx, d_idx)])] for d_idx in range(num_days)]
-        df = pd.DataFrame(schedule).T
-        
-        unfulfilled_requests = []
-        for log in missed_requests_log:
-            val = solver.Value(log['var'])
-            if val > 0:
-                if log['type'] == '日勤人数不足':
-                    unfulfilled_requests.append(f"**{log['day']}日**の**日勤人数**が {val} 人不足しています。")
-                elif log['type'] == '連勤超過':
-                    unfulfilled_requests.append(f"**{log['staff']}さん**が**{log['day']}日頃**に連勤上限を超過しています。")
-                else:
-                    unfulfilled_requests.append(f"**{log['staff']}さん**の**{log['day']}日**の**{log['type']}**")
-        return df, "success", unfulfilled_requests
-    else:
-        return None, "failed", []
+import os
+import time
+from raypyon.cache import SolveCache, make_cache_key, make_input_hash
+from raypyon.core import (
+    WORK_SYMBOLS, WORK_HOURS, SYMBOLS_INV_WORKS, SOLVER_PROFILES, DEFAULT_SOLVER_PROFILE,
+    NIKKIN_SHORTAGE_WEIGHT, CONSECUTIVE_OVER_WEIGHT, OBJECTIVE_MODES,
+    pre_check_constraints,
+)
+from raypyon.history import SolveHistory
+from raypyon.snapshot import DEFAULT_SNAPSHOT_DIR
+from raypyon.sweep import weight_grid
+from raypyon.worker import FINISHED_STATES, SolverService
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="レイぴょん", layout="wide")
@@ -276,6 +40,10 @@ with col3:
         key="staff_count_input",
         on_change=lambda: save_state('staff_count', st.session_state.staff_count_input)
     )
+ward = st.text_input(
+    "病棟名（作成履歴の整理に使います）", value=get_state('ward', ""), key="ward_input",
+    on_change=lambda: save_state('ward', st.session_state.ward_input)
+)
 
 st.header("2. スタッフの名前")
 default_names = ["山田", "鈴木", "佐藤", "田中", "高橋", "渡辺", "伊藤", "山本", "中村", "小林",
@@ -325,16 +93,100 @@ with st.expander("⚙️ 高度な設定"):
     )
     
     st.subheader("制約の優先度設定")
+    # 複数のシフト案を作るときは、重みで調整する解き方だけを使う（下の「作成するシフト案の数」で選ぶ）
+    multiple_alternatives = st.session_state.get('num_alternatives', 1) > 1
+    objective_mode = st.radio(
+        "優先度の決め方",
+        options=OBJECTIVE_MODES,
+        format_func=lambda mode: {"weighted": "重みで調整する", "lexicographic": "優先順位の順に決める"}[mode],
+        horizontal=True,
+        key="objective_mode",
+        disabled=multiple_alternatives,
+        help="「優先順位の順に決める」は、日勤の不足 → 連勤超過 → 希望 → 当直回数の差 の順に、前の項目を悪化させない範囲で1つずつ最小にします。結果が予想しやすく、下の優先度は使いません。複数のシフト案を作るときは使えません。"
+    )
+    # 優先度・重みは「優先度の組み合わせを比べる」から書き込むので、初期値は入力欄ではなく Session State に置く
+    for field, default_value in (('holiday_request_priority', 80), ('fairness_priority', 40),
+                                 ('nikkin_shortage_weight', NIKKIN_SHORTAGE_WEIGHT), ('consecutive_over_weight', CONSECUTIVE_OVER_WEIGHT)):
+        st.session_state.setdefault(field, default_value)
     holiday_request_priority = st.slider(
         "希望休・出勤希望の優先度",
-        min_value=0, max_value=100, value=80, step=20,
+        min_value=0, max_value=100, step=20,
+        key="holiday_request_priority",
+        disabled=objective_mode == "lexicographic",
         help="値が大きいほど、スタッフの希望を優先してシフトを作成します。"
     )
     fairness_priority = st.slider(
         "当直回数の公平性の優先度",
-        min_value=0, max_value=100, value=40, step=20,
+        min_value=0, max_value=100, step=20,
+        key="fairness_priority",
+        disabled=objective_mode == "lexicographic",
         help="値が大きいほど、スタッフ間の当直回数の差をなくすことを優先します。"
     )
+    weight_cols = st.columns(2)
+    nikkin_shortage_weight = weight_cols[0].number_input(
+        "日勤の不足1人あたりの重み",
+        min_value=0, max_value=500, step=10,
+        key="nikkin_shortage_weight",
+        disabled=objective_mode == "lexicographic",
+        help="値が大きいほど、日勤の人数が足りない日を作らないことを優先します。"
+    )
+    consecutive_over_weight = weight_cols[1].number_input(
+        "連勤超過1日あたりの重み",
+        min_value=0, max_value=500, step=10,
+        key="consecutive_over_weight",
+        disabled=objective_mode == "lexicographic",
+        help="値が大きいほど、最大連勤日数を超える勤務を作らないことを優先します。"
+    )
+
+    st.subheader("ソルバーの設定")
+    solver_profile = st.selectbox(
+        "計算プロファイル",
+        options=list(SOLVER_PROFILES),
+        index=list(SOLVER_PROFILES).index(DEFAULT_SOLVER_PROFILE),
+        format_func=lambda name: SOLVER_PROFILES[name]["label"],
+        help="「速さ優先」は短時間で下書きを作り、「品質優先」は時間をかけて最適解を探します。「再現性重視」は何度実行しても同じ結果になります。"
+    )
+    def reset_single_solve_options():
+        # 複数の案を作るときに使えない設定は、選べないようにする前に元に戻しておく
+        if st.session_state.num_alternatives > 1:
+            st.session_state.objective_mode = "weighted"
+            st.session_state.show_diagnostics = False
+            st.session_state.save_snapshot = False
+
+    num_alternatives = st.number_input(
+        "作成するシフト案の数",
+        min_value=1, max_value=5, value=1,
+        key="num_alternatives",
+        on_change=reset_single_solve_options,
+        help="2以上にすると、互いに十分違うシフト案をその数まで作り、目的関数値の内訳を並べて比べられます。計算時間は案の数で分け合います。優先順位の順に決める解き方・診断情報・計算モデルの保存は、案が1つのときだけ使えます。"
+    )
+    show_diagnostics = st.checkbox(
+        "診断情報を表示する",
+        value=False,
+        key="show_diagnostics",
+        disabled=num_alternatives > 1,
+        help="モデル構築にかかった時間や変数・制約の数を、制約グループごとに計測して表示します。"
+    )
+    save_snapshot = st.checkbox(
+        "計算モデルを保存する（不具合の調査用）",
+        value=False,
+        key="save_snapshot",
+        disabled=num_alternatives > 1,
+        help="組み立てたモデルと入力を1つのファイルに保存し、ダウンロードできるようにします。計算が遅い・失敗するときに、開発者が同じ条件で解き直して調べられます。"
+    )
+
+    st.subheader("再計算の設定")
+    use_previous_schedule = st.checkbox(
+        "前回のシフトを出発点にして再計算する",
+        value=True,
+        help="同じ月のシフトを作成済みの場合、その結果を初期解として使います。希望休や固定シフトを少し変えただけなら、短時間で計算が終わります。"
+    )
+    stability_priority = st.slider(
+        "前回のシフトからの変更を抑える度合い",
+        min_value=0, max_value=100, value=0, step=5,
+        disabled=not use_previous_schedule,
+        help="値が大きいほど、前回のシフトと同じ勤務をなるべく残します。0のときは初期解として使うだけです。"
+    )
 
 
 st.header("4. スタッフごとの希望")
@@ -391,9 +243,70 @@ if 'schedule_df' not in st.session_state:
     st.session_state.schedule_df = None
 if 'unfulfilled_requests' not in st.session_state:
     st.session_state.unfulfilled_requests = []
+if 'schedule_period' not in st.session_state:
+    st.session_state.schedule_period = None
+if 'solve_info' not in st.session_state:
+    st.session_state.solve_info = None
+if 'running_solve' not in st.session_state:
+    st.session_state.running_solve = None
+if 'alternatives' not in st.session_state:
+    st.session_state.alternatives = []
+
+@st.cache_resource
+def get_solve_cache():
+    return SolveCache()
+
+solve_cache = get_solve_cache()
+
+# 計算用のジョブの列は、サーバー上のすべての画面（セッション）で共有する
+@st.cache_resource
+def get_solver_service():
+    return SolverService()
+
+solver_service = get_solver_service()
+
+@st.cache_resource
+def get_solve_history():
+    return SolveHistory()
+
+solve_history = get_solve_history()
+
+def apply_solve_result(df, status, unfulfilled, solve_info, period, alternatives=()):
+    # "draft" は、時間内に解が見つからなかったときの貪欲法の下書き
+    st.session_state.alternatives = list(alternatives)
+    st.session_state.pop('chosen_alternative', None)
+    if status in ("success", "draft"):
+        st.session_state.schedule_df = df
+        st.session_state.schedule_period = period
+        st.session_state.unfulfilled_requests = unfulfilled
+        st.session_state.solve_info = solve_info
+    else:
+        st.session_state.schedule_df = None
+        st.session_state.unfulfilled_requests = []
+        st.session_state.solve_info = None
+        conflicts = (solve_info or {}).get('conflicts')
+        if conflicts and solve_info['solver_status'] == "SCREENED_INFEASIBLE":
+            st.error("❌ 入力の時点で、シフトを作れないことが分かりました。次の点を見直してください。")
+            for conflict in conflicts:
+                st.write(f"・ {conflict}")
+        elif conflicts:
+            st.error("❌ シフトの作成に失敗しました。次の条件を同時に満たすことができません。どれかを緩めてください。")
+            for conflict in conflicts:
+                st.write(f"・ {conflict}")
+        elif conflicts == []:
+            st.error("❌ 制限時間内にシフトが見つかりませんでした。条件の矛盾はないため、「品質優先」など制限時間の長い計算プロファイルを試してください。")
+        else:
+            st.error("❌ シフトの作成に失敗しました。条件が複雑で解決できない可能性があります。")
+
 
+# create_shift_schedule の位置引数（作成・組み合わせの比較・作成履歴で共通）
+solve_args = (
+    year, month, staff_names, holiday_requests, work_requests,
+    nikkin_requirements, st.session_state.fixed_shifts, max_half_days,
+    holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input
+)
 
-if st.button("🚀 シフトを作成する", type="primary"):
+if st.button("🚀 シフトを作成する", type="primary", disabled=st.session_state.running_solve is not None):
     error_message = pre_check_constraints(staff_names, holiday_requests, work_requests, st.session_state.fixed_shifts)
     if error_message:
         st.error(error_message)
@@ -402,28 +315,341 @@ if st.button("🚀 シフトを作成する", type="primary"):
         st.error("エラー: スタッフの名前が重複しています。それぞれ違う名前にしてください。")
         st.session_state.schedule_df = None
     else:
-        with st.spinner("最適なシフトを計算中です..."):
-            df, status, unfulfilled = create_shift_schedule(
-                year, month, staff_names, holiday_requests, work_requests, 
-                nikkin_requirements, st.session_state.fixed_shifts, max_half_days,
-                holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input
-            )
-        if status == "success":
-            st.session_state.schedule_df = df
-            st.session_state.unfulfilled_requests = unfulfilled
+        solve_options = {
+            'solver_profile': solver_profile, 'objective_mode': objective_mode,
+            'nikkin_shortage_weight': nikkin_shortage_weight, 'consecutive_over_weight': consecutive_over_weight,
+        }
+        if use_previous_schedule and st.session_state.schedule_df is not None and st.session_state.schedule_period == (year, month):
+            solve_options.update(previous_schedule=st.session_state.schedule_df, stability_priority=stability_priority)
+        # 同じ入力で作成済みなら、ソルバーを回さずに前回の結果を使う
+        # （前回のシフトはヒントとして使うだけなら結果の条件を変えないので、キーには含めない）
+        cache_key_options = solve_options if stability_priority > 0 else {
+            key: value for key, value in solve_options.items() if key not in ('previous_schedule', 'stability_priority')}
+        cache_key = make_cache_key(*solve_args, **cache_key_options)
+        # 複数の案を作るときと、計算モデルを保存するときは、毎回作り直す
+        cached = solve_cache.get(cache_key) if num_alternatives == 1 and not save_snapshot else None
+        if cached is not None:
+            apply_solve_result(*cached, period=(year, month))
         else:
-            st.session_state.schedule_df = None
-            st.session_state.unfulfilled_requests = []
-            st.error("❌ シフトの作成に失敗しました。条件が複雑で解決できない可能性があります。")
+            # ソルバーは別プロセスのジョブとして解き、画面側はジョブIDで途中経過を読みに行く
+            if num_alternatives == 1:
+                job_kind, job_options = "schedule", {**solve_options, 'profile_build': show_diagnostics}
+                if save_snapshot:
+                    job_options['snapshot_path'] = os.path.join(
+                        DEFAULT_SNAPSHOT_DIR, f"{ward or 'ward'}_{year}{month:02d}_{datetime.now():%Y%m%d%H%M%S}.zip")
+            else:
+                # 複数の案は重みで調整する解き方で作る（優先度の決め方は選べないようにしてある）
+                job_options = {key: value for key, value in solve_options.items() if key != 'objective_mode'}
+                job_kind, job_options = "alternatives", {**job_options, 'k': num_alternatives}
+            st.session_state.running_solve = {
+                'job_id': solver_service.submit(job_kind, solve_args, job_options),
+                'kind': job_kind,
+                'solve_args': solve_args,
+                'options': job_options,
+                'ward': ward,
+                'cache_key': cache_key,
+                'period': (year, month),
+            }
+
+finished_solve = st.session_state.pop('finished_solve', None)
+if finished_solve is not None:
+    job_status = finished_solve['status']
+    if job_status is None:
+        st.error("❌ 計算の結果が見つかりませんでした。もう一度作成してください。")
+    elif job_status['state'] == "cancelled":
+        st.info("ℹ️ 計算を取り消しました。")
+    elif job_status['state'] == "failed":
+        st.error("❌ 計算中にエラーが発生しました。")
+        with st.expander("エラーの詳細"):
+            st.code(job_status['error'])
+    elif finished_solve['kind'] == "sweep":
+        st.session_state.sweep_results = job_status['result']
+        st.session_state.sweep_period = finished_solve['period']
+    else:
+        df, status, unfulfilled, solve_info = job_status['result']
+        solve_history.record(finished_solve['solve_args'], job_status['result'], finished_solve['options'],
+                             kind=finished_solve['kind'], ward=finished_solve['ward'])
+        # 途中で打ち切った結果は最良とは限らないので、キャッシュには入れない
+        # 計算モデルのファイルはこの計算で書いたものなので、キャッシュした結果には残さない
+        if status == "success" and not solve_info.get('stopped_early') and not job_status['alternatives']:
+            cached_info = {key: value for key, value in solve_info.items() if key != 'snapshot_path'}
+            solve_cache.put(finished_solve['cache_key'], (df, status, unfulfilled, cached_info))
+        apply_solve_result(df, status, unfulfilled, solve_info, period=finished_solve['period'], alternatives=job_status['alternatives'])
+
+# 計算中の表示は1秒ごとにこの部分だけ描き直す（待っている間も、ほかの入力を操作できる）
+@st.fragment(run_every=1.0)
+def show_running_solve():
+    job = st.session_state.running_solve
+    if job is None:
+        return
+    job_status = solver_service.status(job['job_id'])
+    if job_status is None or job_status['state'] in FINISHED_STATES:
+        solver_service.forget(job['job_id'])
+        st.session_state.running_solve = None
+        st.session_state.finished_solve = {**job, 'status': job_status}
+        st.rerun()
+
+    # pandas は読み込みに時間がかかるので、表を表示するときまで読み込まない（画面の初回表示を速くするため）
+    import pandas as pd
+
+    is_sweep = job['kind'] == "sweep"
+    button_cols = st.columns(2)
+    button_cols[0].button("✋ ここまでの結果で比べる" if is_sweep else "✋ この案で確定する", key="stop_solve",
+                          on_click=solver_service.stop, args=(job['job_id'],),
+                          disabled=job_status['state'] != "running",
+                          help="いま解いている組み合わせが終わったところで打ち切り、それまでの結果を比べます。" if is_sweep
+                          else "計算を打ち切り、その時点で最も良いシフトを採用します。")
+    button_cols[1].button("✖ 取り消す", key="cancel_solve", on_click=solver_service.cancel, args=(job['job_id'],),
+                          help="計算をやめて、結果を捨てます。")
+    if job_status['state'] == "queued":
+        waited = time.time() - job_status['submitted_at']
+        st.info(f"⏳ ほかの計算が終わるのを待っています（前に {job_status['queue_position']} 件 / {waited:.0f}秒経過）")
+        return
+
+    elapsed = time.time() - job_status['started_at']
+    if is_sweep:
+        done_count = len(job_status['sweep_points'])
+        st.progress(done_count / job['grid_size'],
+                    text=f"⏳ 優先度の組み合わせを比べています... {done_count} / {job['grid_size']}（{elapsed:.0f}秒経過）")
+        return
+
+    incumbents = job_status['incumbents']
+    if not incumbents:
+        st.info(f"⏳ 最初のシフト案を探しています...（{elapsed:.0f}秒経過）")
+        if job_status['draft'] is not None:
+            st.caption("下書き（すぐに作れる簡易的な割り当て。条件を満たしていないことがあります）")
+            st.dataframe(job_status['draft'])
+    else:
+        latest = incumbents[-1]
+        st.info(
+            f"⏳ 改善中: 暫定案 {len(incumbents)} 件目 / 目的関数値 {latest['objective']:g} / "
+            f"下界 {latest['best_bound']:g} / ギャップ {latest['gap']:.1%}（{elapsed:.0f}秒経過）"
+        )
+        st.dataframe(pd.DataFrame(
+            [{'経過時間(秒)': round(inc['elapsed'], 2), '目的関数値': inc['objective'], '下界': inc['best_bound'], 'ギャップ': f"{inc['gap']:.1%}"} for inc in incumbents]
+        ), hide_index=True)
+        st.dataframe(latest['schedule'])
+
+if st.session_state.running_solve is not None:
+    show_running_solve()
+
+with st.expander("🗂 作成履歴"):
+    history_entries = solve_history.find(ward=ward, year=year, month=month)
+    if not history_entries:
+        st.caption(f"{ward or '病棟名なし'}・{year}年{month}月のシフトはまだ作成されていません。")
+    else:
+        import pandas as pd
+
+        current_hash = make_input_hash(*solve_args)
+        same_input = [entry['id'] for entry in history_entries if entry['input_hash'] == current_hash]
+        if same_input:
+            st.caption(f"いまの入力と同じ条件で作成したシフトが {len(same_input)} 件あります（「同じ入力」に ✓ があるもの）。")
+        st.dataframe(pd.DataFrame([
+            {
+                '番号': entry['id'],
+                '作成日時': entry['created_at'],
+                '計算プロファイル': SOLVER_PROFILES.get(entry['solver_profile'], {}).get("label", entry['solver_profile']),
+                '結果': entry['status'],
+                '目的関数値': entry['objective'],
+                '計算時間(秒)': None if entry['wall_time'] is None else round(entry['wall_time'], 1),
+                '同じ入力': "✓" if entry['id'] in same_input else "",
+            }
+            for entry in history_entries
+        ]), hide_index=True)
+        history_choice = st.selectbox(
+            "開く履歴", options=[entry['id'] for entry in history_entries if entry['status'] in ("success", "draft")],
+            format_func=lambda entry_id: f"#{entry_id}",
+        )
+        if st.button("この履歴のシフトを開く", disabled=history_choice is None):
+            entry = solve_history.load(history_choice)
+            apply_solve_result(*entry['result'], period=(entry['year'], entry['month']))
+
+def show_alternative():
+    chosen = st.session_state.alternatives[st.session_state.chosen_alternative]
+    st.session_state.schedule_df = chosen['schedule']
+    st.session_state.unfulfilled_requests = chosen['unfulfilled_requests']
+    st.session_state.solve_info = {**st.session_state.solve_info, 'objective': chosen['objective'],
+                                   'search_timeline': chosen.get('search_timeline')}
+
+def load_sweep_point(index):
+    # 入力欄の値は、描く前（ボタンのコールバック）でないと書き換えられない
+    weights = st.session_state.sweep_results[index]['weights']
+    st.session_state.objective_mode = "weighted"
+    for field, value in weights.items():
+        st.session_state[field] = value
+
+with st.expander("⚖️ 優先度の組み合わせを比べる"):
+    st.caption("優先度・重みの候補の組み合わせをまとめて解き、叶わなかった希望・日勤の不足・当直回数の差を比べます。選んだ組み合わせのシフトを下に表示できます。")
+    # 優先度の候補は、選んだ組み合わせを上の設定に読み込めるよう、スライダーと同じ刻みにする
+    priority_options = list(range(0, 101, 20))
+    sweep_cols = st.columns(2)
+    with sweep_cols[0]:
+        sweep_holiday = st.multiselect("希望休の優先度の候補", options=priority_options, default=[40, 80])
+        sweep_nikkin = st.multiselect("日勤不足の重みの候補", options=[50, 100, 150, 200, 300], default=[NIKKIN_SHORTAGE_WEIGHT])
+    with sweep_cols[1]:
+        sweep_fairness = st.multiselect("公平性の優先度の候補", options=priority_options, default=[20, 40, 80])
+        sweep_consecutive = st.multiselect("連勤超過の重みの候補", options=[40, 80, 120, 160, 240], default=[CONSECUTIVE_OVER_WEIGHT])
+    sweep_time_limit = st.number_input("1つの組み合わせあたりの制限時間（秒）", min_value=1, max_value=120, value=10)
+    grid = weight_grid(sweep_holiday, sweep_fairness, sweep_nikkin, sweep_consecutive)
+    if st.button(f"🔁 {len(grid)} 通りを比べる", disabled=not grid or st.session_state.running_solve is not None):
+        error_message = pre_check_constraints(staff_names, holiday_requests, work_requests, st.session_state.fixed_shifts)
+        if error_message:
+            st.error(error_message)
+        else:
+            # シフトの作成と同じジョブの列に入れ、途中経過は「6. シフト作成」の計算中の表示に出す
+            sweep_options = {'grid': grid, 'solver_profile': solver_profile, 'time_limit': sweep_time_limit}
+            st.session_state.running_solve = {
+                'job_id': solver_service.submit("sweep", solve_args, sweep_options),
+                'kind': "sweep",
+                'grid_size': len(grid),
+                'period': (year, month),
+            }
+            st.rerun()
+
+    sweep_results = st.session_state.get('sweep_results') or []
+    if sweep_results:
+        import pandas as pd
+
+        sweep_table = pd.DataFrame([
+            {
+                '希望休の優先度': r['weights']['holiday_request_priority'],
+                '公平性の優先度': r['weights']['fairness_priority'],
+                '日勤不足の重み': r['weights']['nikkin_shortage_weight'],
+                '連勤超過の重み': r['weights']['consecutive_over_weight'],
+                '叶わなかった希望': r['objective_breakdown']['missed_requests'] if r['objective_breakdown'] else None,
+                '日勤の不足人数': r['objective_breakdown']['nikkin_shortage'] if r['objective_breakdown'] else None,
+                '連勤超過': r['objective_breakdown']['consecutive_over'] if r['objective_breakdown'] else None,
+                '当直回数の差': r['objective_breakdown']['duty_difference'] if r['objective_breakdown'] else None,
+                'パレート最適': "★" if r['pareto'] else "",
+            }
+            for r in sweep_results
+        ])
+        st.dataframe(sweep_table, hide_index=True)
+        st.scatter_chart(sweep_table.dropna(), x='叶わなかった希望', y='当直回数の差', color='日勤の不足人数')
+        chosen_point = st.selectbox(
+            "表示する組み合わせ",
+            options=[i for i, r in enumerate(sweep_results) if r['schedule'] is not None],
+            format_func=lambda i: "、".join(f"{label} {sweep_table.iloc[i][label]}" for label in ('希望休の優先度', '公平性の優先度', '日勤不足の重み', '連勤超過の重み')),
+        )
+        if st.button("この組み合わせを設定に読み込む", disabled=chosen_point is None, on_click=load_sweep_point, args=(chosen_point,),
+                     help="選んだ優先度・重みを「高度な設定」に書き込み、そのシフトを下に表示します。次に「シフトを作成する」を押すと、この重みで作成します。"):
+            chosen = sweep_results[chosen_point]
+            apply_solve_result(chosen['schedule'], chosen['status'], chosen['unfulfilled_requests'], chosen['solve_info'], period=st.session_state.sweep_period)
 
 if st.session_state.schedule_df is not None:
-    st.success("✅ シフトの作成に成功しました！")
+    import pandas as pd
+
+    solve_info = st.session_state.solve_info
+    is_draft = bool(solve_info) and 'draft_violations' in solve_info
+    if is_draft:
+        st.warning("⚠️ 制限時間内にシフトが見つからなかったため、簡易的に作った下書きを表示しています。「品質優先」など制限時間の長い計算プロファイルで作り直してください。")
+        if solve_info['draft_violations']:
+            st.write("この下書きは、次の条件を満たしていません。")
+            for violation in solve_info['draft_violations']:
+                st.write(f"・ {violation}")
+    else:
+        st.success("✅ シフトの作成に成功しました！")
+    if solve_info and not is_draft:
+        profile_label = SOLVER_PROFILES.get(solve_info['solver_profile'], {}).get("label", solve_info['solver_profile'])
+        params_text = ", ".join(f"{k}={v}" for k, v in solve_info['solver_parameters'].items())
+        if solve_info.get('stopped_early'):
+            st.info("ℹ️ 計算を途中で打ち切ったシフト案です。時間をかければ、より良い案が見つかる可能性があります。")
+        st.caption(f"ソルバー設定: {profile_label}（{params_text}） / 状態: {solve_info['solver_status']} / 目的関数値: {solve_info['objective']:g} / 計算時間: {solve_info['wall_time']:.1f}秒")
+        if solve_info.get('lexicographic_stages'):
+            st.caption("優先順位の順の結果（計算時間 / 持ち時間）: " + " → ".join(
+                f"{stage['stage']} {stage['value']}（{stage['status']}・{stage['wall_time']:.1f} / {stage['solver_parameters']['max_time_in_seconds']:.1f}秒）"
+                for stage in solve_info['lexicographic_stages']
+            ))
+
+    if solve_info and solve_info.get('snapshot_path') and os.path.exists(solve_info['snapshot_path']):
+        with open(solve_info['snapshot_path'], "rb") as snapshot_file:
+            st.download_button("🧩 計算モデルをダウンロード", data=snapshot_file.read(),
+                               file_name=os.path.basename(solve_info['snapshot_path']), mime="application/zip",
+                               help="python -m raypyon.snapshot replay で解き直せます。")
+
+    if len(st.session_state.alternatives) > 1:
+        st.write("シフト案の比較（違うマスの数は、それより前の案との比較です）")
+        st.dataframe(pd.DataFrame([
+            {
+                '案': f"案{i + 1}",
+                '目的関数値': alt['objective'],
+                '叶わなかった希望': alt['objective_breakdown']['missed_requests'],
+                '日勤の不足人数': alt['objective_breakdown']['nikkin_shortage'],
+                '連勤超過': alt['objective_breakdown']['consecutive_over'],
+                '当直回数の差': alt['objective_breakdown']['duty_difference'],
+                '違うマスの数': " / ".join(f"案{j + 1}: {d}" for j, d in enumerate(alt['distances'])),
+            }
+            for i, alt in enumerate(st.session_state.alternatives)
+        ]), hide_index=True)
+        st.radio("表示するシフト案", options=range(len(st.session_state.alternatives)), format_func=lambda i: f"案{i + 1}",
+                 horizontal=True, key="chosen_alternative", on_change=show_alternative)
 
     if st.session_state.unfulfilled_requests:
         st.warning("⚠️ いくつかの希望は、他の制約との兼ね合いで実現できませんでした。")
         for req in st.session_state.unfulfilled_requests:
             st.write(f"・ {req}")
     
+    if solve_info and solve_info.get('screening_warnings'):
+        st.info("ℹ️ 入力の時点で、次の点は避けられないことが分かっています。")
+        for warning in solve_info['screening_warnings']:
+            st.write(f"・ {warning}")
+
+    if show_diagnostics:
+        with st.expander("🔍 診断情報", expanded=True):
+            if solve_info and 'build_profile' in solve_info:
+                metric_cols = st.columns(4)
+                metric_cols[0].metric("モデル構築", f"{solve_info['build_time'] * 1000:.0f} ms")
+                metric_cols[1].metric("求解", f"{solve_info['wall_time']:.2f} 秒")
+                metric_cols[2].metric("解の取り出し", f"{solve_info.get('extract_time', 0) * 1000:.0f} ms")
+                metric_cols[3].metric("変数 / 制約", f"{solve_info['num_variables']} / {solve_info['num_constraints']}")
+                st.write("制約グループごとの内訳（「ひな形」に ✓ があるものは、前に組み立てたモデルの複製で、時間は最初に組み立てたときのもの）")
+                st.dataframe(pd.DataFrame([
+                    {'グループ': p['phase'], 'ひな形': "✓" if p.get('cached') else "",
+                     '時間(ms)': round(p['time'] * 1000, 2), '変数': p['variables'], '制約': p['constraints']}
+                    for p in solve_info['build_profile']
+                ]), hide_index=True)
+                st.write("ソルバーの統計（前処理後のモデルの大きさと探索の回数）")
+                st.dataframe(pd.Series(solve_info['solver_stats'], name='値'))
+            else:
+                st.caption("保存済みの結果を表示しているため、診断情報はありません。もう一度計算すると表示されます。")
+
+            # 優先順位の順に解いたときは、段階ごとに1回ずつ解いているので、段階ごとに表示する
+            if solve_info and solve_info.get('search_timeline'):
+                timelines = [("", solve_info['search_timeline'])]
+            else:
+                timelines = [(f"（{stage['stage']}）", stage['search_timeline'])
+                             for stage in (solve_info or {}).get('lexicographic_stages') or [] if stage.get('search_timeline')]
+            for label, timeline in timelines:
+                st.write(f"探索の経過{label}")
+                timeline_cols = st.columns(4)
+                presolve_time = timeline.get('presolve_time')
+                first_time = timeline.get('time_to_first_solution')
+                timeline_cols[0].metric("前処理", "-" if presolve_time is None else f"{presolve_time:.2f} 秒")
+                timeline_cols[1].metric("最初の解", "-" if first_time is None else f"{first_time:.2f} 秒")
+                timeline_cols[2].metric("衝突 / 分岐", f"{timeline['statistics']['conflicts']} / {timeline['statistics']['branches']}")
+                timeline_cols[3].metric("ワーカー数", timeline.get('num_workers', "-"))
+                progress_points = [event for event in timeline['events'] if event['kind'] in ("solution", "bound")]
+                if progress_points:
+                    st.line_chart(pd.DataFrame(
+                        [{'経過時間(秒)': event['time'], '目的関数値': event['objective'], '下界': event['bound']} for event in progress_points]
+                    ).ffill(), x='経過時間(秒)', y=['目的関数値', '下界'])
+                if timeline['first_improvements']:
+                    st.caption("ワーカー（探索の方法）ごとに、最良解を最初に更新した時刻と、見つけた解の数")
+                    solutions_by_worker = timeline.get('solutions_by_worker', {})
+                    st.dataframe(pd.DataFrame([
+                        {'ワーカー': first['worker'], '経過時間(秒)': first['time'], '目的関数値': first['objective'],
+                         '見つけた解の数': solutions_by_worker.get(first['worker'], {}).get('Num')}
+                        for first in timeline['first_improvements']
+                    ]), hide_index=True)
+                if 'initial_model' in timeline and 'presolved_model' in timeline:
+                    st.caption(
+                        f"前処理で、変数 {timeline['initial_model']['variables']} → {timeline['presolved_model']['variables']}、"
+                        f"制約 {timeline['initial_model']['constraints']} → {timeline['presolved_model']['constraints']} に減りました。"
+                    )
+            if solve_info and solve_info.get('solver_log'):
+                st.download_button("📜 ソルバーのログをダウンロード", data="\n".join(solve_info['solver_log']),
+                                   file_name=f"solver_log_{year}_{month}.txt", mime="text/plain")
+
     df_for_display = st.session_state.schedule_df.copy()
     
     weekdays_jp = ["月", "火", "水", "木", "金", "土", "日"]
@@ -0,0 +1,20 @@
+"""レイぴょん - シフト自動作成
+
+シフト作成のコアロジックは raypyon.core にあります。
+よく使うものはここからも読み込めますが、実際に使われるまで raypyon.core を読み込みません。
+"""
+import importlib
+
+_CORE_EXPORTS = (
+    "WORKS", "WORK_SYMBOLS", "WORK_HOURS", "WORKS_INV_SYMBOLS", "SYMBOLS_INV_WORKS",
+    "SOLVER_PROFILES", "DEFAULT_SOLVER_PROFILE",
+    "SolveProgress", "pre_check_constraints", "create_shift_schedule",
+)
+
+__all__ = list(_CORE_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _CORE_EXPORTS:
+        return getattr(importlib.import_module("raypyon.core"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,134 @@
+"""互いに十分違う複数のシフト案
+
+比べて選べるよう、目的関数値の良い順に k 個のシフト案を作ります。
+モデルは1回だけ組み立て、解が見つかるたびに「これまでの案のどれとも min_distance マス以上違う」という
+制約を足して解き直します（直前の案をヒントにするので、2案目以降は速く見つかります）。
+
+ソルバーが探索中に見つける暫定解を集める方法は、ほとんど同じで目的関数値の悪い案ばかりになるため使っていません。
+"""
+import calendar
+import time
+
+from raypyon.core import (
+    CONSECUTIVE_OVER_WEIGHT, DEFAULT_SOLVER_PROFILE, NIKKIN_SHORTAGE_WEIGHT, SOLVER_PROFILES, WORKS,
+    apply_solver_profile, build_schedule_df, build_shift_model, carry_over_fixed_shifts,
+    objective_breakdown, unfulfilled_request_messages,
+)
+
+# min_distance を省略したときの、全マスに対する違いの割合
+DEFAULT_DISTANCE_RATIO = 0.05
+
+
+def hamming_distance(schedule_a, schedule_b):
+    """2つのシフト表で勤務が違うマスの数"""
+    return int((schedule_a.values != schedule_b.values).sum())
+
+
+def find_alternative_schedules(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input, k=3, min_distance=None, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, progress=None, carry_over=None, previous_schedule=None, stability_priority=0, nikkin_shortage_weight=NIKKIN_SHORTAGE_WEIGHT, consecutive_over_weight=CONSECUTIVE_OVER_WEIGHT):
+    """互いに min_distance マス以上違うシフト案を最大 k 個作り、(案のリスト, 求解の情報) を返す
+
+    案は目的関数値の良い順で、それぞれ schedule・objective・objective_breakdown・unfulfilled_requests・
+    distances（それより前の案との違いのマス数）・search_timeline（その案を見つけた求解の探索のタイムライン）を持ちます。
+    求解の情報の search_timelines には、案が見つからなかった最後の求解も含め、解いた順にタイムラインが入ります。
+    制限時間（省略時は計算プロファイルの制限時間）は k 回の求解で等分し、早く終わった分は次に回します。
+    条件を満たす案がそれ以上ないか、時間内に見つからなければ、k 個より少なくなります。
+    previous_schedule・stability_priority・carry_over・ペナルティの重みの扱いは create_shift_schedule と同じです。
+    """
+    from ortools.sat.python import cp_model
+    from raypyon.greedy import build_greedy_schedule
+    from raypyon.screening import screen_inputs
+    from raypyon.telemetry import SearchLog, search_timeline
+
+    if carry_over:
+        fixed_shifts = list(fixed_shifts) + carry_over_fixed_shifts(carry_over, staff_names)
+    if time_limit is None:
+        time_limit = SOLVER_PROFILES[solver_profile]["max_time_in_seconds"]
+    started_at = time.perf_counter()
+    args = (year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days,
+            holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input)
+
+    try:
+        screening_errors, screening_warnings = screen_inputs(
+            year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance)
+        if screening_errors:
+            return [], {
+                'solver_profile': solver_profile,
+                'solver_status': "SCREENED_INFEASIBLE",
+                'screening_warnings': screening_warnings,
+                'conflicts': screening_errors,
+                'stopped_early': False,
+            }
+        draft_df, _ = build_greedy_schedule(*args)
+        shift_model = build_shift_model(*args, hint_schedule=draft_df, carry_over=carry_over,
+                                        previous_schedule=previous_schedule, stability_priority=stability_priority,
+                                        nikkin_shortage_weight=nikkin_shortage_weight, consecutive_over_weight=consecutive_over_weight)
+    except calendar.IllegalMonthError:
+        return [], {}
+    model, x, num_days = shift_model.model, shift_model.x, shift_model.num_days
+    num_cells = len(staff_names) * num_days
+    if min_distance is None:
+        min_distance = max(1, round(num_cells * DEFAULT_DISTANCE_RATIO))
+
+    alternatives, statuses, timelines = [], [], []
+    solver_parameters = None
+    for index in range(k):
+        remaining = time_limit - (time.perf_counter() - started_at)
+        if remaining <= 0.1 or (progress is not None and progress.stop_requested):
+            break
+        solver = cp_model.CpSolver()
+        solver_parameters = apply_solver_profile(solver, solver_profile, remaining / (k - index))
+        search_log = SearchLog()
+        search_log.attach(solver)
+        if progress is not None:
+            progress.attach(solver)
+        status = solver.Solve(model)
+        statuses.append(solver.StatusName(status))
+        timelines.append(search_timeline(search_log, solver))
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            break
+
+        schedule = build_schedule_df(solver.BooleanValue, x, staff_names, num_days)
+        alternatives.append({
+            'schedule': schedule,
+            'objective': solver.ObjectiveValue(),
+            'best_bound': solver.BestObjectiveBound(),
+            'solver_status': solver.StatusName(status),
+            'objective_breakdown': objective_breakdown(solver.Value, shift_model),
+            'unfulfilled_requests': unfulfilled_request_messages(solver.Value, shift_model.missed_requests_log),
+            'search_timeline': timelines[-1],
+        })
+
+        # 次の案は、この案と同じ勤務のマスが (全マス - min_distance) 以下。この案をヒントに探索を始める
+        same_cells, constant_same = [], 0
+        model.ClearHints()
+        for s_idx in range(len(staff_names)):
+            for d_idx in range(num_days):
+                for work_id in WORKS.values():
+                    literal = x[(s_idx, d_idx, work_id)]
+                    value = solver.BooleanValue(literal)
+                    if isinstance(literal, bool):
+                        constant_same += literal
+                        continue
+                    model.AddHint(literal, value)
+                    if value:
+                        same_cells.append(literal)
+        model.Add(sum(same_cells) + constant_same <= num_cells - min_distance)
+
+    # 後から見つかった案のほうが良いこともある（前の案は時間切れで打ち切っていることがある）ので、良い順に並べ直す
+    alternatives.sort(key=lambda alternative: alternative['objective'])
+    for index, alternative in enumerate(alternatives):
+        alternative['distances'] = [hamming_distance(alternative['schedule'], other['schedule']) for other in alternatives[:index]]
+
+    solve_info = {
+        'solver_profile': solver_profile,
+        'solver_parameters': {**(solver_parameters or {}), 'max_time_in_seconds': time_limit},
+        'solver_status': statuses[0] if statuses else "UNKNOWN",
+        'solver_statuses': statuses,
+        'wall_time': time.perf_counter() - started_at,
+        'build_time': shift_model.build_time,
+        'min_distance': min_distance,
+        'stopped_early': progress is not None and progress.stop_requested,
+        'screening_warnings': screening_warnings,
+        'search_timelines': timelines,
+    }
+    return alternatives, solve_info
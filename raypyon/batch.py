@@ -0,0 +1,183 @@
+"""複数の病棟・複数の月のシフトを、画面を使わずにまとめて作成する
+
+入力は、画面で入力するのと同じ項目を持つ設定（JSON）です。
+1ファイル1設定の .json を置いたディレクトリか、1行1設定の .jsonl ファイルを渡します。
+
+    {"ward": "3階東", "year": 2025, "month": 5,
+     "staff_names": ["山田", "鈴木", ...],
+     "holiday_requests": {"山田": [3, 4]}, "work_requests": {},
+     "nikkin_requirements": [2, 2, 2, 2, 1, 0, 0],
+     "fixed_shifts": [{"staff": "鈴木", "day": 7, "work": "△"}],
+     "max_half_days": 2, "holiday_request_priority": 80, "fairness_priority": 40,
+     "work_hour_tolerance": 16, "max_consecutive_days_input": 3}
+
+year・month・staff_names・nikkin_requirements 以外は省略でき、省略したときは画面の初期値を使います。
+solver_profile・time_limit・search を書くと、その設定だけコマンドラインの指定より優先されます。
+search は "cpsat"（1つのモデルで解く）・"lns"（大近傍探索）・"auto"（スタッフが多ければ LNS）のいずれかです。
+objective_mode に "lexicographic" を書くと、優先順位の順に1つずつ最小化します（cpsat のときだけ）。
+結果は終わったものから順に、1行1件のJSONLで書き出します。
+--rolling を付けると、病棟ごとに月の順で解き、前月末の勤務を翌月に引き継ぎます（raypyon.rolling）。
+
+使い方:
+    python -m raypyon.batch wards/ --jobs 4 --time-limit 60 --output results.jsonl
+    python -m raypyon.batch wards/ --rolling
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from raypyon.core import DEFAULT_SOLVER_PROFILE, SOLVER_PROFILES, create_shift_schedule, pre_check_constraints
+from raypyon.lns import LNS_MIN_STAFF, solve_with_lns
+
+# 画面の初期値と同じもの
+DEFAULT_SETTINGS = {
+    'holiday_requests': {},
+    'work_requests': {},
+    'fixed_shifts': [],
+    'max_half_days': 2,
+    'holiday_request_priority': 80,
+    'fairness_priority': 40,
+    'work_hour_tolerance': 16,
+    'max_consecutive_days_input': 3,
+}
+REQUIRED_FIELDS = ('year', 'month', 'staff_names', 'nikkin_requirements')
+SEARCH_METHODS = ("auto", "cpsat", "lns")
+SOLVE_FIELDS = REQUIRED_FIELDS + tuple(DEFAULT_SETTINGS)
+
+
+def load_configs(path):
+    """ディレクトリ（*.json / *.jsonl）または .jsonl ファイルから設定を読み込む"""
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith((".json", ".jsonl")))
+    else:
+        files = [path]
+
+    configs = []
+    for file_path in files:
+        with open(file_path, encoding="utf-8") as f:
+            if file_path.endswith(".jsonl"):
+                for line_no, line in enumerate(f, 1):
+                    if line.strip():
+                        configs.append(_with_ward(json.loads(line), f"{os.path.basename(file_path)}:{line_no}"))
+            else:
+                configs.append(_with_ward(json.load(f), os.path.splitext(os.path.basename(file_path))[0]))
+    return configs
+
+
+def _with_ward(config, default_ward):
+    config.setdefault('ward', default_ward)
+    return config
+
+
+def solve_config(config, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, search="auto", carry_over=None, snapshot_path=None):
+    """1つの設定を検証して解き、JSONにできる結果を返す（carry_over は前月から引き継ぐ勤務）
+
+    snapshot_path を渡すと、モデルと入力のスナップショットを書き出します（cpsat のときだけ）。
+    """
+    result = {'ward': config.get('ward'), 'year': config.get('year'), 'month': config.get('month')}
+    missing = [field for field in REQUIRED_FIELDS if field not in config]
+    if missing:
+        return {**result, 'status': "invalid", 'error': f"必須の項目がありません: {', '.join(missing)}"}
+
+    args = {**DEFAULT_SETTINGS, **{field: config[field] for field in SOLVE_FIELDS if field in config}}
+    # 日付が文字列で書かれていても扱えるよう、整数にそろえる
+    for field in ('holiday_requests', 'work_requests'):
+        args[field] = {name: [int(day) for day in days] for name, days in args[field].items()}
+
+    staff_names = args['staff_names']
+    error_message = pre_check_constraints(staff_names, args['holiday_requests'], args['work_requests'], args['fixed_shifts'])
+    if error_message is None and len(staff_names) != len(set(staff_names)):
+        error_message = "エラー: スタッフの名前が重複しています。"
+    if error_message:
+        return {**result, 'status': "invalid", 'error': error_message}
+
+    search = config.get('search', search)
+    if search == "auto":
+        search = "lns" if len(staff_names) >= LNS_MIN_STAFF else "cpsat"
+    solve = solve_with_lns if search == "lns" else create_shift_schedule
+    options = {}
+    if search != "lns":
+        if 'objective_mode' in config:
+            options['objective_mode'] = config['objective_mode']
+        if snapshot_path is not None:
+            options['snapshot_path'] = snapshot_path
+    df, status, unfulfilled, solve_info = solve(
+        **args,
+        **options,
+        solver_profile=config.get('solver_profile', solver_profile),
+        time_limit=config.get('time_limit', time_limit),
+        carry_over=carry_over,
+    )
+    result.update(status=status, unfulfilled_requests=unfulfilled, solve_info=solve_info)
+    if df is not None:
+        result['schedule'] = {name: list(row) for name, row in df.iterrows()}
+    return result
+
+
+def _solve_ward(configs, solver_profile, time_limit, search):
+    """1つの病棟の設定を、前月の結果を引き継ぎながら月の順に解く"""
+    from raypyon.rolling import solve_rolling_horizon
+
+    return list(solve_rolling_horizon(configs, solver_profile, time_limit, search))
+
+
+def solve_batch(configs, max_workers=None, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, search="auto", rolling=False):
+    """設定をプロセスプールで並列に解き、終わった順に結果を返すジェネレーター
+
+    rolling=True のときは病棟ごとにまとめ、病棟の中では月の順に1つずつ解きます。
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as executor:
+        if rolling:
+            wards = {}
+            for config in configs:
+                wards.setdefault(config.get('ward'), []).append(config)
+            futures = {executor.submit(_solve_ward, ward_configs, solver_profile, time_limit, search): ward_configs for ward_configs in wards.values()}
+        else:
+            futures = {executor.submit(solve_config, config, solver_profile, time_limit, search): [config] for config in configs}
+        for future in as_completed(futures):
+            try:
+                results = future.result() if rolling else [future.result()]
+            except Exception as e:
+                results = [
+                    {'ward': config.get('ward'), 'year': config.get('year'), 'month': config.get('month'), 'status': "error", 'error': repr(e)}
+                    for config in futures[future]
+                ]
+            yield from results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="複数の病棟・月のシフトをまとめて作成します。")
+    parser.add_argument("input", help="設定の .json を置いたディレクトリ、または .jsonl ファイル")
+    parser.add_argument("--output", default="-", help="結果のJSONLの書き出し先（既定は標準出力）")
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 1) // 8),
+                        help="同時に解く数。1つの求解が複数コアを使うので、コア数より少なくしてください。")
+    parser.add_argument("--time-limit", type=float, default=None, help="1件あたりの制限時間（秒）")
+    parser.add_argument("--profile", choices=list(SOLVER_PROFILES), default=DEFAULT_SOLVER_PROFILE)
+    parser.add_argument("--search", choices=SEARCH_METHODS, default="auto",
+                        help=f"解き方。auto はスタッフが{LNS_MIN_STAFF}人以上なら大近傍探索（LNS）を使います。")
+    parser.add_argument("--rolling", action="store_true",
+                        help="病棟ごとに月の順で解き、前月末の当直・明け・連勤を翌月に引き継ぎます。")
+    args = parser.parse_args(argv)
+
+    configs = load_configs(args.input)
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    failed = 0
+    try:
+        for result in solve_batch(configs, max_workers=args.jobs, solver_profile=args.profile, time_limit=args.time_limit, search=args.search, rolling=args.rolling):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            if result['status'] != "success":
+                failed += 1
+            print(f"{result['ward']} {result['year']}-{result['month']}: {result['status']}", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""シフト作成のベンチマーク
+
+乱数のシードから再現できる架空の病棟データ（インスタンス）を作り、create_shift_schedule を解いて
+モデル構築時間・変数/制約の数・最初の解が出るまでの時間・最終的な目的関数値・ギャップ・ピークメモリを記録します。
+結果はJSONL（1行1インスタンス）で書き出すので、コミット間で比較できます。
+
+使い方:
+    python -m raypyon.bench --output bench.jsonl
+    python -m raypyon.bench --staff-counts 6 20 --seeds 0 1 2 --profile fast_draft
+    python -m raypyon.bench --staff-counts 100 200 --search lns
+"""
+import argparse
+import calendar
+import datetime
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from importlib import metadata
+
+import jpholiday
+
+from raypyon.core import (
+    DEFAULT_SOLVER_PROFILE, SOLVER_PROFILES, WORK_SYMBOLS,
+    SolveProgress, create_shift_schedule, pre_check_constraints,
+)
+from raypyon.lns import solve_with_lns
+
+DEFAULT_STAFF_COUNTS = (3, 6, 10, 20, 50, 100, 200)
+# 28・29・30・31日の月と、祝日の多い月（5月・9月）を含めています。
+DEFAULT_MONTHS = ((2025, 2), (2024, 2), (2025, 4), (2025, 5), (2025, 9), (2025, 12))
+
+
+def generate_instance(seed, staff_count, year, month, request_density=None, fixed_density=None, nikkin_ratio=None):
+    """シードから1つのインスタンス（create_shift_schedule の引数一式）を作る
+
+    request_density は1人1日あたりの希望休・出勤希望の割合、fixed_density は固定シフトの割合、
+    nikkin_ratio は平日の日勤必要人数をスタッフ数に対する割合で表したものです。
+    指定しないものはシードから決めます。
+    """
+    rng = random.Random(f"{seed}-{staff_count}-{year}-{month}")
+    if request_density is None:
+        request_density = rng.uniform(0.02, 0.15)
+    if fixed_density is None:
+        fixed_density = rng.uniform(0.0, 0.05)
+    if nikkin_ratio is None:
+        nikkin_ratio = rng.uniform(0.2, 0.5)
+
+    num_days = calendar.monthrange(year, month)[1]
+    holidays_jp = {d[0].day for d in jpholiday.month_holidays(year, month)}
+    days_off = {day for day in range(1, num_days + 1) if datetime.date(year, month, day).weekday() == 6 or day in holidays_jp}
+    staff_names = [f"スタッフ{i + 1}" for i in range(staff_count)]
+
+    # 当直と明けの2人、公休の人を除いた残りの割合で日勤人数を決める（金土は少なめ、日曜は0）
+    weekday_nikkin = max(0, round((staff_count - 2) * nikkin_ratio))
+    nikkin_requirements = [weekday_nikkin] * 4 + [weekday_nikkin // 2, weekday_nikkin // 4, 0]
+
+    holiday_requests, work_requests = {}, {}
+    for name in staff_names:
+        requested = [day for day in range(1, num_days + 1) if rng.random() < request_density]
+        rng.shuffle(requested)
+        # 希望のうち4分の3を希望休、残りを出勤希望にする
+        split = (len(requested) * 3 + 3) // 4
+        holiday_requests[name] = sorted(requested[:split])
+        work_requests[name] = sorted(requested[split:])
+
+    fixed_shifts = []
+    blocked = set()  # (スタッフ, 日) のうち、固定シフトを置けないところ
+    duty_days = set()
+    for _ in range(round(staff_count * num_days * fixed_density)):
+        name = rng.choice(staff_names)
+        day = rng.randint(1, num_days)
+        if (name, day) in blocked or day in holiday_requests[name] or day in work_requests[name]:
+            continue
+        if day not in duty_days and day + 2 <= num_days and rng.random() < 0.3:
+            # 当直を固定したら、翌日の明けと翌々日の公休には別の固定を置かない
+            if any((name, d) in blocked for d in (day + 1, day + 2)):
+                continue
+            fixed_shifts.append({'staff': name, 'day': day, 'work': WORK_SYMBOLS["当直"]})
+            duty_days.add(day)
+            blocked.update((name, d) for d in (day, day + 1, day + 2))
+        elif day in days_off or rng.random() < 0.5:
+            fixed_shifts.append({'staff': name, 'day': day, 'work': WORK_SYMBOLS["公休"]})
+            blocked.add((name, day))
+        else:
+            fixed_shifts.append({'staff': name, 'day': day, 'work': WORK_SYMBOLS["日勤"]})
+            blocked.add((name, day))
+    assert pre_check_constraints(staff_names, holiday_requests, work_requests, fixed_shifts) is None
+
+    return {
+        'name': f"s{staff_count}_{year}{month:02d}_seed{seed}",
+        'seed': seed,
+        'num_days': num_days,
+        'num_holidays': len(holidays_jp),
+        'request_density': request_density,
+        'fixed_density': fixed_density,
+        'nikkin_ratio': nikkin_ratio,
+        'args': {
+            'year': year,
+            'month': month,
+            'staff_names': staff_names,
+            'holiday_requests': holiday_requests,
+            'work_requests': work_requests,
+            'nikkin_requirements': nikkin_requirements,
+            'fixed_shifts': fixed_shifts,
+            'max_half_days': 2,
+            'holiday_request_priority': 80,
+            'fairness_priority': 40,
+            'work_hour_tolerance': 16,
+            'max_consecutive_days_input': 5,
+        },
+    }
+
+
+def generate_suite(seeds=(0,), staff_counts=DEFAULT_STAFF_COUNTS, months=DEFAULT_MONTHS):
+    """スタッフ数ごとに月を順番に割り当てて、インスタンスの一覧を作る"""
+    instances = []
+    for seed in seeds:
+        for i, staff_count in enumerate(staff_counts):
+            year, month = months[(i + seed) % len(months)]
+            instances.append(generate_instance(seed, staff_count, year, month))
+    return instances
+
+
+def run_instance(instance, solver_profile=DEFAULT_SOLVER_PROFILE, search="cpsat"):
+    """1つのインスタンスを解いて、計測結果を辞書で返す
+
+    ピークメモリはプロセス全体の最大値なので、run_suite では1インスタンスごとに新しいプロセスで実行します。
+    """
+    # 暫定解ごとにシフト表を作ると計測する求解の時間に混ざるので、経過時間と目的関数値だけを記録する
+    progress = SolveProgress(with_schedule=False)
+    started_at = time.perf_counter()
+    if search == "lns":
+        df, status, unfulfilled, solve_info = solve_with_lns(**instance['args'], solver_profile=solver_profile, progress=progress)
+    else:
+        df, status, unfulfilled, solve_info = create_shift_schedule(**instance['args'], solver_profile=solver_profile, progress=progress, profile_build=True)
+    total_time = time.perf_counter() - started_at
+
+    first = progress.incumbents[0] if progress.incumbents else None
+    objective = solve_info.get('objective')
+    best_bound = solve_info.get('best_bound')
+    args = instance['args']
+    return {
+        'instance': instance['name'],
+        'seed': instance['seed'],
+        'staff_count': len(args['staff_names']),
+        'year': args['year'],
+        'month': args['month'],
+        'num_days': instance['num_days'],
+        'num_holidays': instance['num_holidays'],
+        'request_density': round(instance['request_density'], 4),
+        'fixed_density': round(instance['fixed_density'], 4),
+        'num_fixed_shifts': len(args['fixed_shifts']),
+        'nikkin_requirements': args['nikkin_requirements'],
+        'solver_profile': solver_profile,
+        'search': search,
+        'status': status,
+        'solver_status': solve_info.get('solver_status'),
+        'build_time': solve_info.get('build_time'),
+        'num_variables': solve_info.get('num_variables'),
+        'num_constraints': solve_info.get('num_constraints'),
+        'time_to_first_solution': first['elapsed'] if first else None,
+        'num_incumbents': len(progress.incumbents),
+        'objective': objective,
+        'best_bound': best_bound,
+        'gap': abs(objective - best_bound) / max(1.0, abs(objective)) if objective is not None else None,
+        'num_unfulfilled': len(unfulfilled),
+        'solve_time': solve_info.get('wall_time'),
+        'extract_time': solve_info.get('extract_time'),
+        'total_time': total_time,
+        'build_profile': solve_info.get('build_profile'),
+        'solver_stats': solve_info.get('solver_stats'),
+        'trajectory': solve_info.get('trajectory'),
+        'search_timeline': solve_info.get('search_timeline'),
+        # Linuxでは ru_maxrss はKB単位
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _run_instance_star(job):
+    return run_instance(*job)
+
+
+def run_metadata():
+    """比較のために、どのコード・どの環境で測ったかを記録する"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'ortools': metadata.version("ortools"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'started_at': datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def run_suite(instances, solver_profile=DEFAULT_SOLVER_PROFILE, output=None, search="cpsat"):
+    """インスタンスを1つずつ別プロセスで解き、終わったものから結果を返す（output があればJSONLで追記する）"""
+    meta = run_metadata()
+    ctx = multiprocessing.get_context("spawn")
+    # ソルバーが全コアを使うので、同時に解くのは1つだけ。プロセスは毎回作り直す
+    with ctx.Pool(processes=1, maxtasksperchild=1) as pool:
+        for result in pool.imap(_run_instance_star, [(instance, solver_profile, search) for instance in instances]):
+            record = {**meta, **result}
+            if output is not None:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+            yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シフト作成のベンチマークを実行します。")
+    parser.add_argument("--staff-counts", type=int, nargs="+", default=list(DEFAULT_STAFF_COUNTS))
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--profile", choices=list(SOLVER_PROFILES), default=DEFAULT_SOLVER_PROFILE)
+    parser.add_argument("--search", choices=("cpsat", "lns"), default="cpsat", help="解き方（lns は大近傍探索）")
+    parser.add_argument("--output", default="-", help="結果のJSONLの書き出し先（既定は標準出力）")
+    args = parser.parse_args(argv)
+
+    instances = generate_suite(seeds=args.seeds, staff_counts=args.staff_counts)
+    output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    try:
+        for record in run_suite(instances, solver_profile=args.profile, output=output, search=args.search):
+            first, build_time = record['time_to_first_solution'], record['build_time']
+            # 入力の時点で弾いたインスタンスは、モデルを組み立てていないので構築時間がない
+            print(
+                f"{record['instance']}: {record['solver_status']} / 構築 {'-' if build_time is None else f'{build_time:.2f}s'} / "
+                f"最初の解 {'なし' if first is None else f'{first:.2f}s'} / 目的関数値 {record['objective']} / "
+                f"ピークメモリ {record['peak_rss_mb']:.0f}MB",
+                file=sys.stderr,
+            )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""シフト作成結果のディスクキャッシュ
+
+同じ入力で「シフトを作成する」を押したときに、ソルバーを回さずに前回の結果を返すためのものです。
+キーは入力を正規化したJSONのハッシュで、結果はpickleとして1ファイルずつ保存します。
+合計サイズが上限を超えたら、最後に使われた時刻が古いものから削除します（LRU）。
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from importlib import metadata
+
+# モデルの作り方や、結果（求解の情報）の形を変えたときは、この値を上げて古いキャッシュを無効にします。
+CACHE_FORMAT_VERSION = 8
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "raypyon", "solves")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _solver_version():
+    try:
+        return metadata.version("ortools")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _json_default(value):
+    # 前回のシフト（DataFrame）などのオプション引数もキーに含められるようにする
+    if hasattr(value, "to_dict"):
+        return value.to_dict(orient="split")
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"キャッシュキーに使えない値です: {type(value).__name__}")
+
+
+def normalize_inputs(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input):
+    """create_shift_schedule の位置引数を、並び順や型の違いに左右されないJSONにできる辞書にする"""
+    return {
+        "year": int(year),
+        "month": int(month),
+        # スタッフの並び順は出力の行順になるので、そのまま残します。
+        "staff_names": list(staff_names),
+        "holiday_requests": {name: sorted(int(d) for d in days) for name, days in holiday_requests.items() if name in staff_names},
+        "work_requests": {name: sorted(int(d) for d in days) for name, days in work_requests.items() if name in staff_names},
+        "nikkin_requirements": [int(n) for n in nikkin_requirements],
+        "fixed_shifts": sorted((fix['staff'], int(fix['day']), fix['work']) for fix in fixed_shifts),
+        "max_half_days": int(max_half_days),
+        "holiday_request_priority": int(holiday_request_priority),
+        "fairness_priority": int(fairness_priority),
+        "work_hour_tolerance": int(work_hour_tolerance),
+        "max_consecutive_days_input": int(max_consecutive_days_input),
+    }
+
+
+def _hash(payload):
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(*args, **options):
+    """create_shift_schedule の引数から、入力の並び順に左右されないキーを作る"""
+    return _hash({
+        "format": CACHE_FORMAT_VERSION,
+        "solver": _solver_version(),
+        **normalize_inputs(*args),
+        "options": options,
+    })
+
+
+def make_input_hash(*args):
+    """入力（位置引数）だけのハッシュ。キャッシュキーと違い、ソルバーの版や計算の設定には左右されない"""
+    return _hash(normalize_inputs(*args))
+
+
+class SolveCache:
+    """サイズ上限付きのディスクLRUキャッシュ"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """キャッシュがあれば値を返し、なければ None を返す"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # 壊れたファイルは捨てて、解き直してもらう
+            self._remove(path)
+            return None
+        # 更新時刻を「最後に使われた時刻」として使う
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """値を書き込み、上限を超えていれば古いものから削除する"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith((".pkl", ".tmp")):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,1064 @@
+"""シフト作成のコアロジック
+
+画面（Streamlit）に依存しない部分をまとめたモジュールです。
+app.py のほか、ベンチマークなど画面を使わないスクリプトからも読み込めます。
+
+読み込みに時間のかかる ortools と pandas は、最初にシフトを作成するときに読み込みます。
+定数や pre_check_constraints だけを使う場合や、画面の初回表示を速くするためです。
+"""
+import calendar
+import datetime
+import functools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import jpholiday
+
+# --- 定数定義 ---
+# アプリケーション全体で共通のルールをスクリプトの先頭で定義します。
+# これにより、設定の変更が容易になり、コードの保守性が向上します。
+WORKS = {"公休": 0, "日勤": 1, "半日": 2, "当直": 3, "明け": 4}
+WORK_SYMBOLS = {"公休": "ヤ", "日勤": "", "半日": "半", "当直": "△", "明け": "▲"}
+WORK_HOURS = {"公休": 0, "日勤": 8, "半日": 4, "当直": 16, "明け": 0}
+
+# 逆引き辞書もここで定義しておくと、コード内で何度も同じ変換処理を書かなくて済みます。
+WORKS_INV_SYMBOLS = {v: WORK_SYMBOLS[k] for k, v in WORKS.items()}
+SYMBOLS_INV_WORKS = {v: k for k, v in WORK_SYMBOLS.items()}
+
+# ソフト制約のうち、画面の優先度スライダーで変えられないものの重み（1人・1回あたり）
+NIKKIN_SHORTAGE_WEIGHT = 150
+CONSECUTIVE_OVER_WEIGHT = 120
+
+# 目的関数の扱い。weighted はペナルティの重み付きの合計、lexicographic は優先順位の高い順に1つずつ最小化する
+OBJECTIVE_MODES = ("weighted", "lexicographic")
+
+# ソルバーの設定プリセット。速さと解の質のどちらを取るかを、運用に合わせて選べるようにします。
+# num_workers=0 はCPUのコア数をすべて使う設定です。
+# interleave_search と max_deterministic_time を使うプリセットは、ワーカー数やマシンの速さに関係なく同じ結果になります。
+SOLVER_PROFILES = {
+    "fast_draft": {
+        "label": "速さ優先（下書き）",
+        "max_time_in_seconds": 10.0,
+        "num_workers": 8,
+        "relative_gap_limit": 0.05,
+        "absolute_gap_limit": 40.0,
+        "random_seed": 0,
+        "interleave_search": False,
+        "max_deterministic_time": None,
+    },
+    "balanced": {
+        "label": "標準",
+        "max_time_in_seconds": 30.0,
+        "num_workers": 0,
+        "relative_gap_limit": 0.0,
+        "absolute_gap_limit": 0.0,
+        "random_seed": 0,
+        "interleave_search": False,
+        "max_deterministic_time": None,
+    },
+    "reproducible": {
+        "label": "再現性重視",
+        "max_time_in_seconds": 120.0,
+        "num_workers": 8,
+        "relative_gap_limit": 0.0,
+        "absolute_gap_limit": 0.0,
+        "random_seed": 0,
+        "interleave_search": True,
+        "max_deterministic_time": 60.0,
+    },
+    "overnight_best": {
+        "label": "品質優先（夜間バッチ）",
+        "max_time_in_seconds": 3600.0,
+        "num_workers": 0,
+        "relative_gap_limit": 0.0,
+        "absolute_gap_limit": 0.0,
+        "random_seed": 0,
+        "interleave_search": False,
+        "max_deterministic_time": None,
+    },
+}
+DEFAULT_SOLVER_PROFILE = "balanced"
+
+# --- 事前チェック機能 ---
+def pre_check_constraints(staff_names, holiday_requests, work_requests, fixed_shifts):
+    """ユーザー入力の矛盾を事前にチェックする"""
+    for name in staff_names:
+        holiday_set = set(holiday_requests.get(name, []))
+        work_set = set(work_requests.get(name, []))
+        if not holiday_set.isdisjoint(work_set):
+            day = holiday_set.intersection(work_set).pop()
+            return f"❌ **{name}さん**の希望休（{day}日）と出勤希望（{day}日）が重複しています。"
+
+    for fix in fixed_shifts:
+        name = fix['staff']
+        day = fix['day']
+        work_symbol = fix['work']
+        display_work = "日勤" if work_symbol == "" else work_symbol
+
+        if day in holiday_requests.get(name, []):
+            return f"❌ **{name}さん**の固定シフト（{day}日：{display_work}）と希望休（{day}日）が重複しています。"
+        
+        work_name = SYMBOLS_INV_WORKS.get(work_symbol)
+        if work_name == "公休" and day in work_requests.get(name, []):
+            return f"❌ **{name}さん**の固定シフト（{day}日：公休）と出勤希望（{day}日）が重複しています。"
+
+    fixed_duty_counts = defaultdict(int)
+    for fix in fixed_shifts:
+        if fix['work'] == WORK_SYMBOLS["当直"]:
+            fixed_duty_counts[fix['day']] += 1
+    
+    for day, count in fixed_duty_counts.items():
+        if count > 1:
+            return f"❌ **{day}日**の当直に{count}人が固定されています。当直は1日1人までです。"
+    
+    return None
+
+# --- 月ごとの規定労働時間 ---
+def monthly_target_hours(month, num_days):
+    """月の規定労働時間（上限）を返す"""
+    if month == 2:
+        return 152
+    elif month == 1:
+        return 160
+    elif num_days == 31:
+        return 168
+    else:
+        return 160
+
+# --- ソルバーの設定 ---
+def apply_solver_profile(solver, profile_name, time_limit=None):
+    """プリセットの設定をソルバーに反映し、実際に使ったパラメータを返す
+
+    time_limit を指定すると、プリセットの制限時間（秒）の代わりに使います。
+    """
+    profile = dict(SOLVER_PROFILES[profile_name])
+    if time_limit is not None:
+        profile["max_time_in_seconds"] = float(time_limit)
+    applied = {}
+    for param, value in profile.items():
+        if param == "label" or value is None:
+            continue
+        setattr(solver.parameters, param, value)
+        applied[param] = value
+    return applied
+
+# --- 計算途中の経過 ---
+class SolveProgress:
+    """別スレッドで動くソルバーの途中経過（暫定解）を画面側に受け渡すためのもの
+
+    ソルバー側は report() で暫定解を追加し、画面側は latest() で最新のものを読みます。
+    draft には、ソルバーを動かす前に貪欲法で作った下書きが入ります。
+    stop() を呼ぶと、その時点の最良解で探索を打ち切ります。
+    with_schedule=False にすると、暫定解にシフト表を入れません（経過時間と目的関数値だけを記録する計測用。
+    暫定解ごとに表を作る時間が、計測する求解の時間に混ざらないようにします）。
+    """
+
+    def __init__(self, with_schedule=True):
+        self._lock = threading.Lock()
+        self._solver = None
+        self.with_schedule = with_schedule
+        self.incumbents = []
+        self.draft = None
+        self.stop_requested = False
+
+    def attach(self, solver):
+        with self._lock:
+            self._solver = solver
+            if self.stop_requested:
+                solver.StopSearch()
+
+    def report(self, incumbent):
+        with self._lock:
+            self.incumbents.append(incumbent)
+
+    def latest(self):
+        with self._lock:
+            return self.incumbents[-1] if self.incumbents else None
+
+    def stop(self):
+        with self._lock:
+            self.stop_requested = True
+            if self._solver is not None:
+                self._solver.StopSearch()
+
+
+@functools.cache
+def _incumbent_callback_class():
+    # ortools を読み込んだあとでないと基底クラスが使えないので、最初に必要になったときにクラスを作る
+    from ortools.sat.python import cp_model
+
+    class IncumbentCallback(cp_model.CpSolverSolutionCallback):
+        """暫定解が見つかるたびに、目的関数値・下界・ギャップ・経過時間とシフト表（with_schedule のとき）を SolveProgress に渡す"""
+
+        def __init__(self, progress, x, staff_names, num_days):
+            super().__init__()
+            self._progress = progress
+            self._x = x
+            self._staff_names = staff_names
+            self._num_days = num_days
+
+        def OnSolutionCallback(self):
+            elapsed = self.WallTime()
+            objective = self.ObjectiveValue()
+            if not self._progress.with_schedule:
+                self._progress.report({'objective': objective, 'elapsed': elapsed})
+                return
+            best_bound = self.BestObjectiveBound()
+            self._progress.report({
+                'objective': objective,
+                'best_bound': best_bound,
+                'gap': abs(objective - best_bound) / max(1.0, abs(objective)),
+                'elapsed': elapsed,
+                'schedule': build_schedule_df(self.BooleanValue, self._x, self._staff_names, self._num_days),
+            })
+
+    return IncumbentCallback
+
+
+def build_schedule_df(boolean_value, x, staff_names, num_days):
+    """解の x 行列から、スタッフ×日の勤務記号の表を作る"""
+    import pandas as pd
+
+    schedule = {}
+    for s_idx, s_name in enumerate(staff_names):
+        schedule[s_name] = [
+            WORKS_INV_SYMBOLS[next(w for w in WORKS.values() if boolean_value(x[(s_idx, d_idx, w)]))]
+            for d_idx in range(num_days)
+        ]
+    return pd.DataFrame(schedule).T
+
+# --- モデル構築の計測 ---
+class BuildProfiler:
+    """モデル構築を制約グループ（フェーズ）ごとに区切り、かかった時間と追加した変数・制約の数を記録する
+
+    start() で新しいフェーズを始めると、直前のフェーズが閉じられます。
+    enabled=False のときは何も記録しないので、計測しない通常の実行ではほとんどコストがかかりません。
+    """
+
+    def __init__(self, model, enabled=True):
+        self.model = model
+        self.enabled = enabled
+        self.phases = []
+        self._current = None
+
+    def _snapshot(self):
+        proto = self.model.Proto()
+        return time.perf_counter(), len(proto.variables), len(proto.constraints)
+
+    def start(self, name):
+        if not self.enabled:
+            return
+        self.finish()
+        self._current = (name, self._snapshot())
+
+    def finish(self):
+        if not self.enabled or self._current is None:
+            return
+        name, (started_at, num_variables, num_constraints) = self._current
+        ended_at, end_variables, end_constraints = self._snapshot()
+        self.phases.append({
+            'phase': name,
+            'time': ended_at - started_at,
+            'variables': end_variables - num_variables,
+            'constraints': end_constraints - num_constraints,
+        })
+        self._current = None
+
+
+def solver_statistics(solver):
+    """ソルバーの応答から、前処理（presolve）後のモデルの大きさと探索の統計を取り出す"""
+    response = solver.ResponseProto()
+    return {
+        'presolved_booleans': response.num_booleans,
+        'presolved_integers': response.num_integers,
+        'fixed_booleans': response.num_fixed_booleans,
+        'conflicts': response.num_conflicts,
+        'branches': response.num_branches,
+        'binary_propagations': response.num_binary_propagations,
+        'integer_propagations': response.num_integer_propagations,
+        'restarts': response.num_restarts,
+        'lp_iterations': response.num_lp_iterations,
+        'wall_time': response.wall_time,
+        'user_time': response.user_time,
+        'deterministic_time': response.deterministic_time,
+    }
+
+# --- 勤務の連続性ルール ---
+def build_sequence_transitions(max_consecutive_days):
+    """C2（当直→明け→公休）とC3（最大連勤日数）を表すオートマトンの遷移表を作る
+
+    状態は (連勤日数, 直前の勤務) を 連勤日数 * 3 + 直前の勤務 に詰めたもの。
+    直前の勤務は 0: その他, 1: 当直, 2: 明け。
+    ラベルは 勤務ID + 連勤超過フラグ * len(WORKS) で、連勤日数がすでに上限に達している日に
+    出勤する場合だけ超過フラグ付きのラベルで遷移できます。
+    """
+    transitions = []
+    for run in range(max_consecutive_days + 1):
+        for prev in range(3):
+            state = run * 3 + prev
+            for work_name, work_id in WORKS.items():
+                if prev == 1 and work_name != "明け":
+                    continue
+                if prev == 2 and work_name != "公休":
+                    continue
+                next_prev = {"当直": 1, "明け": 2}.get(work_name, 0)
+                if work_name == "公休":
+                    transitions.append((state, work_id, next_prev))
+                elif run < max_consecutive_days:
+                    transitions.append((state, work_id, (run + 1) * 3 + next_prev))
+                else:
+                    transitions.append((state, work_id + len(WORKS), run * 3 + next_prev))
+    return transitions
+
+# --- 月をまたぐ引き継ぎ ---
+def carry_over_state(previous_row):
+    """前月の勤務記号の並びから、(月末の勤務名, 月末まで続いている連勤日数) を返す"""
+    work_names = [SYMBOLS_INV_WORKS.get(symbol) for symbol in previous_row]
+    run = 0
+    for work_name in reversed(work_names):
+        if work_name is None or work_name == "公休":
+            break
+        run += 1
+    return (work_names[-1] if work_names else None), run
+
+
+def carry_over_fixed_shifts(carry_over, staff_names):
+    """前月末が当直・明けのスタッフについて、月初めに続く明け・公休を固定シフトの形で返す"""
+    fixed_shifts = []
+    for s_name in staff_names:
+        last_work, _ = carry_over_state(carry_over.get(s_name, []))
+        if last_work == "当直":
+            fixed_shifts.append({'staff': s_name, 'day': 1, 'work': WORK_SYMBOLS["明け"]})
+            fixed_shifts.append({'staff': s_name, 'day': 2, 'work': WORK_SYMBOLS["公休"]})
+        elif last_work == "明け":
+            fixed_shifts.append({'staff': s_name, 'day': 1, 'work': WORK_SYMBOLS["公休"]})
+    return fixed_shifts
+
+# --- シフト作成のコアロジック ---
+def _negated(literal):
+    """リテラルの否定（勤務が決まっているマスの定数にも使える）"""
+    return not literal if isinstance(literal, bool) else literal.Not()
+
+
+class ShiftModel:
+    """build_shift_model が組み立てたモデルと、解を読み取るのに必要なものをまとめたもの"""
+
+    def __init__(self, model, x, staff_names, num_days, missed_requests_log, guards, profiler, build_time, duty_difference=None, changed_cells=(), objective=0):
+        self.model = model
+        self.x = x
+        self.staff_names = staff_names
+        self.num_days = num_days
+        self.missed_requests_log = missed_requests_log
+        self.guards = guards
+        self.profiler = profiler
+        self.build_time = build_time
+        self.duty_difference = duty_difference
+        self.changed_cells = list(changed_cells)
+        self.objective = objective
+        # model_template のときだけ使う、変数のあるマスの (スタッフ, 日, 勤務, 変数の番号) の配列
+        self.variable_cells = None
+
+
+def build_shift_model(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input, sequence_encoding="window", previous_schedule=None, stability_priority=0, hint_schedule=None, carry_over=None, nikkin_shortage_weight=NIKKIN_SHORTAGE_WEIGHT, consecutive_over_weight=CONSECUTIVE_OVER_WEIGHT, profile_build=False, guard_hard_constraints=False, reduce_domains=True, break_symmetry=True, use_template=True):
+    """シフト作成のCP-SATモデルを組み立てる
+
+    previous_schedule がなく hint_schedule（貪欲法の下書きなど）があれば、それをヒントにします。
+    carry_over は {スタッフ名: 前月の勤務記号のリスト} で、月末から続いている連勤を月初めの連勤上限に数えます。
+    月末の当直・明けに続く勤務は、carry_over_fixed_shifts で固定シフトにして fixed_shifts に含めてください。
+    nikkin_shortage_weight・consecutive_over_weight は、日勤の不足1人・連勤超過1回あたりのペナルティです。
+    break_symmetry=True のときは、希望も固定シフトもない（入れ替えても同じ）スタッフの最初の当直の日に順序をつけ、
+    並べ替えただけの解をソルバーが何度も探さないようにします。
+    reduce_domains=True のときは、固定シフトなどから勤務が決まるマスには変数を作らず、
+    x には True / False の定数を入れます（CP-SATの制約はリテラルの代わりに定数も受け付けます）。
+    guard_hard_constraints=True のときは、ハード制約をまとまりごとに仮定リテラルで囲み、
+    (リテラル, 説明) の組を guards に入れます。条件が矛盾しているときに、どの制約同士がぶつかっているかを調べるためのものです。
+    use_template=True のときは、希望や固定シフトによらない部分（C1〜C3・C5・S2）を model_template で
+    スタッフ数・月・ルールごとに一度だけ組み立てておき、その複製に固定シフトと希望・ヒントだけを足します
+    （前月からの引き継ぎがあるときと、guard_hard_constraints=True のときは使いません）。
+    月が不正（1-12以外）なら calendar.IllegalMonthError を送出します。
+    """
+    build_started_at = time.perf_counter()
+    carry_over = carry_over or {}
+    if use_template and reduce_domains and not guard_hard_constraints and not carry_over:
+        shift_model = _instantiate_template(
+            year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance,
+            max_consecutive_days_input, sequence_encoding, profile_build)
+    else:
+        # 矛盾の説明では固定シフトなどを仮定リテラルで外せる必要があるので、マスの絞り込みは行わない
+        domains = None
+        if reduce_domains and not guard_hard_constraints:
+            from raypyon.screening import cell_domains
+            domains = cell_domains(year, month, staff_names, fixed_shifts).tolist()
+        shift_model = _build_structure(
+            year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance,
+            max_consecutive_days_input, sequence_encoding, carry_over, domains, guard_hard_constraints, profile_build)
+    _add_request_layers(
+        shift_model, holiday_requests, work_requests, fixed_shifts, holiday_request_priority, fairness_priority,
+        nikkin_shortage_weight, consecutive_over_weight, max_consecutive_days_input, carry_over,
+        previous_schedule, stability_priority, hint_schedule, break_symmetry)
+    shift_model.profiler.finish()
+    shift_model.build_time = time.perf_counter() - build_started_at
+    return shift_model
+
+
+def _build_structure(year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance, max_consecutive_days_input, sequence_encoding, carry_over, domains, guard_hard_constraints, profile_build):
+    """希望によらない制約（C1〜C5・S2）だけのモデルを組み立てる（domains は cell_domains の結果か None）"""
+    staff_count = len(staff_names)
+    num_days = calendar.monthrange(year, month)[1]
+
+    target_hours = monthly_target_hours(month, num_days)
+
+    dates = [datetime.date(year, month, d) for d in range(1, num_days + 1)]
+    holidays_jp = [d[0].day for d in jpholiday.month_holidays(year, month)]
+
+    from ortools.sat.python import cp_model
+
+    model = cp_model.CpModel()
+    profiler = BuildProfiler(model, enabled=profile_build)
+
+    guards = []
+    def guard(message):
+        # 仮定リテラルを使わないときは空のリストを返すので、OnlyEnforceIf に渡しても何も変わらない
+        if not guard_hard_constraints:
+            return []
+        literal = model.NewBoolVar(f"guard_{len(guards)}")
+        guards.append((literal, message))
+        return [literal]
+    
+    profiler.start("x")
+    # x[(s, d, w)]: スタッフsがd日目に勤務wであれば1となるBool変数。
+    # 各制約グループはこの共通の行列を参照し、「d日目が当直か」などの判定用変数を都度作り直さないようにします。
+    x = {}
+    for s_idx in range(staff_count):
+        for d_idx in range(num_days):
+            allowed = domains[s_idx][d_idx] if domains is not None else [True] * len(WORKS)
+            if sum(allowed) == 1:
+                # 勤務が決まっているマスは定数にする
+                for work_id in WORKS.values():
+                    x[(s_idx, d_idx, work_id)] = allowed[work_id]
+                continue
+            for work_id in WORKS.values():
+                x[(s_idx, d_idx, work_id)] = model.NewBoolVar(f"x_s{s_idx}_d{d_idx}_w{work_id}") if allowed[work_id] else False
+            # 1マスにつき勤務はちょうど1つ（取りうる勤務がないマスでは、ここで矛盾になる）
+            model.AddExactlyOne(x[(s_idx, d_idx, work_id)] for work_id in WORKS.values())
+
+    # --- 制約ペナルティ管理 ---
+    # ペナルティの重みは _add_request_layers で目的関数を作るときにかける
+    missed_requests_log = []
+
+    # --- ハード制約 & 一部ソフト制約 ---
+    # C1: 日ごとの必要人数と勤務の割り当て
+    profiler.start("C1")
+    duty_guard = guard("当直は毎日ちょうど1人")
+    for d_idx, date in enumerate(dates):
+        model.Add(sum(x[(s_idx, d_idx, WORKS["当直"])] for s_idx in range(staff_count)) == 1).OnlyEnforceIf(duty_guard)
+        
+        is_holiday_or_sunday = (date.weekday() == 6) or (date.day in holidays_jp)
+        if is_holiday_or_sunday:
+            allowed_shifts = [WORKS["当直"], WORKS["明け"], WORKS["公休"]]
+            holiday_guard = guard(f"**{d_idx + 1}日**は日曜・祝日のため、当直・明け・公休のみ")
+            for s_idx in range(staff_count):
+                for work_id in WORKS.values():
+                    if work_id not in allowed_shifts and not isinstance(x[(s_idx, d_idx, work_id)], bool):
+                        model.Add(x[(s_idx, d_idx, work_id)] == 0).OnlyEnforceIf(holiday_guard)
+        else:
+            required_nikkin = nikkin_requirements[date.weekday()]
+            if required_nikkin > 0:
+                is_on_nikkin = [x[(s_idx, d_idx, WORKS["日勤"])] for s_idx in range(staff_count)]
+                
+                # ソフト制約化: 日勤不足数
+                shortage_nikkin = model.NewIntVar(0, required_nikkin, f'shortage_nikkin_d{d_idx}')
+                model.Add(sum(is_on_nikkin) + shortage_nikkin >= required_nikkin)
+                missed_requests_log.append({'type': '日勤人数不足', 'var': shortage_nikkin, 'staff': '全体', 'day': d_idx + 1})
+
+    if sequence_encoding == "automaton":
+        # C2 & C3: 勤務の連続性（当直→明け→公休）と最大連勤日数をスタッフごとに1つのオートマトンで表現します。
+        profiler.start("C2/C3")
+        # 各日のラベルは「勤務ID + 連勤超過フラグ × 勤務の種類数」で、超過フラグが立った日数がそのままペナルティになります。
+        # 制約の数が最大連勤日数に依存しないので、連勤上限を大きくしたり期間を長くしたりする場合に向いています。
+        transitions = build_sequence_transitions(max_consecutive_days_input)
+        final_states = list(range(3 * (max_consecutive_days_input + 1)))
+        for s_idx in range(staff_count):
+            # 前月から引き継いだ連勤日数と月末の勤務から、オートマトンの最初の状態を決める
+            last_work, initial_run = carry_over_state(carry_over.get(staff_names[s_idx], []))
+            initial_run = min(initial_run, max_consecutive_days_input)
+            initial_state = initial_run * 3 + {"当直": 1, "明け": 2}.get(last_work, 0)
+            labels = []
+            for d_idx in range(num_days):
+                consecutive_over = model.NewBoolVar(f's{s_idx}_d{d_idx}_consecutive_over')
+                label = model.NewIntVar(0, 2 * len(WORKS) - 1, f's{s_idx}_d{d_idx}_seq_label')
+                model.Add(label == sum(work_id * x[(s_idx, d_idx, work_id)] for work_id in WORKS.values()) + len(WORKS) * consecutive_over)
+                labels.append(label)
+                
+                if d_idx >= max_consecutive_days_input - initial_run:
+                    missed_requests_log.append({'type': '連勤超過', 'var': consecutive_over, 'staff': staff_names[s_idx], 'day': d_idx + 1})
+            model.AddAutomaton(labels, initial_state, final_states, transitions)
+    else:
+        # C2: 勤務の連続性に関するルール
+        profiler.start("C2")
+        for s_idx in range(staff_count):
+            sequence_guard = guard(f"**{staff_names[s_idx]}さん**の当直→明け→公休の並び")
+            for d_idx in range(num_days - 1):
+                for before, after in (("当直", "明け"), ("明け", "公休")):
+                    premise, conclusion = x[(s_idx, d_idx, WORKS[before])], x[(s_idx, d_idx + 1, WORKS[after])]
+                    # 勤務が決まっているマスどうしで、常に成り立つものは追加しない
+                    if premise is False or conclusion is True:
+                        continue
+                    model.AddImplication(premise, conclusion).OnlyEnforceIf(sequence_guard)
+
+        # C3: 最大連勤日数の制限（ソフト制約に変更）
+        profiler.start("C3")
+        for s_idx in range(staff_count):
+            windows = [range(d_idx, d_idx + max_consecutive_days_input + 1) for d_idx in range(num_days - max_consecutive_days_input)]
+            # 前月末から続いている連勤があれば、月初めの短い期間にも公休が必要
+            _, initial_run = carry_over_state(carry_over.get(staff_names[s_idx], []))
+            if initial_run > 0:
+                windows.insert(0, range(0, max_consecutive_days_input + 1 - min(initial_run, max_consecutive_days_input)))
+            for window_idx, window in enumerate(windows):
+                is_off_in_window = [x[(s_idx, day_index, WORKS["公休"])] for day_index in window]
+                if any(is_off is True for is_off in is_off_in_window):
+                    continue  # 公休が決まっている期間は超過しない
+                is_off_in_window = [is_off for is_off in is_off_in_window if is_off is not False]
+            
+                # 期間中に休みが1日もない場合(sum==0)、連勤超過フラグを立てる
+                consecutive_over = model.NewBoolVar(f's{s_idx}_w{window_idx}_consecutive_over')
+                model.AddBoolOr(is_off_in_window + [consecutive_over])
+                for is_off in is_off_in_window:
+                    model.AddImplication(is_off, consecutive_over.Not())
+                missed_requests_log.append({'type': '連勤超過', 'var': consecutive_over, 'staff': staff_names[s_idx], 'day': window[-1] + 1})
+
+    # C4: 固定シフトの反映
+    profiler.start("C4")
+    for fix in fixed_shifts:
+        s_name = fix['staff']
+        if s_name in staff_names:
+            s_idx = staff_names.index(s_name)
+            d_idx = fix['day'] - 1
+            work_name = SYMBOLS_INV_WORKS.get(fix['work'])
+            if work_name:
+                work_id = WORKS.get(work_name)
+                if work_id is not None and not isinstance(x[(s_idx, d_idx, work_id)], bool):
+                    model.Add(x[(s_idx, d_idx, work_id)] == 1).OnlyEnforceIf(
+                        guard(f"**{s_name}さん**の{fix['day']}日の固定シフト（{work_name}）"))
+    
+    # C5: 半日勤務の上限回数など
+    profiler.start("C5")
+    for s_idx, s_name in enumerate(staff_names):
+        model.Add(sum(x[(s_idx, d_idx, WORKS["半日"])] for d_idx in range(num_days)) <= max_half_days).OnlyEnforceIf(
+            guard(f"**{s_name}さん**の半日勤務は{max_half_days}回まで"))
+        model.AddLinearConstraint(sum(x[(s_idx, d_idx, WORKS["公休"])] for d_idx in range(num_days)), 8, 10).OnlyEnforceIf(
+            guard(f"**{s_name}さん**の公休は月8〜10日"))
+
+        total_hours_per_staff = sum(
+            WORK_HOURS[name] * x[(s_idx, d_idx, work_id)]
+            for d_idx in range(num_days)
+            for name, work_id in WORKS.items()
+            if WORK_HOURS[name] > 0
+        )
+        
+        # 規定時間をオーバーすることは絶対に禁止（上限をハードに固定）
+        # ただし不足分（有給で補う分）は許容範囲として設定可能
+        model.AddLinearConstraint(total_hours_per_staff, target_hours - work_hour_tolerance, target_hours).OnlyEnforceIf(
+            guard(f"**{s_name}さん**の総労働時間は{target_hours - work_hour_tolerance}〜{target_hours}時間"))
+
+    # S2: 当直回数の公平化
+    profiler.start("S2")
+    duty_counts = [model.NewIntVar(0, num_days, f"duty_{s_idx}") for s_idx in range(staff_count)]
+    for s_idx in range(staff_count):
+        model.Add(duty_counts[s_idx] == sum(x[(s_idx, d_idx, WORKS["当直"])] for d_idx in range(num_days)))
+    
+    min_duty, max_duty = model.NewIntVar(0, num_days, 'min_d'), model.NewIntVar(0, num_days, 'max_d')
+    model.AddMinEquality(min_duty, duty_counts)
+    model.AddMaxEquality(max_duty, duty_counts)
+    model.Add(max_duty <= 10).OnlyEnforceIf(guard("当直は1人あたり月10回まで"))
+    duty_difference = model.NewIntVar(0, 10, 'duty_diff')
+    model.Add(duty_difference == max_duty - min_duty)
+    profiler.finish()
+
+    return ShiftModel(model, x, staff_names, num_days, missed_requests_log, guards, profiler, 0.0, duty_difference)
+
+
+# 希望・固定シフトによらない部分のモデル（model_template）を、条件ごとにいくつまで残しておくか
+MODEL_TEMPLATE_CACHE_SIZE = 16
+_model_templates = OrderedDict()
+_model_templates_lock = threading.Lock()
+
+
+def model_template(year, month, staff_count, nikkin_requirements, max_half_days, work_hour_tolerance, max_consecutive_days_input, sequence_encoding="window"):
+    """希望・固定シフトによらない部分（C1〜C3・C5・S2）だけのモデルを、条件ごとに一度だけ組み立てて返す
+
+    返すものは共有されるので、変更せずに model.Clone() した複製を使ってください。
+    staff_names・ログの staff には、スタッフ名の代わりに番号が入っています。
+    """
+    key = (year, month, staff_count, tuple(nikkin_requirements), max_half_days, work_hour_tolerance, max_consecutive_days_input, sequence_encoding)
+    with _model_templates_lock:
+        template = _model_templates.get(key)
+        if template is not None:
+            _model_templates.move_to_end(key)
+            return template
+
+    import numpy as np
+    from raypyon.screening import cell_domains
+
+    staff_indexes = list(range(staff_count))
+    # 日曜・祝日の日勤・半日だけを除いておく（固定シフトは複製に反映する）
+    domains = cell_domains(year, month, staff_indexes, []).tolist()
+    # 複製の診断情報にも C1〜C3・C5・S2 の内訳を出せるよう、ひな形は常に計測しながら組み立てる（一度だけなので軽い）
+    template = _build_structure(
+        year, month, staff_indexes, nikkin_requirements, [], max_half_days, work_hour_tolerance,
+        max_consecutive_days_input, sequence_encoding, {}, domains, False, True)
+    # 複製ごとに変数の範囲を狭めるときに使う。共有する前に作っておき、共有したあとは読むだけにする
+    template.variable_cells = np.array([
+        (s_idx, d_idx, work_id, literal.Index())
+        for (s_idx, d_idx, work_id), literal in template.x.items() if not isinstance(literal, bool)
+    ]).reshape(-1, 4)
+    with _model_templates_lock:
+        _model_templates[key] = template
+        while len(_model_templates) > MODEL_TEMPLATE_CACHE_SIZE:
+            _model_templates.popitem(last=False)
+    return template
+
+
+def _instantiate_template(year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance, max_consecutive_days_input, sequence_encoding, profile_build):
+    """model_template を複製し、固定シフトとそこから決まるマスを変数の範囲として反映する
+
+    profile_build=True のときは、ひな形を組み立てたときのフェーズを 'cached': True をつけて先頭に入れます
+    （時間はひな形を最初に組み立てたときのもので、今回の構築時間には含まれません）。
+    """
+    from raypyon.screening import cell_domains
+
+    template = model_template(year, month, len(staff_names), nikkin_requirements, max_half_days, work_hour_tolerance,
+                              max_consecutive_days_input, sequence_encoding)
+    model = template.model.Clone()
+    profiler = BuildProfiler(model, enabled=profile_build)
+    if profile_build:
+        profiler.phases = [{**phase, 'cached': True} for phase in template.profiler.phases]
+    profiler.start("C4")
+    # 変数は作り直さず範囲だけを狭めるので、前処理（presolve）で定数として取り除かれる
+    domains = cell_domains(year, month, staff_names, fixed_shifts)
+    s_idx, d_idx, work_id, index = template.variable_cells.T
+    values = domains[s_idx, d_idx, work_id]
+    to_fix = ~values | (domains.sum(axis=2) == 1)[s_idx, d_idx]
+    proto_variables = model.Proto().variables
+    for variable_index, value in zip(index[to_fix].tolist(), values[to_fix].tolist()):
+        domain = proto_variables[variable_index].domain
+        domain[0] = domain[1] = int(value)
+
+    missed_requests_log = [
+        {**log, 'staff': staff_names[log['staff']]} if log['type'] == '連勤超過' else dict(log)
+        for log in template.missed_requests_log
+    ]
+    return ShiftModel(model, template.x, staff_names, template.num_days, missed_requests_log, [], profiler, 0.0, template.duty_difference)
+
+
+def _add_request_layers(shift_model, holiday_requests, work_requests, fixed_shifts, holiday_request_priority, fairness_priority, nikkin_shortage_weight, consecutive_over_weight, max_consecutive_days_input, carry_over, previous_schedule, stability_priority, hint_schedule, break_symmetry):
+    """組み立て済みの構造に、希望（S1）・対称性の除去・ヒントと目的関数を加える"""
+    model, x, profiler = shift_model.model, shift_model.x, shift_model.profiler
+    staff_names, num_days = shift_model.staff_names, shift_model.num_days
+    missed_requests_log = shift_model.missed_requests_log
+
+    # --- ソフト制約 (ペナルティを最小化するルール) ---
+    weights = {'日勤人数不足': nikkin_shortage_weight, '連勤超過': consecutive_over_weight}
+    all_penalty_terms = [log['var'] * weights[log['type']] for log in missed_requests_log]
+    all_penalty_terms.append(shift_model.duty_difference * fairness_priority)
+
+    # S1: スタッフの希望をソフト制約として反映
+    profiler.start("S1")
+    # 公休のBool変数をそのままペナルティとして使うため、新しい変数は作りません。
+    for s_idx, s_name in enumerate(staff_names):
+        for day_off in holiday_requests.get(s_name, []):
+            if 1 <= day_off <= num_days:
+                penalty_var = _negated(x[(s_idx, day_off - 1, WORKS["公休"])])
+                all_penalty_terms.append(penalty_var * holiday_request_priority)
+                missed_requests_log.append({'type': '希望休', 'var': penalty_var, 'staff': s_name, 'day': day_off})
+
+        for day_on in work_requests.get(s_name, []):
+            if 1 <= day_on <= num_days:
+                penalty_var = x[(s_idx, day_on - 1, WORKS["公休"])]
+                all_penalty_terms.append(penalty_var * holiday_request_priority)
+                missed_requests_log.append({'type': '出勤希望', 'var': penalty_var, 'staff': s_name, 'day': day_on})
+    
+    # --- 対称性の除去 ---
+    profiler.start("symmetry")
+    # 希望休・出勤希望・固定シフトのないスタッフどうしは、行を入れ替えても目的関数値が変わりません。
+    # 最初の当直の日が名簿順に早い順になるよう制約し、入れ替えただけの解を探索から除きます。
+    # 当直は1日1人なので、当直のない人どうしを除けば順序は一通りに決まります
+    # （当直回数の順序だけでは同じ回数の人が多く、ほとんど絞り込めませんでした）。
+    # 前回との差にペナルティをつけるときは、前回のシフトでスタッフが区別されるので行いません。
+    # 前月から引き継いだ連勤日数が違う人どうしも区別されるので、同じ人どうしでだけ順序をつけます。
+    interchangeable, groups = [], {}
+    if break_symmetry and not (stability_priority > 0 and previous_schedule is not None):
+        fixed_names = {fix['staff'] for fix in fixed_shifts}
+        interchangeable = [
+            s_idx for s_idx, s_name in enumerate(staff_names)
+            if not holiday_requests.get(s_name) and not work_requests.get(s_name) and s_name not in fixed_names
+        ]
+        for s_idx in interchangeable:
+            _, initial_run = carry_over_state(carry_over.get(staff_names[s_idx], []))
+            groups.setdefault(min(initial_run, max_consecutive_days_input), []).append(s_idx)
+        for group in groups.values():
+            for s_idx, next_s_idx in zip(group, group[1:]):
+                # 次の人がd日目に当直なら、この人はd日目までに当直をしている（最初の当直の日を整数変数にするより軽い）
+                for d_idx in range(num_days):
+                    model.AddBoolOr([x[(s_idx, day_index, WORKS["当直"])] for day_index in range(d_idx + 1)]
+                                    + [_negated(x[(next_s_idx, d_idx, WORKS["当直"])])])
+
+    # --- 前回のシフトからの再計算 ---
+    profiler.start("hint")
+    # 前回の結果（なければ下書き）をヒントとして渡し、探索をそこから始めます。
+    # stability_priority が正なら、前回と違う勤務になったマスごとにペナルティを加えて変更を最小限にします。
+    hint_source = previous_schedule if previous_schedule is not None else hint_schedule
+    changed_cells = []
+    if hint_source is not None:
+        hint_rows = {
+            s_idx: list(hint_source.loc[s_name]) for s_idx, s_name in enumerate(staff_names)
+            if s_name in hint_source.index and len(hint_source.loc[s_name]) == num_days
+        }
+        # 入れ替えられるスタッフのヒントは、上の順序を満たすように最初の当直が早い行から順に割り当て直す
+        for group in groups.values():
+            rows_to_permute = [s_idx for s_idx in group if s_idx in hint_rows]
+            sorted_rows = sorted((hint_rows[s_idx] for s_idx in rows_to_permute), key=lambda row: row.index(WORK_SYMBOLS["当直"]) if WORK_SYMBOLS["当直"] in row else num_days)
+            hint_rows.update(zip(rows_to_permute, sorted_rows))
+
+        for s_idx, previous_row in hint_rows.items():
+            for d_idx, symbol in enumerate(previous_row):
+                previous_work_id = WORKS.get(SYMBOLS_INV_WORKS.get(symbol))
+                if previous_work_id is None:
+                    continue
+                for work_id in WORKS.values():
+                    if not isinstance(x[(s_idx, d_idx, work_id)], bool):
+                        model.AddHint(x[(s_idx, d_idx, work_id)], work_id == previous_work_id)
+                if stability_priority > 0 and previous_schedule is not None:
+                    changed_cells.append(_negated(x[(s_idx, d_idx, previous_work_id)]))
+                    all_penalty_terms.append(changed_cells[-1] * stability_priority)
+
+    # --- 最適化目標 ---
+    profiler.start("objective")
+    shift_model.changed_cells = changed_cells
+    shift_model.objective = sum(all_penalty_terms)
+    model.Minimize(shift_model.objective)
+
+
+def find_conflicting_constraints(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input, time_limit=10.0):
+    """ハード制約のうち、同時には満たせない組み合わせを探して説明文のリストで返す
+
+    ハード制約を仮定リテラルで囲んだモデルを目的関数なしで解き、矛盾しているときは
+    ソルバーが返した仮定の集合から1つずつ外して解き直して、それ以上減らせない組み合わせにします。
+    オートマトン（AddAutomaton）には仮定リテラルをつけられず、C2 が矛盾の原因に出てこなくなるので、
+    元の計算の sequence_encoding によらず、いつも window で組み立てます（目的関数がないので速さの差も小さい）。
+    条件が矛盾していなければ空のリスト、制限時間内に判断できなければ None を返します。
+    """
+    from ortools.sat.python import cp_model
+
+    shift_model = build_shift_model(
+        year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days,
+        holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input,
+        sequence_encoding="window", guard_hard_constraints=True,
+    )
+    model = shift_model.model
+    model.ClearObjective()
+    deadline = time.perf_counter() + time_limit
+
+    def solve_with(guards, step_limit=None):
+        model.ClearAssumptions()
+        model.AddAssumptions([literal for literal, _ in guards])
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = max(0.1, min(step_limit or time_limit, deadline - time.perf_counter()))
+        status = solver.Solve(model)
+        if status != cp_model.INFEASIBLE:
+            return status, None
+        core = set(solver.SufficientAssumptionsForInfeasibility())
+        return status, [g for g in guards if g[0].Index() in core]
+
+    status, conflict = solve_with(shift_model.guards)
+    if status != cp_model.INFEASIBLE:
+        return [] if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None
+
+    # 1つ外しても矛盾したままなら、その制約は原因ではないので外す
+    # （1回あたりの時間は短く区切り、時間内に矛盾と分からなければ外さずに残す）
+    i = 0
+    while i < len(conflict) and time.perf_counter() < deadline:
+        status, smaller = solve_with(conflict[:i] + conflict[i + 1:], step_limit=1.0)
+        if status == cp_model.INFEASIBLE:
+            conflict = smaller
+        else:
+            i += 1
+    return [message for _, message in conflict]
+
+
+def unfulfilled_request_messages(value, missed_requests_log):
+    """missed_requests_log のうち、解で叶わなかったものを説明文のリストにする（value は変数の値を返す関数）"""
+    unfulfilled_requests = []
+    for log in missed_requests_log:
+        val = value(log['var'])
+        if val > 0:
+            if log['type'] == '日勤人数不足':
+                unfulfilled_requests.append(f"**{log['day']}日**の**日勤人数**が {val} 人不足しています。")
+            elif log['type'] == '連勤超過':
+                unfulfilled_requests.append(f"**{log['staff']}さん**が**{log['day']}日頃**に連勤上限を超過しています。")
+            else:
+                unfulfilled_requests.append(f"**{log['staff']}さん**の**{log['day']}日**の**{log['type']}**")
+    return unfulfilled_requests
+
+
+def objective_breakdown(value, shift_model):
+    """目的関数値の内訳（叶わなかった希望の数・日勤の不足人数・連勤超過の数・当直回数の差）を返す"""
+    totals = {'希望休': 0, '出勤希望': 0, '日勤人数不足': 0, '連勤超過': 0}
+    for log in shift_model.missed_requests_log:
+        totals[log['type']] += value(log['var'])
+    return {
+        'missed_requests': totals['希望休'] + totals['出勤希望'],
+        'nikkin_shortage': totals['日勤人数不足'],
+        'consecutive_over': totals['連勤超過'],
+        'duty_difference': value(shift_model.duty_difference),
+    }
+
+
+def draft_unfulfilled_requests(schedule_df, holiday_requests, work_requests):
+    """シフト表で叶っていない希望休・出勤希望を、create_shift_schedule と同じ形式の文で返す"""
+    messages = []
+    for s_name, row in schedule_df.iterrows():
+        row = list(row)
+        for day in holiday_requests.get(s_name, []):
+            if 1 <= day <= len(row) and row[day - 1] != WORK_SYMBOLS["公休"]:
+                messages.append(f"**{s_name}さん**の**{day}日**の**希望休**")
+        for day in work_requests.get(s_name, []):
+            if 1 <= day <= len(row) and row[day - 1] == WORK_SYMBOLS["公休"]:
+                messages.append(f"**{s_name}さん**の**{day}日**の**出勤希望**")
+    return messages
+
+
+def lexicographic_stages(shift_model):
+    """優先順位の高い順に、(段階の名前, 最小化する式) のリストを返す（定数になる段階は除く）"""
+    terms = {'日勤人数不足': [], '連勤超過': [], '希望': []}
+    for log in shift_model.missed_requests_log:
+        terms['希望' if log['type'] in ('希望休', '出勤希望') else log['type']].append(log['var'])
+    stages = [(name, sum(stage_terms)) for name, stage_terms in terms.items()]
+    stages.append(('当直回数の差', shift_model.duty_difference))
+    stages.append(('前回との差', sum(shift_model.changed_cells)))
+    return [(name, expression) for name, expression in stages if not isinstance(expression, int)]
+
+
+def solve_stages(model, stages, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, progress=None, make_callback=None, params=None):
+    """(段階の名前, 最小化する式) のリスト stages の順に1段階ずつ最小化し、(最後に解けたソルバー, 状態, 段階ごとの結果, ソルバーの設定) を返す
+
+    各段階で見つけた値を制約として固定し、その解をヒントにして次の段階を解きます。
+    制限時間は残りの段階で等分し、早く終わった分は次の段階に回します。
+    段階ごとの結果の solver_parameters には、その段階で実際に使った設定（制限時間はその段階の持ち時間）が入り、
+    返すソルバーの設定の max_time_in_seconds は全段階を合わせた制限時間です。
+    途中の段階で時間切れ・打ち切りになったときは、そこまでの解を返します（状態は FEASIBLE）。
+    make_callback は段階ごとに解の callback を作る関数、params は計算プロファイルの上に重ねるソルバーのパラメータです。
+    """
+    from ortools.sat.python import cp_model
+    from raypyon.telemetry import SearchLog, search_timeline
+
+    if time_limit is None:
+        time_limit = SOLVER_PROFILES[solver_profile]["max_time_in_seconds"]
+    started_at = time.perf_counter()
+    best_solver, overall_status, stage_results = None, cp_model.OPTIMAL, []
+    solver_parameters = None
+    for index, (name, expression) in enumerate(stages):
+        remaining = time_limit - (time.perf_counter() - started_at)
+        if best_solver is not None and (remaining <= 0.1 or (progress is not None and progress.stop_requested)):
+            overall_status = cp_model.FEASIBLE
+            break
+        model.Minimize(expression)
+        solver = cp_model.CpSolver()
+        stage_parameters = apply_solver_profile(solver, solver_profile, max(0.1, remaining) / (len(stages) - index))
+        for param_name, value in (params or {}).items():
+            setattr(solver.parameters, param_name, value)
+            stage_parameters[param_name] = value
+        if solver_parameters is None:
+            solver_parameters = {**stage_parameters, 'max_time_in_seconds': float(time_limit)}
+        search_log = SearchLog()
+        search_log.attach(solver)
+        if progress is not None:
+            progress.attach(solver)
+        if make_callback is not None:
+            status = solver.Solve(model, make_callback())
+        else:
+            status = solver.Solve(model)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            if best_solver is None:
+                return solver, status, stage_results, solver_parameters
+            overall_status = cp_model.FEASIBLE
+            break
+
+        value = round(solver.ObjectiveValue())
+        stage_results.append({
+            'stage': name, 'value': value, 'status': solver.StatusName(status), 'wall_time': solver.WallTime(),
+            'solver_parameters': stage_parameters, 'search_timeline': search_timeline(search_log, solver),
+        })
+        if status != cp_model.OPTIMAL:
+            overall_status = cp_model.FEASIBLE
+        best_solver = solver
+        # この段階の値を保ったまま、次の段階を今の解から探し始める。
+        # 補助変数も含めた解をまるごとヒントにするので、次の段階は最初から実行可能解を持って始まる
+        model.Add(expression <= value)
+        model.ClearHints()
+        solution = solver.ResponseProto().solution
+        model.Proto().solution_hint.vars.extend(range(len(solution)))
+        model.Proto().solution_hint.values.extend(solution)
+    return best_solver, overall_status, stage_results, solver_parameters
+
+
+def solve_lexicographic(shift_model, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, progress=None):
+    """lexicographic_stages の順に solve_stages で解く（progress を渡すと、各段階の解を暫定解として知らせる）"""
+    def make_callback():
+        return _incumbent_callback_class()(progress, shift_model.x, shift_model.staff_names, shift_model.num_days)
+
+    return solve_stages(shift_model.model, lexicographic_stages(shift_model), solver_profile, time_limit, progress,
+                        make_callback if progress is not None else None)
+
+
+def create_shift_schedule(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input, sequence_encoding="window", previous_schedule=None, stability_priority=0, solver_profile=DEFAULT_SOLVER_PROFILE, progress=None, profile_build=False, time_limit=None, explain_failure=True, greedy_draft=True, carry_over=None, nikkin_shortage_weight=NIKKIN_SHORTAGE_WEIGHT, consecutive_over_weight=CONSECUTIVE_OVER_WEIGHT, objective_mode="weighted", snapshot_path=None):
+    """シフトを作成し、(シフト表, 状態, 叶わなかった希望, 求解の情報) を返す
+
+    状態は "success"（解が見つかった）、"failed"（解がない・見つからなかった）、
+    "draft"（制限時間内に解が見つからず、貪欲法の下書きを返した）のいずれかです。
+    下書きが満たしていないハード制約は solve_info['draft_violations'] に入ります。
+    carry_over（{スタッフ名: 前月の勤務記号のリスト}）を渡すと、前月末の当直・明けに続く勤務を固定し、
+    前月末からの連勤も連勤上限に数えます。
+    nikkin_shortage_weight・consecutive_over_weight の意味は build_shift_model と同じです。
+    objective_mode="lexicographic" にすると、ペナルティの重み付きの合計ではなく、日勤の不足・連勤超過・
+    叶わなかった希望・当直回数の差（・前回との差）の順に1段階ずつ最小化します（solve_lexicographic）。
+    snapshot_path を渡すと、組み立てたモデルと入力をそのパスに書き出します（raypyon.snapshot）。
+    """
+    from ortools.sat.python import cp_model
+    from raypyon.greedy import build_greedy_schedule
+    from raypyon.screening import screen_inputs
+    from raypyon.telemetry import SearchLog, search_timeline
+
+    snapshot_args = (year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days,
+                     holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input)
+    if carry_over:
+        fixed_shifts = list(fixed_shifts) + carry_over_fixed_shifts(carry_over, staff_names)
+    try:
+        # 解がないことが明らかな入力は、モデルを作る前に弾いてソルバーを呼ばない
+        screening_started_at = time.perf_counter()
+        screening_errors, screening_warnings = screen_inputs(
+            year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance)
+        screening_time = time.perf_counter() - screening_started_at
+        if screening_errors:
+            return None, "failed", [], {
+                'solver_profile': solver_profile,
+                'solver_status': "SCREENED_INFEASIBLE",
+                'screening_time': screening_time,
+                'screening_warnings': screening_warnings,
+                'conflicts': screening_errors,
+                'stopped_early': False,
+            }
+
+        # 貪欲法の下書きをすぐに作り、画面への表示とソルバーのヒントに使う
+        draft_df, draft_violations, draft_time = None, [], 0.0
+        if greedy_draft:
+            draft_started_at = time.perf_counter()
+            draft_df, draft_violations = build_greedy_schedule(
+                year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days,
+                holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input)
+            draft_time = time.perf_counter() - draft_started_at
+            if progress is not None:
+                progress.draft = draft_df
+
+        shift_model = build_shift_model(
+            year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days,
+            holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input,
+            sequence_encoding=sequence_encoding, previous_schedule=previous_schedule, stability_priority=stability_priority,
+            hint_schedule=draft_df, carry_over=carry_over, profile_build=profile_build,
+            nikkin_shortage_weight=nikkin_shortage_weight, consecutive_over_weight=consecutive_over_weight,
+        )
+    except calendar.IllegalMonthError:
+        # 有効な月（1-12）ではない
+        return None, "failed", [], {}
+    model, x, num_days = shift_model.model, shift_model.x, shift_model.num_days
+    model_proto = model.Proto()
+    if snapshot_path is not None:
+        # 解いている途中で止まっても調べられるよう、解く前に書き出す
+        from raypyon.snapshot import write_snapshot
+
+        write_snapshot(snapshot_path, snapshot_args, {
+            'sequence_encoding': sequence_encoding, 'previous_schedule': previous_schedule, 'stability_priority': stability_priority,
+            'solver_profile': solver_profile, 'time_limit': time_limit, 'carry_over': carry_over,
+            'nikkin_shortage_weight': nikkin_shortage_weight, 'consecutive_over_weight': consecutive_over_weight,
+            'objective_mode': objective_mode,
+        }, model, lexicographic_stages(shift_model) if objective_mode == "lexicographic" else None)
+
+    # --- ソルバーの実行 ---
+    solve_started_at = time.perf_counter()
+    stage_results = None
+    if objective_mode == "lexicographic":
+        # 段階ごとにソルバーを作るので、設定と探索のタイムラインは段階ごとの結果に入る
+        solver, status, stage_results, solver_parameters = solve_lexicographic(shift_model, solver_profile, time_limit, progress)
+    else:
+        solver = cp_model.CpSolver()
+        solver_parameters = apply_solver_profile(solver, solver_profile, time_limit)
+        # 探索ログは画面に出さずに集め、前処理・解の更新・ワーカーごとの統計のタイムラインにする
+        search_log = SearchLog()
+        search_log.attach(solver)
+        if progress is not None:
+            progress.attach(solver)
+            status = solver.Solve(model, _incumbent_callback_class()(progress, x, staff_names, num_days))
+        else:
+            status = solver.Solve(model)
+
+    # 結果と一緒に保存し、同じ設定で解き直せるようにする
+    solve_info = {
+        'solver_profile': solver_profile,
+        'solver_parameters': solver_parameters,
+        'objective_mode': objective_mode,
+        'solver_status': solver.StatusName(status),
+        'wall_time': solver.WallTime() if stage_results is None else time.perf_counter() - solve_started_at,
+        'build_time': shift_model.build_time,
+        'num_variables': len(model_proto.variables),
+        'num_constraints': len(model_proto.constraints),
+        'stopped_early': progress is not None and progress.stop_requested,
+        'screening_time': screening_time,
+        'screening_warnings': screening_warnings,
+        'draft_time': draft_time,
+    }
+    if stage_results is None:
+        solve_info['search_timeline'] = search_timeline(search_log, solver)
+    if profile_build:
+        solve_info['build_profile'] = shift_model.profiler.phases
+        solve_info['solver_stats'] = solver_statistics(solver)
+        if stage_results is None:
+            solve_info['solver_log'] = search_log.lines
+    if snapshot_path is not None:
+        solve_info['snapshot_path'] = snapshot_path
+
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        extract_started_at = time.perf_counter()
+        df = build_schedule_df(solver.BooleanValue, x, staff_names, num_days)
+        
+        unfulfilled_requests = unfulfilled_request_messages(solver.Value, shift_model.missed_requests_log)
+        solve_info['objective'] = solver.ObjectiveValue()
+        solve_info['best_bound'] = solver.BestObjectiveBound()
+        if stage_results is not None:
+            # 最後の段階の目的関数ではなく、重み付きの合計で表示する（下界は段階ごとにしかないので同じ値にする）
+            solve_info['objective'] = solve_info['best_bound'] = solver.Value(shift_model.objective)
+            solve_info['lexicographic_stages'] = stage_results
+        solve_info['objective_breakdown'] = objective_breakdown(solver.Value, shift_model)
+        if profile_build:
+            solve_info['extract_time'] = time.perf_counter() - extract_started_at
+        if snapshot_path is not None:
+            from raypyon.snapshot import add_snapshot_result
+
+            add_snapshot_result(snapshot_path, solve_info)
+        return df, "success", unfulfilled_requests, solve_info
+    else:
+        if snapshot_path is not None:
+            from raypyon.snapshot import add_snapshot_result
+
+            add_snapshot_result(snapshot_path, solve_info)
+        # 条件が矛盾している（または時間内に解が見つからなかった）ときは、ぶつかっているハード制約を調べる
+        if explain_failure and status in (cp_model.INFEASIBLE, cp_model.UNKNOWN) and not solve_info['stopped_early']:
+            solve_info['conflicts'] = find_conflicting_constraints(
+                year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days,
+                holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input,
+            )
+        # 解がないと分かったのではなく時間切れのときは、下書きだけでも返す
+        if draft_df is not None and status != cp_model.INFEASIBLE and status != cp_model.MODEL_INVALID:
+            solve_info['draft_violations'] = draft_violations
+            return draft_df, "draft", draft_unfulfilled_requests(draft_df, holiday_requests, work_requests), solve_info
+        return None, "failed", [], solve_info
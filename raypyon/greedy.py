@@ -0,0 +1,188 @@
+"""貪欲法によるシフトの下書き
+
+ソルバーを使わずに、ミリ秒単位でシフト表を1つ作ります。
+当直を順番に割り当てて明け・公休を続け、日勤の必要人数を埋めてから、公休の日数と労働時間を整えます。
+
+作った表は CP-SAT のヒント（探索の出発点）に使うほか、制限時間内にソルバーが解を見つけられなかったときに
+下書きとして表示します。ハード制約をすべて満たすとは限らないので、満たしていない条件も一緒に返します。
+"""
+import calendar
+
+from raypyon.core import WORKS, WORK_HOURS, WORKS_INV_SYMBOLS, monthly_target_hours
+from raypyon.screening import MAX_DUTY_DAYS, MAX_OFF_DAYS, MIN_OFF_DAYS, _days_off, cell_domains
+
+OFF, NIKKIN, HALF, DUTY, AKE = (WORKS[name] for name in ("公休", "日勤", "半日", "当直", "明け"))
+_HOURS = {work_id: WORK_HOURS[name] for name, work_id in WORKS.items()}
+
+
+def _run_length(row, d_idx):
+    """d日目を含む、公休を挟まない連続勤務の日数"""
+    start = d_idx
+    while start > 0 and row[start - 1] not in (OFF, None):
+        start -= 1
+    end = d_idx
+    while end < len(row) - 1 and row[end + 1] not in (OFF, None):
+        end += 1
+    return end - start + 1
+
+
+def build_greedy_schedule(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input):
+    """貪欲法でシフト表を作り、(スタッフ×日の勤務記号の表, 満たせなかったハード制約の説明のリスト) を返す
+
+    引数は create_shift_schedule と同じです（優先度は使いません）。
+    月が不正（1-12以外）なら calendar.IllegalMonthError を送出します。
+    """
+    import pandas as pd
+
+    num_days = calendar.monthrange(year, month)[1]
+    staff_count = len(staff_names)
+    target_hours = monthly_target_hours(month, num_days)
+    min_hours = target_hours - work_hour_tolerance
+    is_day_off, weekdays = _days_off(year, month)
+    is_day_off = is_day_off.tolist()
+    domains = cell_domains(year, month, staff_names, fixed_shifts).tolist()
+
+    # 勤務が決まっているマスを先に埋める（取りうる勤務が1つもないマスは、あとで公休にする）
+    grid = [[None] * num_days for _ in range(staff_count)]
+    violations = []
+    for s_idx in range(staff_count):
+        for d_idx in range(num_days):
+            if sum(domains[s_idx][d_idx]) == 1:
+                grid[s_idx][d_idx] = domains[s_idx][d_idx].index(True)
+            elif not any(domains[s_idx][d_idx]):
+                violations.append(f"**{staff_names[s_idx]}さん**の{d_idx + 1}日の固定シフト")
+
+    def can(s_idx, d_idx, work_id):
+        return d_idx >= num_days or (grid[s_idx][d_idx] in (None, work_id) and domains[s_idx][d_idx][work_id])
+
+    holiday_sets = [set(holiday_requests.get(name, [])) for name in staff_names]
+    work_sets = [set(work_requests.get(name, [])) for name in staff_names]
+    duty_counts = [row.count(DUTY) for row in grid]
+
+    # 1. 当直: 当直の少ない人から順に割り当て、翌日を明け、翌々日を公休にする
+    for d_idx in range(num_days):
+        if any(row[d_idx] == DUTY for row in grid):
+            continue
+        candidates = [
+            s_idx for s_idx in range(staff_count)
+            if grid[s_idx][d_idx] is None and domains[s_idx][d_idx][DUTY] and duty_counts[s_idx] < MAX_DUTY_DAYS
+            and can(s_idx, d_idx + 1, AKE) and can(s_idx, d_idx + 2, OFF)
+        ]
+        if not candidates:
+            continue
+        s_idx = min(candidates, key=lambda s: (
+            (d_idx + 1) in holiday_sets[s] or (d_idx + 2) in holiday_sets[s],
+            duty_counts[s],
+            (s - d_idx) % staff_count,  # 同じ回数なら順番に回す
+        ))
+        for offset, work_id in enumerate((DUTY, AKE, OFF)):
+            if d_idx + offset < num_days:
+                grid[s_idx][d_idx + offset] = work_id
+        duty_counts[s_idx] += 1
+
+    # 2. 希望休
+    for s_idx in range(staff_count):
+        for day in sorted(holiday_sets[s_idx]):
+            if 1 <= day <= num_days and grid[s_idx][day - 1] is None and grid[s_idx].count(OFF) < MAX_OFF_DAYS:
+                grid[s_idx][day - 1] = OFF
+
+    def hours_of(s_idx):
+        return sum(_HOURS[work_id] for work_id in grid[s_idx] if work_id is not None)
+
+    # 3. 日勤: 労働時間の少ない人から、必要人数まで割り当てる
+    nikkin_counts = [sum(row[d_idx] == NIKKIN for row in grid) for d_idx in range(num_days)]
+    required = [0 if is_day_off[d_idx] else nikkin_requirements[weekdays[d_idx]] for d_idx in range(num_days)]
+    for d_idx in range(num_days):
+        candidates = [
+            s_idx for s_idx in range(staff_count)
+            if grid[s_idx][d_idx] is None and domains[s_idx][d_idx][NIKKIN] and hours_of(s_idx) + 8 <= target_hours
+        ]
+        candidates.sort(key=lambda s: (_run_length(grid[s], d_idx) > max_consecutive_days_input, hours_of(s)))
+        for s_idx in candidates[:max(0, required[d_idx] - nikkin_counts[d_idx])]:
+            grid[s_idx][d_idx] = NIKKIN
+            nikkin_counts[d_idx] += 1
+
+    # 4. 残りのマス: 平日は日勤、日曜・祝日は公休で仮に埋めてから、公休の日数と労働時間を整える
+    for s_idx in range(staff_count):
+        row = grid[s_idx]
+        filled = []
+        for d_idx in range(num_days):
+            if row[d_idx] is None:
+                allowed = domains[s_idx][d_idx]
+                row[d_idx] = NIKKIN if allowed[NIKKIN] and not is_day_off[d_idx] else OFF
+                filled.append(d_idx)
+                if row[d_idx] == NIKKIN:
+                    nikkin_counts[d_idx] += 1
+
+        # 働きすぎ・公休不足: 日勤の余っている日、連勤の長い日から公休にする
+        while hours_of(s_idx) > target_hours or row.count(OFF) < MIN_OFF_DAYS:
+            candidates = [d_idx for d_idx in filled if row[d_idx] == NIKKIN and (d_idx + 1) not in work_sets[s_idx]]
+            if not candidates:
+                break
+            d_idx = max(candidates, key=lambda d: (nikkin_counts[d] > required[d], _run_length(row, d)))
+            row[d_idx] = OFF
+            nikkin_counts[d_idx] -= 1
+
+        # 公休が多すぎる・時間が足りない: 平日の公休を日勤（入らなければ半日）にする
+        while row.count(OFF) > MAX_OFF_DAYS or (hours_of(s_idx) < min_hours and row.count(OFF) > MIN_OFF_DAYS):
+            candidates = [
+                d_idx for d_idx in filled
+                if row[d_idx] == OFF and not is_day_off[d_idx] and (d_idx + 1) not in holiday_sets[s_idx]
+            ]
+            remaining = target_hours - hours_of(s_idx)
+            if remaining >= 8:
+                work_id = NIKKIN
+            elif remaining >= 4 and row.count(HALF) < max_half_days:
+                work_id = HALF
+            else:
+                break
+            candidates = [d_idx for d_idx in candidates if domains[s_idx][d_idx][work_id]]
+            if not candidates:
+                break
+            d_idx = min(candidates, key=lambda d: (nikkin_counts[d] >= required[d], _run_length(row, d)))
+            row[d_idx] = work_id
+            if work_id == NIKKIN:
+                nikkin_counts[d_idx] += 1
+
+        # それでも公休が多いとき（日曜・祝日が多い月など）は、翌日が公休のマスを明け（0時間）にする
+        while row.count(OFF) > MAX_OFF_DAYS:
+            candidates = [
+                d_idx for d_idx in filled
+                if row[d_idx] == OFF and domains[s_idx][d_idx][AKE] and (d_idx + 1) not in holiday_sets[s_idx]
+                and (d_idx == num_days - 1 or row[d_idx + 1] == OFF) and (d_idx == 0 or row[d_idx - 1] != AKE)
+            ]
+            if not candidates:
+                break
+            row[candidates[0]] = AKE
+
+    violations += schedule_violations(grid, staff_names, target_hours, min_hours, max_half_days)
+    schedule = {name: [WORKS_INV_SYMBOLS[work_id] for work_id in grid[s_idx]] for s_idx, name in enumerate(staff_names)}
+    return pd.DataFrame(schedule).T, violations
+
+
+def schedule_violations(grid, staff_names, target_hours, min_hours, max_half_days):
+    """勤務IDの表が満たしていないハード制約を、説明文のリストで返す"""
+    num_days = len(grid[0]) if grid else 0
+    violations = []
+    for d_idx in range(num_days):
+        duty_count = sum(row[d_idx] == DUTY for row in grid)
+        if duty_count != 1:
+            violations.append(f"**{d_idx + 1}日**の当直が{duty_count}人です")
+    for s_idx, name in enumerate(staff_names):
+        row = grid[s_idx]
+        for d_idx in range(num_days - 1):
+            if (row[d_idx], row[d_idx + 1]) in ((DUTY, AKE), (AKE, OFF)):
+                continue
+            if row[d_idx] == DUTY or row[d_idx] == AKE:
+                violations.append(f"**{name}さん**の{d_idx + 1}日からの当直→明け→公休の並び")
+        hours = sum(_HOURS[work_id] for work_id in row)
+        off_count = row.count(OFF)
+        if not MIN_OFF_DAYS <= off_count <= MAX_OFF_DAYS:
+            violations.append(f"**{name}さん**の公休が{off_count}日です（月{MIN_OFF_DAYS}〜{MAX_OFF_DAYS}日）")
+        if not min_hours <= hours <= target_hours:
+            violations.append(f"**{name}さん**の総労働時間が{hours}時間です（{min_hours}〜{target_hours}時間）")
+        if row.count(HALF) > max_half_days:
+            violations.append(f"**{name}さん**の半日勤務が{row.count(HALF)}回です（{max_half_days}回まで）")
+        if row.count(DUTY) > MAX_DUTY_DAYS:
+            violations.append(f"**{name}さん**の当直が{row.count(DUTY)}回です（{MAX_DUTY_DAYS}回まで）")
+    return violations
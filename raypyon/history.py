@@ -0,0 +1,277 @@
+"""シフト作成の履歴（SQLite）
+
+画面で作ったシフトは、そのままでは再読み込みで消えてしまいます。ここでは解くたびに、入力・ソルバーの設定・
+シフト表・目的関数の内訳・時間・状態を1件ずつ SQLite に保存します。
+病棟・年月・入力のハッシュで索引を張っているので、過去のシフトは解き直さずにすぐ開けます。
+
+どの履歴も、保存した入力と設定で解き直せます（replay）。解き直した結果は元の履歴を指す新しい履歴として保存し、
+ソルバーやこのプログラムの版による速さ・目的関数値の違いを比べられるようにします。
+
+シフト表は、勤務の番号（WORKS の値）を1マス1バイトで並べたものとして保存します。
+
+使い方:
+    python -m raypyon.history list --ward 3階東 --year 2025 --month 5
+    python -m raypyon.history replay 12 15 --profile reproducible
+"""
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+
+from raypyon.cache import _solver_version, make_input_hash, normalize_inputs
+from raypyon.core import WORKS, WORKS_INV_SYMBOLS, WORK_SYMBOLS
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "raypyon", "history.sqlite3")
+# create_shift_schedule の位置引数の順番
+INPUT_FIELDS = (
+    'year', 'month', 'staff_names', 'holiday_requests', 'work_requests', 'nikkin_requirements', 'fixed_shifts',
+    'max_half_days', 'holiday_request_priority', 'fairness_priority', 'work_hour_tolerance', 'max_consecutive_days_input',
+)
+# 一覧（list）で返す列。入力とシフト表は load で読む
+SUMMARY_COLUMNS = (
+    'id', 'created_at', 'ward', 'year', 'month', 'input_hash', 'kind', 'solver_profile', 'status', 'solver_status',
+    'objective', 'best_bound', 'wall_time', 'build_time', 'solver_version', 'replay_of',
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    ward TEXT NOT NULL DEFAULT '',
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    input_hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    options TEXT NOT NULL,
+    solver_profile TEXT,
+    solver_parameters TEXT,
+    status TEXT NOT NULL,
+    solver_status TEXT,
+    objective REAL,
+    best_bound REAL,
+    objective_breakdown TEXT,
+    wall_time REAL,
+    build_time REAL,
+    staff_names TEXT NOT NULL,
+    schedule BLOB,
+    unfulfilled_requests TEXT NOT NULL,
+    solve_info TEXT NOT NULL,
+    solver_version TEXT,
+    replay_of INTEGER REFERENCES solves(id)
+);
+CREATE INDEX IF NOT EXISTS solves_ward_period ON solves (ward, year, month, created_at);
+CREATE INDEX IF NOT EXISTS solves_input_hash ON solves (input_hash, created_at);
+CREATE INDEX IF NOT EXISTS solves_replay_of ON solves (replay_of);
+"""
+
+
+def encode_schedule(schedule):
+    """シフト表（DataFrame）を、1マス1バイトの勤務の番号に詰める"""
+    work_ids = {WORK_SYMBOLS[name]: work_id for name, work_id in WORKS.items()}
+    return bytes(work_ids[symbol] for row in schedule.itertuples(index=False) for symbol in row)
+
+
+def decode_schedule(data, staff_names):
+    """encode_schedule の逆。列は build_schedule_df と同じ 0 始まりの日の番号"""
+    import pandas as pd
+
+    num_days = len(data) // len(staff_names)
+    return pd.DataFrame(
+        [[WORKS_INV_SYMBOLS[work_id] for work_id in data[s_idx * num_days:(s_idx + 1) * num_days]] for s_idx in range(len(staff_names))],
+        index=staff_names,
+    )
+
+
+def _json_default(value):
+    # DataFrame（前回のシフト）は {スタッフ名: 勤務記号のリスト} にし、numpy の数値は Python の数値にする
+    if hasattr(value, "iterrows"):
+        return {name: list(row) for name, row in value.iterrows()}
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+def serialize_inputs(args):
+    """create_shift_schedule の位置引数を、INPUT_FIELDS をキーにしたJSONにできる辞書にする"""
+    inputs = normalize_inputs(*args)
+    inputs['fixed_shifts'] = [{'staff': staff, 'day': day, 'work': work} for staff, day, work in inputs['fixed_shifts']]
+    return inputs
+
+
+def restore_options(options):
+    """JSONから読んだキーワード引数を、create_shift_schedule に渡せる形に戻す（前回のシフトを DataFrame にする）"""
+    import pandas as pd
+
+    options = dict(options)
+    if options.get('previous_schedule') is not None:
+        previous = options['previous_schedule']
+        options['previous_schedule'] = pd.DataFrame([previous[name] for name in previous], index=list(previous))
+    return options
+
+
+class SolveHistory:
+    """解いた結果を1件ずつ保存する SQLite のデータベース
+
+    画面の複数のセッションから同時に使えるよう、操作ごとに接続を開き直します。
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, args, result, options=None, kind="schedule", ward="", replay_of=None):
+        """解いた結果を保存し、履歴の番号を返す
+
+        args は create_shift_schedule の位置引数、result は戻り値の (シフト表, 状態, 叶わなかった希望, 求解の情報)、
+        options はキーワード引数（progress などは除いたもの）です。
+        """
+        inputs = serialize_inputs(args)
+        df, status, unfulfilled, solve_info = result
+        solve_info = solve_info or {}
+        row = {
+            'created_at': datetime.datetime.now().isoformat(timespec="seconds"),
+            'ward': ward or "",
+            'year': inputs['year'],
+            'month': inputs['month'],
+            'input_hash': make_input_hash(*args),
+            'kind': kind,
+            'inputs': _dumps(inputs),
+            'options': _dumps(options or {}),
+            'solver_profile': solve_info.get('solver_profile'),
+            'solver_parameters': _dumps(solve_info.get('solver_parameters')),
+            'status': status,
+            'solver_status': solve_info.get('solver_status'),
+            'objective': solve_info.get('objective'),
+            'best_bound': solve_info.get('best_bound'),
+            'objective_breakdown': _dumps(solve_info.get('objective_breakdown')),
+            'wall_time': solve_info.get('wall_time'),
+            'build_time': solve_info.get('build_time'),
+            'staff_names': _dumps(inputs['staff_names']),
+            'schedule': encode_schedule(df) if df is not None else None,
+            'unfulfilled_requests': _dumps(list(unfulfilled)),
+            'solve_info': _dumps(solve_info),
+            'solver_version': _solver_version(),
+            'replay_of': replay_of,
+        }
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                f"INSERT INTO solves ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})", list(row.values()))
+            return cursor.lastrowid
+
+    def find(self, ward=None, year=None, month=None, input_hash=None, limit=50):
+        """条件に合う履歴の概要（SUMMARY_COLUMNS の辞書）を新しい順に返す"""
+        conditions, values = [], []
+        for column, value in (('ward', ward), ('year', year), ('month', month), ('input_hash', input_hash)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM solves {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                values + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def load(self, entry_id):
+        """1件の履歴をすべて読み込む（ないときは None）
+
+        args は create_shift_schedule の位置引数のタプル、result は戻り値と同じ形のタプルです。
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM solves WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        for column in ('inputs', 'options', 'solver_parameters', 'objective_breakdown', 'staff_names', 'unfulfilled_requests', 'solve_info'):
+            entry[column] = json.loads(entry[column])
+        schedule = decode_schedule(entry['schedule'], entry['staff_names']) if entry['schedule'] is not None else None
+        entry['schedule'] = schedule
+        entry['args'] = tuple(entry['inputs'][field] for field in INPUT_FIELDS)
+        entry['result'] = (schedule, entry['status'], entry['unfulfilled_requests'], entry['solve_info'])
+        return entry
+
+    def replay(self, entry_id, solver_profile=None, time_limit=None):
+        """保存した入力と設定で解き直し、新しい履歴として保存して、その番号を返す
+
+        solver_profile・time_limit を渡すと、保存した設定の代わりに使います。
+        """
+        from raypyon.worker import run_job
+
+        entry = self.load(entry_id)
+        if entry is None:
+            raise KeyError(entry_id)
+        options = restore_options(entry['options'])
+        # 解き直しで元のスナップショットを上書きしない
+        options.pop('snapshot_path', None)
+        if solver_profile is not None:
+            options['solver_profile'] = solver_profile
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+        result, _ = run_job({'kind': entry['kind'], 'args': entry['args'], 'options': options})
+        return self.record(entry['args'], result, options, kind=entry['kind'], ward=entry['ward'], replay_of=entry_id)
+
+
+def _format_entry(entry):
+    objective = "-" if entry['objective'] is None else f"{entry['objective']:g}"
+    wall_time = "-" if entry['wall_time'] is None else f"{entry['wall_time']:.2f}s"
+    return (
+        f"#{entry['id']} {entry['created_at']} {entry['ward'] or '(病棟なし)'} {entry['year']}-{entry['month']:02d} "
+        f"{entry['status']}/{entry['solver_status']} 目的関数値 {objective} 計算 {wall_time} "
+        f"{entry['solver_profile']} ortools {entry['solver_version']}"
+        + (f" (#{entry['replay_of']} の解き直し)" if entry['replay_of'] else "")
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シフト作成の履歴を一覧し、解き直して比べます。")
+    parser.add_argument("--db", default=DEFAULT_HISTORY_PATH, help="履歴のデータベースのパス")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="履歴を新しい順に表示する")
+    list_parser.add_argument("--ward")
+    list_parser.add_argument("--year", type=int)
+    list_parser.add_argument("--month", type=int)
+    list_parser.add_argument("--input-hash")
+    list_parser.add_argument("--limit", type=int, default=50)
+    replay_parser = commands.add_parser("replay", help="履歴を古い順に解き直し、元の結果と並べて表示する")
+    replay_parser.add_argument("ids", type=int, nargs="+")
+    replay_parser.add_argument("--profile", default=None, help="保存した計算プロファイルの代わりに使うもの")
+    replay_parser.add_argument("--time-limit", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    history = SolveHistory(args.db)
+    if args.command == "list":
+        for entry in history.find(args.ward, args.year, args.month, args.input_hash, args.limit):
+            print(_format_entry(entry))
+        return 0
+
+    for entry_id in sorted(args.ids):
+        original = history.load(entry_id)
+        if original is None:
+            print(f"#{entry_id}: 履歴がありません", file=sys.stderr)
+            continue
+        replay_id = history.replay(entry_id, args.profile, args.time_limit)
+        replayed = history.load(replay_id)
+        print(_format_entry(original))
+        print(_format_entry(replayed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
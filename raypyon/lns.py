@@ -0,0 +1,207 @@
+"""大規模な名簿向けの大近傍探索（LNS）
+
+病院全体（50〜200人）の名簿は、create_shift_schedule で1つのモデルを丸ごと解くと制限時間内に収束しません。
+ここでは同じモデルを使い、暫定解の大部分を固定して、残り（一部のスタッフ・一部の期間）だけを
+短い制限時間で解き直すことを繰り返します。
+
+近傍の大きさは自動で調整します。解き直しが最適まで終われば広げ、時間切れになれば狭めます。
+結果は create_shift_schedule と同じ形で返し、solve_info['trajectory'] に目的関数値の推移が入ります。
+推移の各項目には、その1回の求解の探索のタイムライン（raypyon.telemetry）も入ります。
+"""
+import calendar
+import random
+import time
+
+from raypyon.core import (
+    DEFAULT_SOLVER_PROFILE, SOLVER_PROFILES,
+    apply_solver_profile, build_schedule_df, build_shift_model, carry_over_fixed_shifts,
+    draft_unfulfilled_requests, objective_breakdown, unfulfilled_request_messages,
+)
+
+# この人数以上なら、バッチでは既定で LNS を使う
+# （100人では1つのモデルのほうが良い解に届き、200人では LNS のほうが大幅に良かったため）
+LNS_MIN_STAFF = 150
+NEIGHBORHOODS = ("staff", "days", "staff_days")
+
+
+def choose_neighborhood(kind, rng, staff_count, num_days, fraction):
+    """解き直すマス (スタッフ, 日) の集合を選ぶ（全体のおよそ fraction の割合）
+
+    staff: 一部のスタッフの1か月分、days: 全員の連続した数日分、staff_days: 一部のスタッフの半月分
+    """
+    if kind == "staff":
+        staff = rng.sample(range(staff_count), max(2, min(staff_count, round(staff_count * fraction))))
+        days = range(num_days)
+    elif kind == "days":
+        length = max(2, min(num_days, round(num_days * fraction)))
+        start = rng.randrange(num_days - length + 1)
+        staff, days = range(staff_count), range(start, start + length)
+    else:
+        staff = rng.sample(range(staff_count), max(2, min(staff_count, round(staff_count * min(1.0, 2 * fraction)))))
+        length = num_days // 2
+        start = rng.randrange(num_days - length + 1)
+        days = range(start, start + length)
+    return {(s_idx, d_idx) for s_idx in staff for d_idx in days}
+
+
+def solve_with_lns(year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days, holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, gap_limit=0.0, sub_time_limit=3.0, neighborhood_fraction=0.1, seed=0, progress=None, carry_over=None):
+    """LNS でシフトを作成し、create_shift_schedule と同じ (シフト表, 状態, 叶わなかった希望, 求解の情報) を返す
+
+    time_limit（省略時は計算プロファイルの制限時間）を使い切るか、下界とのギャップが gap_limit 以下になるか、
+    progress.stop() が呼ばれるまで近傍の解き直しを続けます。
+    最初の解を探すのには、最大で制限時間の半分（sub_time_limit 以上）を使います。
+    下界は、最初の解をヒントにモデル全体を sub_time_limit だけ解いて求めます（最初の解で止めた求解の下界は緩すぎるため）。
+    carry_over の扱いは create_shift_schedule と同じです。
+    """
+    from ortools.sat.python import cp_model
+    from raypyon.greedy import build_greedy_schedule
+    from raypyon.screening import screen_inputs
+    from raypyon.telemetry import SearchLog, search_timeline
+
+    if carry_over:
+        fixed_shifts = list(fixed_shifts) + carry_over_fixed_shifts(carry_over, staff_names)
+    if time_limit is None:
+        time_limit = SOLVER_PROFILES[solver_profile]["max_time_in_seconds"]
+    started_at = time.perf_counter()
+    deadline = started_at + time_limit
+    args = (year, month, staff_names, holiday_requests, work_requests, nikkin_requirements, fixed_shifts, max_half_days,
+            holiday_request_priority, fairness_priority, work_hour_tolerance, max_consecutive_days_input)
+
+    try:
+        screening_errors, screening_warnings = screen_inputs(
+            year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance)
+        if screening_errors:
+            return None, "failed", [], {
+                'search': "lns",
+                'solver_profile': solver_profile,
+                'solver_status': "SCREENED_INFEASIBLE",
+                'screening_warnings': screening_warnings,
+                'conflicts': screening_errors,
+                'stopped_early': False,
+            }
+        draft_df, draft_violations = build_greedy_schedule(*args)
+        shift_model = build_shift_model(*args, hint_schedule=draft_df, carry_over=carry_over)
+    except calendar.IllegalMonthError:
+        return None, "failed", [], {}
+    if progress is not None:
+        progress.draft = draft_df
+    model, x, num_days = shift_model.model, shift_model.x, shift_model.num_days
+    cells = [(s_idx, d_idx, literal) for (s_idx, d_idx, _), literal in x.items() if not isinstance(literal, bool)]
+
+    def elapsed():
+        return time.perf_counter() - started_at
+
+    def solve(target_model, limit, iteration, first_solution_only=False):
+        solver = cp_model.CpSolver()
+        parameters = apply_solver_profile(solver, solver_profile, limit)
+        solver.parameters.random_seed = parameters['random_seed'] + iteration
+        solver.parameters.stop_after_first_solution = first_solution_only
+        search_log = SearchLog()
+        search_log.attach(solver)
+        if progress is not None:
+            progress.attach(solver)
+        sub_status = solver.Solve(target_model)
+        return solver, sub_status, parameters, search_timeline(search_log, solver)
+
+    # 1. 最初の解（貪欲法の下書きをヒントにする）。解が1つ見つかれば十分で、残りの時間は近傍の解き直しに使う
+    best_solver, status, solver_parameters, first_timeline = solve(model, max(sub_time_limit, time_limit * 0.5), 0, first_solution_only=True)
+    solve_info = {
+        'search': "lns",
+        'solver_profile': solver_profile,
+        'solver_parameters': {**solver_parameters, 'max_time_in_seconds': time_limit, 'sub_time_limit': sub_time_limit},
+        'build_time': shift_model.build_time,
+        'num_variables': len(model.Proto().variables),
+        'num_constraints': len(model.Proto().constraints),
+        'screening_warnings': screening_warnings,
+        # 最初の解を探した求解のタイムライン（それ以降の求解のものは trajectory の各項目にある）
+        'search_timeline': first_timeline,
+    }
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        stopped_early = progress is not None and progress.stop_requested
+        solve_info.update(solver_status=best_solver.StatusName(status), wall_time=elapsed(), stopped_early=stopped_early)
+        if status == cp_model.INFEASIBLE:
+            return None, "failed", [], solve_info
+        solve_info['draft_violations'] = draft_violations
+        return draft_df, "draft", draft_unfulfilled_requests(draft_df, holiday_requests, work_requests), solve_info
+
+    best_objective = best_solver.ObjectiveValue()
+    best_bound = best_solver.BestObjectiveBound()
+    trajectory = []
+
+    def record(neighborhood, fraction, sub_status, improved, timeline):
+        gap = abs(best_objective - best_bound) / max(1.0, abs(best_objective))
+        trajectory.append({
+            'elapsed': elapsed(),
+            'objective': best_objective,
+            'neighborhood': neighborhood,
+            'fraction': fraction,
+            'status': sub_status,
+            'improved': improved,
+            'search_timeline': timeline,
+        })
+        if improved and progress is not None:
+            incumbent = {'objective': best_objective, 'best_bound': best_bound, 'gap': gap, 'elapsed': elapsed()}
+            if progress.with_schedule:
+                incumbent['schedule'] = build_schedule_df(best_solver.BooleanValue, x, staff_names, num_days)
+            progress.report(incumbent)
+        return gap
+
+    gap = record("initial", 1.0, best_solver.StatusName(status), True, first_timeline)
+    # 2. 下界を求める短い求解（最初の解をヒントにするので、解が良くなればそれも使う）
+    if status != cp_model.OPTIMAL and deadline - time.perf_counter() > 0.1 and not (progress is not None and progress.stop_requested):
+        model.ClearHints()
+        for _, _, literal in cells:
+            model.AddHint(literal, best_solver.BooleanValue(literal))
+        bound_solver, bound_status, _, bound_timeline = solve(model, min(sub_time_limit, deadline - time.perf_counter()), 0)
+        improved = False
+        if bound_status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            best_bound = max(best_bound, bound_solver.BestObjectiveBound())
+            if bound_solver.ObjectiveValue() <= best_objective:
+                improved = bound_solver.ObjectiveValue() < best_objective
+                best_solver, best_objective, status = bound_solver, bound_solver.ObjectiveValue(), bound_status
+        gap = record("bound", 1.0, bound_solver.StatusName(bound_status), improved, bound_timeline)
+    rng = random.Random(seed)
+    fraction = neighborhood_fraction
+    iteration = 0
+    # 3. 近傍の解き直し
+    while status != cp_model.OPTIMAL and gap > gap_limit and deadline - time.perf_counter() > 0.1:
+        if progress is not None and progress.stop_requested:
+            break
+        iteration += 1
+        kind = NEIGHBORHOODS[iteration % len(NEIGHBORHOODS)]
+        free_cells = choose_neighborhood(kind, rng, len(staff_names), num_days, fraction)
+
+        # 近傍の外のマスは、モデルを複製して変数の範囲を暫定解の値に固定する（前処理で取り除かれる）
+        sub_model = model.Clone()
+        sub_model.ClearHints()
+        for s_idx, d_idx, literal in cells:
+            value = int(best_solver.BooleanValue(literal))
+            if (s_idx, d_idx) in free_cells:
+                sub_model.AddHint(literal, value)
+            else:
+                domain = sub_model.Proto().variables[literal.Index()].domain
+                domain[0] = domain[1] = value
+
+        sub_solver, sub_status, _, sub_timeline = solve(sub_model, min(sub_time_limit, deadline - time.perf_counter()), iteration)
+        improved = False
+        if sub_status in (cp_model.OPTIMAL, cp_model.FEASIBLE) and sub_solver.ObjectiveValue() <= best_objective:
+            # 同じ値の解も受け入れて、別の近傍から抜け出しやすくする
+            improved = sub_solver.ObjectiveValue() < best_objective
+            best_solver, best_objective = sub_solver, sub_solver.ObjectiveValue()
+        # 近傍を最適まで解けたら広げ、時間切れなら狭める
+        fraction = min(0.5, fraction * 1.25) if sub_status == cp_model.OPTIMAL else max(0.02, fraction / 1.25)
+        gap = record(kind, fraction, sub_solver.StatusName(sub_status), improved, sub_timeline)
+
+    schedule_df = build_schedule_df(best_solver.BooleanValue, x, staff_names, num_days)
+    unfulfilled_requests = unfulfilled_request_messages(best_solver.Value, shift_model.missed_requests_log)
+    solve_info.update(
+        solver_status="OPTIMAL" if status == cp_model.OPTIMAL or gap == 0 else "FEASIBLE",
+        wall_time=elapsed(),
+        stopped_early=progress is not None and progress.stop_requested,
+        objective=best_objective,
+        best_bound=best_bound,
+        objective_breakdown=objective_breakdown(best_solver.Value, shift_model),
+        iterations=iteration,
+        trajectory=trajectory,
+    )
+    return schedule_df, "success", unfulfilled_requests, solve_info
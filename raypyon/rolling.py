@@ -0,0 +1,66 @@
+"""月をまたいだシフトの連続作成（ローリングホライズン）
+
+1か月ずつ解くと、月末の当直→明け→公休の並びと連勤の日数が翌月に引き継がれません。
+かといって3か月分を1つのモデルにすると、変数が3倍になって解けなくなります。
+ここでは月の順に1か月ずつ解き、前月の結果の月末を次の月の境界条件として渡します。
+
+- 前月末が当直なら翌月1日は明け・2日は公休、前月末が明けなら翌月1日は公休に固定します。
+- 前月末から続いている連勤は、翌月初めの連勤上限に数えます。
+
+各月のモデルの大きさは変わらないので、かかる時間は月数にほぼ比例します。
+設定の形式は raypyon.batch と同じです。
+
+使い方:
+    python -m raypyon.batch wards/ --rolling
+"""
+from raypyon.batch import solve_config
+from raypyon.core import DEFAULT_SOLVER_PROFILE
+
+
+def carry_over_from(schedule):
+    """シフト表（DataFrame、または {スタッフ名: 勤務記号のリスト}）から、次の月に引き継ぐ勤務を返す"""
+    if hasattr(schedule, "iterrows"):
+        return {name: list(row) for name, row in schedule.iterrows()}
+    return {name: list(row) for name, row in schedule.items()}
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def solve_rolling_horizon(configs, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, search="auto", carry_over=None):
+    """同じ病棟の月ごとの設定を古い順に解き、月ごとの結果を順に返すジェネレーター
+
+    carry_over を渡すと、最初の月の前月の勤務として使います。
+    解けなかった月や、前の設定と月が続いていない月は、前月の引き継ぎなしで解きます。
+    下書き（status が "draft"）はハード制約を満たさないことがあるので、引き継ぎには使いません。
+    """
+    previous_month = None
+    for config in sorted(configs, key=lambda config: (config.get('year', 0), config.get('month', 0))):
+        current_month = (config.get('year'), config.get('month'))
+        if carry_over and previous_month is not None and _next_month(*previous_month) != current_month:
+            carry_over = None
+        result = solve_config(config, solver_profile, time_limit, search, carry_over=carry_over)
+        result['carried_over'] = bool(carry_over)
+        carry_over = carry_over_from(result['schedule']) if result['status'] == "success" else None
+        previous_month = current_month
+        yield result
+
+
+def combine_schedules(results):
+    """月ごとの結果をつなげて、列が「月/日」の1つのシフト表（DataFrame）にする
+
+    途中で辞めた人・入った人の、在籍していない月のマスは欠損値（NaN）になります（日勤の記号が空文字のため）。
+    """
+    import pandas as pd
+
+    frames = []
+    for result in results:
+        if 'schedule' not in result:
+            continue
+        frame = pd.DataFrame(result['schedule']).T
+        frame.columns = [f"{result['month']}/{day}" for day in range(1, frame.shape[1] + 1)]
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1)
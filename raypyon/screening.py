@@ -0,0 +1,190 @@
+"""ソルバーを呼ぶ前の実行可能性チェックと前処理
+
+固定シフトと、そこから必ず決まる勤務（当直→明け→公休）を スタッフ×日 の行列に展開し、
+NumPyでまとめて数えることで、解がないことが明らかな入力をミリ秒単位で見つけます。
+pre_check_constraints が入力どうしの重複を見るのに対し、こちらは月全体の数の辻褄を見ます。
+
+cell_domains は同じ展開を使って、各マスで取りうる勤務を絞り込みます。
+build_shift_model はこれを使い、勤務が決まっているマスには変数を作りません。
+
+ここで見つけるのは「どう割り当てても解がない」ことが確実なものだけです。
+見逃しはあっても、解のある入力を誤って弾くことはないように、上限・下限は甘めに見積もっています。
+"""
+import calendar
+import datetime
+
+import jpholiday
+import numpy as np
+
+from raypyon.core import WORKS, WORK_HOURS, SYMBOLS_INV_WORKS, monthly_target_hours
+
+FREE = -1  # 固定されていないマス
+MIN_OFF_DAYS, MAX_OFF_DAYS = 8, 10
+MAX_DUTY_DAYS = 10
+
+_HOURS_BY_ID = np.array([WORK_HOURS[name] for name in sorted(WORKS, key=WORKS.get)])
+
+
+def _shift_right(mask, days=1):
+    """d日目の値を d+days 日目に移す（はみ出した分は捨て、先頭は False で埋める）"""
+    shifted = np.zeros_like(mask)
+    shifted[:, days:] = mask[:, :-days]
+    return shifted
+
+
+def _shift_left(mask, days=1, fill=True):
+    """d+days 日目の値を d日目に移す（月末を越える分は fill で埋める）"""
+    shifted = np.full_like(mask, fill)
+    shifted[:, :-days] = mask[:, days:]
+    return shifted
+
+
+def _days_off(year, month):
+    """日曜・祝日かどうかの配列と、曜日の配列を返す"""
+    num_days = calendar.monthrange(year, month)[1]
+    holidays_jp = [d[0].day for d in jpholiday.month_holidays(year, month)]
+    weekdays = np.array([datetime.date(year, month, day).weekday() for day in range(1, num_days + 1)])
+    return (weekdays == 6) | np.isin(np.arange(1, num_days + 1), holidays_jp), weekdays
+
+
+def fixed_shift_matrix(staff_names, num_days, fixed_shifts):
+    """固定シフトを スタッフ×日 の勤務ID行列にする（固定されていないマスは FREE）
+
+    同じマスに別々の勤務が固定されているときは、そのメッセージも返します。
+    """
+    index = {name: s_idx for s_idx, name in enumerate(staff_names)}
+    matrix = np.full((len(staff_names), num_days), FREE, dtype=np.int8)
+    errors = []
+    for fix in fixed_shifts:
+        s_idx = index.get(fix['staff'])
+        work_name = SYMBOLS_INV_WORKS.get(fix['work'])
+        if s_idx is None or work_name is None or not 1 <= fix['day'] <= num_days:
+            continue
+        d_idx = fix['day'] - 1
+        current = matrix[s_idx, d_idx]
+        if current != FREE and current != WORKS[work_name]:
+            errors.append(f"**{fix['staff']}さん**の{fix['day']}日に別々の固定シフトが入っています")
+        matrix[s_idx, d_idx] = WORKS[work_name]
+    return matrix, errors
+
+
+def screen_inputs(year, month, staff_names, nikkin_requirements, fixed_shifts, max_half_days, work_hour_tolerance):
+    """解がないことが明らかな入力を調べ、(エラーの一覧, 注意の一覧) を返す
+
+    エラーがあるときは、ソルバーで解いても必ず失敗します。
+    注意は解けるものの、日勤人数の不足が避けられないなど、結果が希望どおりにならないことが確実なものです。
+    月が不正（1-12以外）なら calendar.IllegalMonthError を送出します。
+    """
+    is_day_off, weekdays = _days_off(year, month)
+    num_days = len(weekdays)
+    staff_count = len(staff_names)
+    target_hours = monthly_target_hours(month, num_days)
+
+    errors, warnings = [], []
+    if staff_count == 0:
+        return ["スタッフが登録されていません"], warnings
+
+    # --- 全体の人数 ---
+    # 当直の翌日は明け、翌々日は公休なので、3日目以降は毎日3人が当直まわりで埋まる
+    if num_days >= 3 and staff_count < 3:
+        errors.append(f"当直→明け→公休を毎日回すには3人以上必要です（登録 {staff_count} 人）")
+    if staff_count * MAX_DUTY_DAYS < num_days:
+        errors.append(f"当直は1人あたり月{MAX_DUTY_DAYS}回までのため、{staff_count} 人では{num_days}日分の当直を埋められません")
+
+    # --- 固定シフトと、そこから必ず決まる勤務 ---
+    fixed, cell_errors = fixed_shift_matrix(staff_names, num_days, fixed_shifts)
+    errors.extend(cell_errors)
+    forced_ake = _shift_right(fixed == WORKS["当直"])
+    forced_off = _shift_right((fixed == WORKS["明け"]) | forced_ake)
+    for forced, work_name, reason in ((forced_ake, "明け", "前日が当直"), (forced_off, "公休", "前日が明け")):
+        clash = forced & (fixed != FREE) & (fixed != WORKS[work_name])
+        for s_idx, d_idx in zip(*np.nonzero(clash)):
+            errors.append(f"**{staff_names[s_idx]}さん**の{d_idx + 1}日は{reason}のため{work_name}ですが、別の勤務が固定されています")
+    assigned = fixed.copy()
+    assigned[forced_ake & (fixed == FREE)] = WORKS["明け"]
+    assigned[forced_off & (fixed == FREE)] = WORKS["公休"]
+    free = assigned == FREE
+
+    # 日曜・祝日に日勤・半日が固定されている
+    weekday_only = np.isin(assigned, [WORKS["日勤"], WORKS["半日"]]) & is_day_off
+    for s_idx, d_idx in zip(*np.nonzero(weekday_only)):
+        errors.append(f"**{staff_names[s_idx]}さん**の{d_idx + 1}日は日曜・祝日のため、日勤・半日は固定できません")
+
+    # --- スタッフごとの回数・時間 ---
+    off_counts = (assigned == WORKS["公休"]).sum(axis=1)
+    work_counts = (~free & (assigned != WORKS["公休"])).sum(axis=1)
+    duty_counts = (assigned == WORKS["当直"]).sum(axis=1)
+    half_counts = (assigned == WORKS["半日"]).sum(axis=1)
+    fixed_hours = np.where(free, 0, _HOURS_BY_ID[np.where(free, 0, assigned)]).sum(axis=1)
+    # 空いているマスは1日あたり平均8時間まで（当直16時間は翌日の明け0時間と対になる）。
+    # ただし翌日が明けで決まっているマスと月末のマスは、当直なら対になる明けがないので+8時間まで
+    duty_without_pair = free & _shift_left(assigned == WORKS["明け"])
+    extra_off = np.maximum(0, MIN_OFF_DAYS - off_counts)
+    max_hours = fixed_hours + 8 * np.maximum(0, free.sum(axis=1) - extra_off) + 8 * duty_without_pair.sum(axis=1)
+    min_hours = target_hours - work_hour_tolerance
+
+    for s_idx, name in enumerate(staff_names):
+        if off_counts[s_idx] > MAX_OFF_DAYS:
+            errors.append(f"**{name}さん**は固定シフトと当直明けで公休が{off_counts[s_idx]}日になり、上限の{MAX_OFF_DAYS}日を超えます")
+        if work_counts[s_idx] > num_days - MIN_OFF_DAYS:
+            errors.append(f"**{name}さん**は固定シフトで勤務が{work_counts[s_idx]}日決まっており、公休を{MIN_OFF_DAYS}日取れません")
+        if duty_counts[s_idx] > MAX_DUTY_DAYS:
+            errors.append(f"**{name}さん**の当直が{duty_counts[s_idx]}回固定されています（上限 {MAX_DUTY_DAYS} 回）")
+        if half_counts[s_idx] > max_half_days:
+            errors.append(f"**{name}さん**の半日が{half_counts[s_idx]}回固定されています（上限 {max_half_days} 回）")
+        if fixed_hours[s_idx] > target_hours:
+            errors.append(f"**{name}さん**は固定シフトだけで{fixed_hours[s_idx]}時間になり、上限の{target_hours}時間を超えます")
+        elif max_hours[s_idx] < min_hours:
+            errors.append(f"**{name}さん**は最大でも{max_hours[s_idx]}時間しか勤務できず、下限の{min_hours}時間に届きません")
+
+    # --- 日ごとの人数 ---
+    # 当直に入れるのは、翌日が明け・翌々日が公休になれるマスだけ
+    can_ake_next = _shift_left(free | (assigned == WORKS["明け"]))
+    can_off_after = _shift_left(free | (assigned == WORKS["公休"]), days=2)
+    can_duty = (assigned == WORKS["当直"]) | (free & can_ake_next & can_off_after)
+    for d_idx in np.nonzero(can_duty.sum(axis=0) == 0)[0]:
+        errors.append(f"**{d_idx + 1}日**は固定シフトと当直明けで埋まっており、当直に入れる人がいません")
+
+    # 日勤人数はソフト制約なので、足りないことが確実でも注意にとどめる
+    required = np.where(is_day_off, 0, np.asarray(nikkin_requirements)[weekdays])
+    can_nikkin = ((free & ~is_day_off) | (assigned == WORKS["日勤"])).sum(axis=0)
+    duty_open = ~(assigned == WORKS["当直"]).any(axis=0)
+    ake_open = ~(assigned == WORKS["明け"]).any(axis=0)
+    ake_open[0] = False  # 1日目の明けは前月の当直によるもので、必須ではない
+    max_nikkin = can_nikkin - duty_open - ake_open
+    for d_idx in np.nonzero((required > 0) & (required > max_nikkin))[0]:
+        warnings.append(f"**{d_idx + 1}日**は日勤に入れる人が最大{max(0, max_nikkin[d_idx])}人のため、必要人数（{required[d_idx]}人）に届きません")
+
+    return errors, warnings
+
+
+def cell_domains(year, month, staff_names, fixed_shifts):
+    """各マスで取りうる勤務を、(スタッフ, 日, 勤務ID) の真偽値の配列で返す
+
+    固定シフト、日曜・祝日の勤務の制限、当直→明け→公休の並びを、変化がなくなるまで繰り返し当てはめます。
+    ハード制約から必ず言えることだけを使うので、解を取りこぼすことはありません。
+    取りうる勤務が1つもないマスがあれば、その入力には解がありません。
+    月が不正（1-12以外）なら calendar.IllegalMonthError を送出します。
+    """
+    is_day_off, weekdays = _days_off(year, month)
+    fixed, _ = fixed_shift_matrix(staff_names, len(weekdays), fixed_shifts)
+    one_hot = np.eye(len(WORKS), dtype=bool)
+    duty, ake, off = WORKS["当直"], WORKS["明け"], WORKS["公休"]
+
+    allowed = np.ones(fixed.shape + (len(WORKS),), dtype=bool)
+    is_fixed = fixed != FREE
+    allowed[is_fixed] = one_hot[fixed[is_fixed]]
+    allowed[:, is_day_off, WORKS["日勤"]] = False
+    allowed[:, is_day_off, WORKS["半日"]] = False
+
+    while True:
+        before = allowed.copy()
+        decided = allowed.sum(axis=2) == 1
+        # 当直と決まったマスの翌日は明け、明けと決まったマスの翌日は公休
+        allowed[_shift_right(decided & allowed[:, :, duty])] &= one_hot[ake]
+        allowed[_shift_right(decided & allowed[:, :, ake])] &= one_hot[off]
+        # 翌日が明けになれないマスは当直にできず、翌日が公休になれないマスは明けにできない
+        allowed[:, :, duty] &= _shift_left(allowed[:, :, ake])
+        allowed[:, :, ake] &= _shift_left(allowed[:, :, off])
+        if np.array_equal(allowed, before):
+            return allowed
@@ -0,0 +1,337 @@
+"""CP-SATモデルのスナップショットと、オフラインでの解き直し
+
+実際の病棟で計算が遅かったり失敗したりしても、入力は使っている人のブラウザにしかないため再現できません。
+create_shift_schedule に snapshot_path を渡すと、組み立てたモデル（CpModelProto）と元の入力を
+1つのファイル（zip）に書き出します。中身は次のとおりです。
+
+- model.pbtxt: 組み立てたモデル（ヒントを含む）のテキスト形式。ortools の Python 版ではバイナリの読み込みができないため、
+  テキスト形式にしています（zip の圧縮で、スタッフ100人でも数百KBです）
+- inputs.json: create_shift_schedule の引数（位置引数は INPUT_FIELDS の辞書、残りはキーワード引数）
+- meta.json: 書き出した日時、ortools の版、変数・制約の数など。objective_mode="lexicographic" のときは、
+  model.pbtxt の目的関数（重み付きの合計）とは別に、各段階で最小化する式も入れます
+- result.json: 解き終わったあとの状態・目的関数値・計算時間・探索のタイムライン（解き終わる前に止まったときはありません）
+
+スナップショットを集めたディレクトリは、速さの回帰テストの問題集として使えます。
+replay は、スナップショットを計算プロファイル・ソルバーのパラメータ・モデルの作り方（VARIANTS）の
+組み合わせで解き直し、最初の解が出るまでの時間と最終的な目的関数値を比べます。
+"captured" は保存したモデルをそのまま、それ以外は保存した入力から今のコードでモデルを組み立て直して解きます。
+段階ごとに最小化したスナップショットは、どちらの場合も同じように段階ごとに解き直します。
+
+使い方:
+    python -m raypyon.snapshot capture ward.json --output snapshots/ward_202505.zip
+    python -m raypyon.snapshot replay snapshots/ --profiles fast_draft balanced --variants captured window automaton
+    python -m raypyon.snapshot replay snapshots/ --param linearization_level=2 --param num_workers=8 --time-limit 20
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import sys
+import time
+import zipfile
+
+from raypyon.cache import _solver_version
+from raypyon.core import DEFAULT_SOLVER_PROFILE, SOLVER_PROFILES, apply_solver_profile, lexicographic_stages, solve_stages
+from raypyon.history import INPUT_FIELDS, _dumps, restore_options, serialize_inputs
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "raypyon", "snapshots")
+# モデルの作り方の違い（build_shift_model のキーワード引数）。None は保存したモデルをそのまま使う
+VARIANTS = {
+    "captured": None,
+    "window": {'sequence_encoding': "window"},
+    "automaton": {'sequence_encoding': "automaton"},
+    "no_symmetry": {'break_symmetry': False},
+    "no_domain_reduction": {'reduce_domains': False},
+}
+# モデルの形に関わらないので、組み立て直すときに build_shift_model へ渡さないキーワード引数
+_SOLVE_ONLY_OPTIONS = ('solver_profile', 'time_limit', 'objective_mode', 'profile_build', 'explain_failure', 'greedy_draft', 'snapshot_path')
+
+
+def write_snapshot(path, args, options, model, stages=None):
+    """モデルと入力をスナップショットのファイルに書き出す（ディレクトリがなければ作る）
+
+    stages（lexicographic_stages の結果）を渡すと、各段階の式を meta.json の lexicographic_stages に入れます。
+    """
+    proto = model.Proto()
+    model_text = str(proto)
+    meta = {
+        'created_at': datetime.datetime.now().isoformat(timespec="seconds"),
+        'solver_version': _solver_version(),
+        'staff_count': len(args[INPUT_FIELDS.index('staff_names')]),
+        'num_variables': len(proto.variables),
+        'num_constraints': len(proto.constraints),
+        'objective_mode': options.get('objective_mode', "weighted"),
+    }
+    if stages is not None:
+        # 式を変数の番号と係数にするため、一度その式を目的関数にしてから元（重み付きの合計）に戻す
+        weighted = str(proto.objective)
+        meta['lexicographic_stages'] = []
+        for name, expression in stages:
+            model.Minimize(expression)
+            meta['lexicographic_stages'].append({
+                'stage': name, 'vars': list(proto.objective.vars), 'coeffs': list(proto.objective.coeffs), 'offset': proto.objective.offset,
+            })
+        proto.objective.parse_text_format(weighted)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("model.pbtxt", model_text)
+        archive.writestr("inputs.json", _dumps({'args': serialize_inputs(args), 'options': options}))
+        archive.writestr("meta.json", _dumps(meta))
+
+
+def add_snapshot_result(path, solve_info):
+    """解き終わったあとの結果を、スナップショットに書き足す"""
+    result = {key: solve_info.get(key) for key in ('solver_status', 'objective', 'best_bound', 'wall_time', 'build_time', 'solver_parameters', 'search_timeline', 'lexicographic_stages')}
+    with zipfile.ZipFile(path, "a", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("result.json", _dumps(result))
+
+
+def read_snapshot(path):
+    """スナップショットを読み、model（CpModelProto のテキスト形式）・args・options・meta・result の辞書を返す"""
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        model_text = archive.read("model.pbtxt").decode("utf-8")
+        inputs = json.loads(archive.read("inputs.json"))
+        meta = json.loads(archive.read("meta.json"))
+        result = json.loads(archive.read("result.json")) if "result.json" in names else None
+    return {
+        'model': model_text,
+        'args': tuple(inputs['args'][field] for field in INPUT_FIELDS),
+        'options': restore_options(inputs['options']),
+        'meta': meta,
+        'result': result,
+    }
+
+
+def list_snapshots(path):
+    """ディレクトリ（またはファイル1つ）にあるスナップショットのパスを名前順に返す"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".zip"))
+    return [path]
+
+
+def _build_variant(snapshot, variant_options):
+    """保存した入力から、今のコードでモデルを組み立て直す（create_shift_schedule と同じく下書きをヒントにする）"""
+    from raypyon.core import build_shift_model, carry_over_fixed_shifts
+    from raypyon.greedy import build_greedy_schedule
+
+    args = list(snapshot['args'])
+    options = {key: value for key, value in snapshot['options'].items() if key not in _SOLVE_ONLY_OPTIONS}
+    if options.get('carry_over'):
+        fixed_index = INPUT_FIELDS.index('fixed_shifts')
+        args[fixed_index] = list(args[fixed_index]) + carry_over_fixed_shifts(options['carry_over'], args[INPUT_FIELDS.index('staff_names')])
+    draft_df, _ = build_greedy_schedule(*args)
+    return build_shift_model(*args, **{**options, **variant_options}, hint_schedule=draft_df, profile_build=True)
+
+
+def _linear_expression(model, objective):
+    """目的関数の形（vars・coeffs・offset）を、model の変数の式に戻す（制約にも使えるよう定数は整数にする）"""
+    expression = round(objective['offset'])
+    for ref, coeff in zip(objective['vars'], objective['coeffs']):
+        # 負の番号は、その変数の符号を反転したもの
+        if ref >= 0:
+            expression += coeff * model.GetIntVarFromProtoIndex(ref)
+        else:
+            expression -= coeff * model.GetIntVarFromProtoIndex(-ref - 1)
+    return expression
+
+
+@functools.cache
+def _first_solution_callback_class():
+    from ortools.sat.python import cp_model
+
+    class FirstSolutionCallback(cp_model.CpSolverSolutionCallback):
+        """解が見つかるたびに、経過時間と目的関数値を記録する"""
+
+        def __init__(self):
+            super().__init__()
+            self.solutions = []
+
+        def OnSolutionCallback(self):
+            self.solutions.append({'elapsed': self.WallTime(), 'objective': self.ObjectiveValue()})
+
+    return FirstSolutionCallback
+
+
+def replay_snapshot(snapshot, variant="captured", solver_profile=DEFAULT_SOLVER_PROFILE, params=None, time_limit=None):
+    """スナップショットを1つの設定で解き直し、計測結果を返す
+
+    params は計算プロファイルの上に重ねるソルバーのパラメータ（{名前: 値}）です。
+    段階ごとに最小化したスナップショットは solve_stages で同じ順に解き直し、目的関数値は重み付きの合計で返します。
+    """
+    from ortools.sat.python import cp_model
+
+    lexicographic = snapshot['meta'].get('objective_mode') == "lexicographic"
+    build_time = None
+    if VARIANTS[variant] is None:
+        model = cp_model.CpModel()
+        model.Proto().parse_text_format(snapshot['model'])
+        if lexicographic:
+            proto_objective = model.Proto().objective
+            weighted = _linear_expression(model, {
+                'vars': list(proto_objective.vars), 'coeffs': list(proto_objective.coeffs), 'offset': proto_objective.offset,
+            })
+            stages = [(stage['stage'], _linear_expression(model, stage)) for stage in snapshot['meta']['lexicographic_stages']]
+    else:
+        shift_model = _build_variant(snapshot, VARIANTS[variant])
+        model, build_time = shift_model.model, shift_model.build_time
+        if lexicographic:
+            weighted, stages = shift_model.objective, lexicographic_stages(shift_model)
+
+    if lexicographic:
+        return _replay_stages(model, stages, weighted, variant, solver_profile, params, time_limit, build_time)
+    return _replay_single(model, variant, solver_profile, params, time_limit, build_time)
+
+
+def _replay_single(model, variant, solver_profile, params, time_limit, build_time):
+    from ortools.sat.python import cp_model
+    from raypyon.telemetry import SearchLog, search_timeline
+
+    solver = cp_model.CpSolver()
+    applied = apply_solver_profile(solver, solver_profile, time_limit)
+    for name, value in (params or {}).items():
+        setattr(solver.parameters, name, value)
+        applied[name] = value
+    search_log = SearchLog()
+    search_log.attach(solver)
+    callback = _first_solution_callback_class()()
+    started_at = time.perf_counter()
+    status = solver.Solve(model, callback)
+    wall_time = time.perf_counter() - started_at
+
+    solved = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    objective = solver.ObjectiveValue() if solved else None
+    timeline = search_timeline(search_log, solver)
+    return {
+        'variant': variant,
+        'solver_profile': solver_profile,
+        'solver_parameters': applied,
+        'solver_status': solver.StatusName(status),
+        'build_time': build_time,
+        'num_variables': len(model.Proto().variables),
+        'num_constraints': len(model.Proto().constraints),
+        'time_to_first_solution': callback.solutions[0]['elapsed'] if callback.solutions else None,
+        'first_objective': callback.solutions[0]['objective'] if callback.solutions else None,
+        'num_solutions': len(callback.solutions),
+        'objective': objective,
+        'best_bound': solver.BestObjectiveBound() if solved else None,
+        'wall_time': wall_time,
+        'presolve_time': timeline.get('presolve_time'),
+        'search_timeline': timeline,
+    }
+
+
+def _replay_stages(model, stages, weighted, variant, solver_profile, params, time_limit, build_time):
+    from ortools.sat.python import cp_model
+
+    callbacks = []
+
+    def make_callback():
+        callbacks.append(_first_solution_callback_class()())
+        return callbacks[-1]
+
+    started_at = time.perf_counter()
+    solver, status, stage_results, applied = solve_stages(model, stages, solver_profile, time_limit, make_callback=make_callback, params=params)
+    wall_time = time.perf_counter() - started_at
+
+    solved = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    first = callbacks[0].solutions[0] if callbacks and callbacks[0].solutions else None
+    timeline = stage_results[0]['search_timeline'] if stage_results else {}
+    return {
+        'variant': variant,
+        'solver_profile': solver_profile,
+        'solver_parameters': applied,
+        'solver_status': solver.StatusName(status),
+        'build_time': build_time,
+        'num_variables': len(model.Proto().variables),
+        'num_constraints': len(model.Proto().constraints),
+        # 最初の解は1段階目のもの（目的関数値も1段階目の式の値）
+        'time_to_first_solution': first['elapsed'] if first else None,
+        'first_objective': first['objective'] if first else None,
+        'num_solutions': sum(len(callback.solutions) for callback in callbacks),
+        'objective': solver.Value(weighted) if solved else None,
+        'best_bound': None,
+        'wall_time': wall_time,
+        'presolve_time': timeline.get('presolve_time'),
+        'search_timeline': timeline,
+        'lexicographic_stages': stage_results,
+    }
+
+
+def replay_corpus(paths, variants=("captured",), profiles=(DEFAULT_SOLVER_PROFILE,), params=None, time_limit=None):
+    """スナップショットを設定の組み合わせごとに解き直し、終わった順に結果を返すジェネレーター"""
+    for path in paths:
+        snapshot = read_snapshot(path)
+        for variant in variants:
+            for profile in profiles:
+                record = replay_snapshot(snapshot, variant, profile, params, time_limit)
+                yield {
+                    'snapshot': os.path.basename(path),
+                    'captured_solver_version': snapshot['meta']['solver_version'],
+                    'captured_result': snapshot['result'],
+                    'solver_version': _solver_version(),
+                    **record,
+                }
+
+
+def _parse_param(text):
+    name, _, value = text.partition("=")
+    if not name or not value:
+        raise argparse.ArgumentTypeError(f"名前=値 の形で指定してください: {text}")
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        # 列挙型の名前などはそのまま文字列で渡す
+        pass
+    return name, value
+
+
+def main(argv=None):
+    from raypyon.batch import load_configs, solve_config
+
+    parser = argparse.ArgumentParser(description="CP-SATモデルのスナップショットを作り、解き直して比べます。")
+    commands = parser.add_subparsers(dest="command", required=True)
+    capture_parser = commands.add_parser("capture", help="raypyon.batch の形式の設定を解き、スナップショットを書き出す")
+    capture_parser.add_argument("input", help="設定の .json を置いたディレクトリ、または .json / .jsonl ファイル")
+    capture_parser.add_argument("--output-dir", default=DEFAULT_SNAPSHOT_DIR)
+    capture_parser.add_argument("--profile", choices=list(SOLVER_PROFILES), default=DEFAULT_SOLVER_PROFILE)
+    capture_parser.add_argument("--time-limit", type=float, default=None)
+    replay_parser = commands.add_parser("replay", help="スナップショットを設定の組み合わせごとに解き直す")
+    replay_parser.add_argument("input", help="スナップショットのディレクトリ、またはファイル")
+    replay_parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=["captured"])
+    replay_parser.add_argument("--profiles", nargs="+", choices=list(SOLVER_PROFILES), default=[DEFAULT_SOLVER_PROFILE])
+    replay_parser.add_argument("--param", type=_parse_param, action="append", default=[],
+                               help="計算プロファイルの上に重ねるソルバーのパラメータ（例: linearization_level=2）")
+    replay_parser.add_argument("--time-limit", type=float, default=None, help="1回あたりの制限時間（秒）")
+    replay_parser.add_argument("--output", default="-", help="結果のJSONLの書き出し先（既定は標準出力）")
+    args = parser.parse_args(argv)
+
+    if args.command == "capture":
+        for config in load_configs(args.input):
+            path = os.path.join(args.output_dir, f"{config['ward']}_{config.get('year')}{config.get('month', 0):02d}.zip")
+            # スナップショットは create_shift_schedule の中で書くので、LNS ではなく1つのモデルで解く
+            result = solve_config({**config, 'search': "cpsat"}, args.profile, args.time_limit, snapshot_path=path)
+            print(f"{path}: {result['status']}", file=sys.stderr)
+        return 0
+
+    output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    try:
+        for record in replay_corpus(list_snapshots(args.input), args.variants, args.profiles, dict(args.param), args.time_limit):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            first = record['time_to_first_solution']
+            print(
+                f"{record['snapshot']} {record['variant']}/{record['solver_profile']}: {record['solver_status']} / "
+                f"最初の解 {'なし' if first is None else f'{first:.2f}s'} / 目的関数値 {record['objective']} / "
+                f"計算 {record['wall_time']:.2f}s",
+                file=sys.stderr,
+            )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""優先度（ペナルティの重み）の組み合わせをまとめて試す
+
+希望休の優先度・公平性の優先度・日勤不足と連勤超過の重みは互いに影響し合うので、
+1つずつ変えて解き直すと時間がかかります。ここでは重みの格子点をプロセスプールで並列に解き、
+叶わなかった希望・日勤の不足・当直回数の差がどう変わるかを一覧にします。
+
+格子点は、互いに離れたものから順に解きます。最初の数点のあとは、解き終わった中で重みが最も近い点の結果を
+ヒント（前回のシフト）として渡すので、近い点どうしで探索をやり直さずに済みます。
+
+画面からは、SolverService のジョブ（raypyon.worker）として、同時に解く数を1つにして実行します
+（同時に解く数はジョブの列が決めるため）。このときはプロセスプールを作らず、ジョブのプロセスの中で順に解きます。
+コマンドとして実行したときの設定の形式は raypyon.batch と同じで、結果は終わったものから順に1行1件のJSONLで書き出します。
+
+使い方:
+    python -m raypyon.sweep ward.json --holiday-priorities 40 80 --fairness-priorities 20 40 80 --time-limit 10
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from raypyon.core import (
+    CONSECUTIVE_OVER_WEIGHT, DEFAULT_SOLVER_PROFILE, NIKKIN_SHORTAGE_WEIGHT, SOLVER_PROFILES, create_shift_schedule,
+)
+
+WEIGHT_FIELDS = ('holiday_request_priority', 'fairness_priority', 'nikkin_shortage_weight', 'consecutive_over_weight')
+# 小さいほど良い指標（パレート最適の判定に使う）
+TRADE_OFF_FIELDS = ('missed_requests', 'nikkin_shortage', 'consecutive_over', 'duty_difference')
+
+
+def weight_grid(holiday_request_priorities, fairness_priorities, nikkin_shortage_weights=(NIKKIN_SHORTAGE_WEIGHT,), consecutive_over_weights=(CONSECUTIVE_OVER_WEIGHT,)):
+    """重みの候補の組み合わせを、{重みの名前: 値} のリストにする"""
+    values = (holiday_request_priorities, fairness_priorities, nikkin_shortage_weights, consecutive_over_weights)
+    return [dict(zip(WEIGHT_FIELDS, combination)) for combination in itertools.product(*values)]
+
+
+def _weight_distance(a, b, scales):
+    return sum(abs(a[field] - b[field]) / scales[field] for field in WEIGHT_FIELDS)
+
+
+def _spread_order(grid, scales):
+    """格子点を、それまでに選んだ点から最も離れた点を次に選ぶ順に並べる"""
+    remaining = list(grid)
+    ordered = [remaining.pop(0)]
+    while remaining:
+        farthest = max(remaining, key=lambda point: min(_weight_distance(point, chosen, scales) for chosen in ordered))
+        remaining.remove(farthest)
+        ordered.append(farthest)
+    return ordered
+
+
+def solve_point(args, weights, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None, hint=None):
+    """1つの重みの組み合わせで解き、比較用の結果を返す（hint は近い点のシフト表）"""
+    df, status, unfulfilled, solve_info = create_shift_schedule(
+        **{**args, **weights},
+        previous_schedule=hint,
+        solver_profile=solver_profile,
+        time_limit=time_limit,
+        explain_failure=False,
+    )
+    return {
+        'weights': weights,
+        'status': status,
+        'schedule': df,
+        'unfulfilled_requests': unfulfilled,
+        'objective': solve_info.get('objective'),
+        'objective_breakdown': solve_info.get('objective_breakdown'),
+        'solve_info': solve_info,
+    }
+
+
+def solve_sweep(args, grid, max_workers=None, solver_profile=DEFAULT_SOLVER_PROFILE, time_limit=None):
+    """格子点をプロセスプールで並列に解き、終わった順に結果を返すジェネレーター
+
+    args は create_shift_schedule の引数の辞書（重みの値は grid のもので上書きします）です。
+    max_workers が1のときは、プロセスプールを作らずにこのプロセスで順に解きます。
+    """
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // 8)
+    scales = {field: max(1, max(point[field] for point in grid)) for field in WEIGHT_FIELDS}
+    pending = _spread_order(grid, scales)
+    solved = []
+
+    def nearest_schedule(weights):
+        candidates = [result for result in solved if result['schedule'] is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda result: _weight_distance(weights, result['weights'], scales))['schedule']
+
+    if max_workers == 1:
+        for weights in pending:
+            result = solve_point(args, weights, solver_profile, time_limit, nearest_schedule(weights))
+            solved.append(result)
+            yield result
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as executor:
+        running = set()
+        while pending or running:
+            while pending and len(running) < max_workers:
+                weights = pending.pop(0)
+                running.add(executor.submit(solve_point, args, weights, solver_profile, time_limit, nearest_schedule(weights)))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                solved.append(result)
+                yield result
+
+
+def mark_pareto(results):
+    """解けた結果のうち、どの指標でも他に負けていないもの（パレート最適）に result['pareto'] = True をつける"""
+    scored = [result for result in results if result['objective_breakdown'] is not None]
+    for result in results:
+        result['pareto'] = False
+    for result in scored:
+        own = [result['objective_breakdown'][field] for field in TRADE_OFF_FIELDS]
+        result['pareto'] = not any(
+            all(o <= s for o, s in zip(other_values, own)) and other_values != own
+            for other_values in ([other['objective_breakdown'][field] for field in TRADE_OFF_FIELDS] for other in scored)
+        )
+    return results
+
+
+def _to_json(result):
+    record = {key: value for key, value in result.items() if key != 'schedule'}
+    if result['schedule'] is not None:
+        record['schedule'] = {name: list(row) for name, row in result['schedule'].iterrows()}
+    return record
+
+
+def main(argv=None):
+    from raypyon.batch import DEFAULT_SETTINGS, REQUIRED_FIELDS
+
+    parser = argparse.ArgumentParser(description="優先度・重みの組み合わせをまとめて解き、結果を比べます。")
+    parser.add_argument("input", help="設定の .json ファイル（- なら標準入力）")
+    parser.add_argument("--holiday-priorities", type=int, nargs="+", default=[DEFAULT_SETTINGS['holiday_request_priority']])
+    parser.add_argument("--fairness-priorities", type=int, nargs="+", default=[DEFAULT_SETTINGS['fairness_priority']])
+    parser.add_argument("--nikkin-weights", type=int, nargs="+", default=[NIKKIN_SHORTAGE_WEIGHT])
+    parser.add_argument("--consecutive-weights", type=int, nargs="+", default=[CONSECUTIVE_OVER_WEIGHT])
+    parser.add_argument("--jobs", type=int, default=None, help="同時に解く数（既定はコア数の8分の1）")
+    parser.add_argument("--time-limit", type=float, default=None, help="1つの組み合わせあたりの制限時間（秒）")
+    parser.add_argument("--profile", choices=list(SOLVER_PROFILES), default=DEFAULT_SOLVER_PROFILE)
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        config = json.load(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            config = json.load(f)
+    missing = [field for field in REQUIRED_FIELDS if field not in config]
+    if missing:
+        parser.error(f"必須の項目がありません: {', '.join(missing)}")
+    solve_args = {**DEFAULT_SETTINGS, **{key: value for key, value in config.items() if key in REQUIRED_FIELDS or key in DEFAULT_SETTINGS}}
+    for field in ('holiday_requests', 'work_requests'):
+        solve_args[field] = {name: [int(day) for day in days] for name, days in solve_args[field].items()}
+
+    grid = weight_grid(args.holiday_priorities, args.fairness_priorities, args.nikkin_weights, args.consecutive_weights)
+    for result in solve_sweep(solve_args, grid, max_workers=args.jobs, solver_profile=args.profile, time_limit=args.time_limit):
+        sys.stdout.write(json.dumps(_to_json(result), ensure_ascii=False, default=str) + "\n")
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
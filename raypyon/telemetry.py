@@ -0,0 +1,125 @@
+"""ソルバーの探索ログの記録と解析
+
+制限時間の30秒が、前処理（presolve）・LPの計算・最初の解を探すことのどれに使われているかは、
+応答の統計だけでは分かりません。ここでは CP-SAT の探索ログ（log_search_progress）を画面に出さずに集め、
+次のものを取り出して1回の求解の記録（タイムライン）にします。
+
+- 前処理にかかった時間と、前処理の前後のモデルの大きさ、前処理で使われた規則の回数
+- 解と下界が更新された時刻・値と、それを見つけたワーカー（サブソルバー）
+- ワーカーごとに最良解を最初に更新した時刻、ワーカーごとに見つけた解の数、探索の統計（衝突・分岐の回数など）
+- 応答の統計（solver_statistics）
+
+ログの書式は ortools の版で変わることがあるので、読めなかった行は無視します。
+"""
+import re
+
+from raypyon.core import solver_statistics
+
+# "#12  2.46s best:1480  next:[240,1470] rnd_var_lns (...)" のような、解・下界・終了の行
+_EVENT_LINE = re.compile(r"^#(\d+|Bound|Done|Model)\s+([\d.]+)s\s*(.*)$")
+_BEST = re.compile(r"best:(\S+)")
+_NEXT = re.compile(r"next:\[([^,\]]*),?([^\]]*)\]\s*([^\s(]*)")
+_SEARCH_START = re.compile(r"^Starting search at ([\d.]+)s with (\d+) workers")
+_PRESOLVE_RULE = re.compile(r"^\s*- rule '(.+)' was applied ([\d']+) times?")
+_VARIABLES = re.compile(r"^#Variables: ([\d']+)")
+_CONSTRAINT = re.compile(r"^#k\w+: ([\d']+)")
+# 解析するログの末尾の表（見出しの先頭の文字列 → 記録の名前）
+_TABLES = {"Search stats": 'search_stats', "Solutions": 'solutions_by_worker'}
+
+
+class SearchLog:
+    """CP-SAT の探索ログを、標準出力に出さずに行のリストとして集める"""
+
+    def __init__(self):
+        self.lines = []
+
+    def attach(self, solver):
+        solver.parameters.log_search_progress = True
+        solver.parameters.log_to_stdout = False
+        solver.log_callback = self._add
+
+    def _add(self, message):
+        # 表などは複数行をまとめて1回で渡してくるので、行に分ける
+        self.lines.extend(message.split("\n"))
+
+
+def _number(text):
+    text = text.replace("'", "")
+    if text in ("", "inf", "-inf"):
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        return text
+    return int(value) if value.is_integer() else value
+
+
+def _parse_table(lines, start):
+    """見出しの行 start の次から、"'名前': 値 値 ..." の行を {名前: {列: 値}} にする"""
+    columns = lines[start].split()[2:] if lines[start].startswith("Search stats") else ["Num", "Rank"]
+    rows = {}
+    for line in lines[start + 1:]:
+        name, separator, values = line.strip().partition("':")
+        if not separator or not name.startswith("'"):
+            break
+        rows[name[1:]] = {column: _number(value) for column, value in zip(columns, values.split())}
+    return rows
+
+
+def parse_search_log(lines):
+    """探索ログの行から、タイムラインの辞書を作る（読めなかった項目は入りません）"""
+    timeline = {'events': [], 'presolve_rules': {}}
+    model_section = None
+    for index, line in enumerate(lines):
+        if line.startswith("Initial optimization model"):
+            model_section = timeline.setdefault('initial_model', {'variables': None, 'constraints': 0})
+            continue
+        if line.startswith("Presolved optimization model"):
+            model_section = timeline['presolved_model'] = {'variables': None, 'constraints': 0}
+            continue
+        if model_section is not None:
+            if match := _VARIABLES.match(line):
+                model_section['variables'] = _number(match.group(1))
+                continue
+            if match := _CONSTRAINT.match(line):
+                model_section['constraints'] += _number(match.group(1))
+                continue
+            if not line.strip():
+                model_section = None
+        if match := _PRESOLVE_RULE.match(line):
+            timeline['presolve_rules'][match.group(1)] = _number(match.group(2))
+        elif match := _SEARCH_START.match(line):
+            timeline['presolve_time'] = float(match.group(1))
+            timeline['num_workers'] = int(match.group(2))
+        elif match := _EVENT_LINE.match(line):
+            tag, elapsed, rest = match.groups()
+            kind = {"Bound": "bound", "Done": "done", "Model": "model"}.get(tag, "solution")
+            event = {'kind': kind, 'time': float(elapsed)}
+            if kind in ("solution", "bound"):
+                best, bounds = _BEST.search(rest), _NEXT.search(rest)
+                event['objective'] = _number(best.group(1)) if best else None
+                event['bound'] = _number(bounds.group(1)) if bounds else None
+                event['worker'] = bounds.group(3) if bounds else None
+            elif kind == "done":
+                event['worker'] = rest.split()[0] if rest.split() else None
+            timeline['events'].append(event)
+        else:
+            for title, key in _TABLES.items():
+                if line.startswith(title):
+                    timeline[key] = _parse_table(lines, index)
+
+    # 解の行（#1, #2, ...）は全体の最良解が良くなったときだけ出るので、ワーカーごとに分かるのは最初の解ではなく、
+    # 最良解を最初に更新した時刻です（見つけた解の数は solutions_by_worker にあります）。
+    # 全体の最初の解は必ず最良解の更新なので、最初の解が出るまでの時間はここから分かります
+    first_improvements = {}
+    for event in timeline['events']:
+        if event['kind'] == "solution" and event['worker'] not in first_improvements:
+            first_improvements[event['worker']] = {'worker': event['worker'], 'time': event['time'], 'objective': event['objective']}
+    timeline['first_improvements'] = list(first_improvements.values())
+    timeline['time_to_first_solution'] = timeline['first_improvements'][0]['time'] if first_improvements else None
+    return timeline
+
+
+def search_timeline(search_log, solver):
+    """集めたログと解き終わったソルバーから、1回の求解のタイムラインを作る"""
+    return {**parse_search_log(search_log.lines), 'statistics': solver_statistics(solver)}
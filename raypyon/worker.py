@@ -0,0 +1,395 @@
+"""ソルバーを画面とは別のプロセスで動かすジョブキュー
+
+画面のスクリプトの中でソルバーを回すと、その間は画面の操作ができず、複数の人が同じサーバーで同時に
+作成すると、ソルバーどうしが同じCPUを取り合います。SolverService はジョブを順番待ちの列に入れ、
+同時に解く数を max_workers までに抑えて、別プロセス（python -m raypyon.worker）で1ジョブずつ解きます。
+画面側はジョブIDで状態・暫定解・結果を読みに来るだけなので、待っている間も操作を続けられます。
+
+外部のサービスは使わず、1台のマシンの中で完結します。
+子プロセスとは標準入出力で pickle をやり取りします（同じマシンの自分のプロセスどうしなので安全です）。
+子プロセスは起動しておいて次のジョブにも使い回すので、起動の時間（1秒ほど）がかからず、
+モデルのひな形（model_template）のキャッシュも効きます。作り直すのは、取り消しで強制終了したときと、
+WORKER_MAX_JOBS 件解いたとき（メモリが増え続けないように）だけです。
+プロセスプールを使わないのは、Streamlit の中から作ると子プロセスが画面のスクリプトを読み込み直してしまうためです。
+
+使い方:
+    service = SolverService(max_workers=2)
+    job_id = service.submit("schedule", solve_args, {'solver_profile': "balanced"})
+    service.status(job_id)   # 状態・順番待ちの位置・暫定解・結果
+    service.stop(job_id)     # その時点の最良解で打ち切る
+    service.cancel(job_id)   # 結果を捨てて取り消す
+"""
+import collections
+import os
+import pickle
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+from raypyon.core import SolveProgress
+
+JOB_KINDS = ("schedule", "alternatives", "sweep")
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED_STATES = ("done", "failed", "cancelled")
+# 終わったジョブの結果を、読みに来なくても残しておく時間（秒）
+JOB_RETENTION_SECONDS = 3600
+# 1つの子プロセスで続けて解くジョブの数の上限
+WORKER_MAX_JOBS = 50
+
+# 子プロセスが raypyon を読み込めるよう、パッケージの1つ上のディレクトリで起動する
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _WorkerProcess:
+    """計算用の子プロセス1つ。ジョブを送ってイベントを読み、終わっても次のジョブのために残しておく"""
+
+    def __init__(self):
+        # 取り消すときに、子プロセスが作ったプロセスもまとめて終了できるよう、別のプロセスグループにする
+        self.popen = subprocess.Popen(
+            [sys.executable, "-m", "raypyon.worker"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=_PACKAGE_ROOT,
+            start_new_session=True)
+        self.jobs_done = 0
+        # ジョブは解くスレッドから、打ち切りは画面のスレッドから送るので、書き込みが混ざらないようにする
+        self._write_lock = threading.Lock()
+
+    def alive(self):
+        return self.popen.poll() is None
+
+    def send(self, message):
+        """メッセージを送る（子プロセスがもう終わっていれば False）"""
+        try:
+            with self._write_lock:
+                pickle.dump(message, self.popen.stdin)
+                self.popen.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            return False
+        return True
+
+    def receive(self):
+        """次のイベントを読む（子プロセスが終わっていれば None）"""
+        try:
+            return pickle.load(self.popen.stdout)
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            return None
+
+    def kill(self):
+        if self.popen.returncode is None:
+            try:
+                os.killpg(self.popen.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def close(self):
+        self.kill()
+        self.popen.wait()
+        for pipe in (self.popen.stdin, self.popen.stdout):
+            try:
+                pipe.close()
+            except BrokenPipeError:
+                pass
+
+
+class SolverService:
+    """ジョブの順番待ちの列と、ジョブを1つずつ子プロセスで解くスレッドを持つ
+
+    max_workers を省略したときは、ソルバー1つがコアを8つ使う想定で同時に解く数を決めます（最低1つ）。
+    """
+
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 1) // 8)
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._queue_changed = threading.Condition(self._lock)
+        self._jobs = {}
+        self._queue = collections.deque()
+        for _ in range(max_workers):
+            threading.Thread(target=self._run_jobs, daemon=True).start()
+
+    def submit(self, kind, args, options=None):
+        """ジョブを列に入れて、ジョブIDを返す
+
+        kind が "schedule" なら create_shift_schedule、"alternatives" なら find_alternative_schedules を
+        args（位置引数のタプル）と options（キーワード引数）で呼びます。
+        "sweep" は options['grid'] の重みの組み合わせを1つずつ解きます（raypyon.sweep.solve_sweep）。
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"不明なジョブの種類です: {kind}")
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'args': tuple(args),
+            'options': dict(options or {}),
+            'state': "queued",
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'draft': None,
+            'incumbents': [],
+            'result': None,
+            'alternatives': [],
+            'sweep_points': [],
+            'error': None,
+            'stop_requested': False,
+            'worker': None,
+            'payload_sent': False,
+        }
+        with self._queue_changed:
+            self._prune()
+            self._jobs[job_id] = job
+            self._queue.append(job_id)
+            self._queue_changed.notify()
+        return job_id
+
+    def status(self, job_id):
+        """ジョブの状態の写しを返す（ないか、期限切れで消えたときは None）
+
+        state は queued・running・done・failed・cancelled のいずれかで、queued のときは
+        queue_position（前に何件あるか）が入ります。done のときの result は create_shift_schedule と同じ
+        (シフト表, 状態, 叶わなかった希望, 求解の情報) です。
+        sweep のときは、解き終わった組み合わせの結果が sweep_points に順に入り、result はそれに
+        パレート最適の印をつけたリストです（打ち切ったときは、それまでに解いた分）。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {key: value for key, value in job.items() if key not in ('args', 'options', 'worker', 'payload_sent')}
+            snapshot['incumbents'] = list(job['incumbents'])
+            snapshot['sweep_points'] = list(job['sweep_points'])
+            snapshot['queue_position'] = self._queue.index(job_id) if job['state'] == "queued" else None
+            return snapshot
+
+    def stop(self, job_id):
+        """解いている途中なら、その時点の最良解で打ち切る（順番待ちなら取り消す）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['state'] in FINISHED_STATES:
+                return
+            if job['state'] == "queued":
+                self._cancel_queued(job)
+                return
+            job['stop_requested'] = True
+            # 入力を送り終わる前なら、送ったあとに _communicate が伝える
+            worker = job['worker'] if job['payload_sent'] else None
+        if worker is not None:
+            worker.send({'type': "stop", 'job_id': job_id})
+
+    def cancel(self, job_id):
+        """ジョブを取り消す（解いている途中なら子プロセスを終了し、結果は捨てる）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['state'] in FINISHED_STATES:
+                return
+            if job['state'] == "queued":
+                self._cancel_queued(job)
+                return
+            job['state'] = "cancelled"
+            worker = job['worker']
+        if worker is not None:
+            worker.kill()
+
+    def forget(self, job_id):
+        """結果を読み終わったジョブを消す（終わっていなければ先に取り消す）"""
+        self.cancel(job_id)
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _cancel_queued(self, job):
+        self._queue.remove(job['id'])
+        job['state'] = "cancelled"
+        job['finished_at'] = time.time()
+
+    def _prune(self):
+        expired_before = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['finished_at'] is not None and job['finished_at'] < expired_before]:
+            del self._jobs[job_id]
+
+    def _run_jobs(self):
+        worker = None
+        while True:
+            # 最初のジョブを待たせないよう、子プロセスは列が空のうちに起動しておく
+            if worker is not None and not worker.alive():
+                worker.close()
+                worker = None
+            if worker is None:
+                try:
+                    worker = _WorkerProcess()
+                except OSError:
+                    worker = None
+            with self._queue_changed:
+                while not self._queue:
+                    self._queue_changed.wait()
+                job = self._jobs[self._queue.popleft()]
+                job['state'] = "running"
+                job['started_at'] = time.time()
+                if worker is None:
+                    job['state'] = "failed"
+                    job['error'] = "計算用のプロセスを起動できませんでした。"
+                    job['finished_at'] = time.time()
+                    continue
+                job['worker'] = worker
+            reusable = False
+            try:
+                reusable = self._communicate(job, worker)
+            except Exception:
+                with self._lock:
+                    job['error'] = traceback.format_exc()
+            worker.jobs_done += 1
+            # 取り消し（強制終了）や異常終了のあと、または解いた数が上限に達したら、次のジョブは新しいプロセスで解く
+            if not reusable or worker.jobs_done >= WORKER_MAX_JOBS:
+                worker.close()
+            with self._lock:
+                job['worker'] = None
+                if job['state'] == "running":
+                    job['state'] = "done" if job['result'] is not None else "failed"
+                    if job['state'] == "failed" and job['error'] is None:
+                        job['error'] = f"計算用のプロセスが終了コード {worker.popen.returncode} で終了しました。"
+                job['finished_at'] = time.time()
+
+    def _communicate(self, job, worker):
+        """ジョブを送り、結果が届くまでイベントを読む。子プロセスを次のジョブにも使えるなら True を返す"""
+        if not worker.send({'type': "job", 'id': job['id'], 'kind': job['kind'], 'args': job['args'], 'options': job['options']}):
+            # 入力を送っている間に取り消された
+            return False
+        with self._lock:
+            job['payload_sent'] = True
+            stop_requested = job['stop_requested']
+        if stop_requested:
+            worker.send({'type': "stop", 'job_id': job['id']})
+
+        while True:
+            event = worker.receive()
+            if event is None:
+                return False
+            with self._lock:
+                if event['type'] == "draft":
+                    job['draft'] = event['schedule']
+                elif event['type'] == "incumbent":
+                    job['incumbents'].append(event['incumbent'])
+                elif event['type'] == "sweep_point":
+                    job['sweep_points'].append(event['result'])
+                elif event['type'] == "result":
+                    job['result'] = event['result']
+                    job['alternatives'] = event['alternatives']
+                    return True
+                elif event['type'] == "error":
+                    job['error'] = event['error']
+                    return True
+
+
+class _StreamingProgress(SolveProgress):
+    """暫定解と下書きを、見つかるたびに親プロセスへ送る SolveProgress"""
+
+    def __init__(self, emit):
+        self._emit = emit
+        super().__init__()
+
+    @property
+    def draft(self):
+        return self._draft
+
+    @draft.setter
+    def draft(self, schedule):
+        self._draft = schedule
+        if schedule is not None:
+            self._emit({'type': "draft", 'schedule': schedule})
+
+    def report(self, incumbent):
+        super().report(incumbent)
+        self._emit({'type': "incumbent", 'incumbent': incumbent})
+
+
+def run_job(job, progress=None, on_sweep_point=None):
+    """ジョブを1つ解き、(create_shift_schedule と同じ形の結果, シフト案のリスト) を返す
+
+    sweep のときは (組み合わせごとの結果のリスト, []) を返し、1つ解くたびに on_sweep_point を呼びます。
+    """
+    from raypyon.alternatives import find_alternative_schedules
+    from raypyon.core import create_shift_schedule
+
+    if job['kind'] == "sweep":
+        from raypyon.history import INPUT_FIELDS
+        from raypyon.sweep import mark_pareto, solve_sweep
+
+        options = dict(job['options'])
+        grid = options.pop('grid')
+        results = []
+        # 同時に解く数は SolverService が決めるので、ジョブの中では1つずつ解く。打ち切りは組み合わせの区切りで効く
+        for result in solve_sweep(dict(zip(INPUT_FIELDS, job['args'])), grid, max_workers=1, **options):
+            results.append(result)
+            if on_sweep_point is not None:
+                on_sweep_point(result)
+            if progress is not None and progress.stop_requested:
+                break
+        return mark_pareto(results), []
+    if job['kind'] == "schedule":
+        return create_shift_schedule(*job['args'], **job['options'], progress=progress), []
+    alternatives, solve_info = find_alternative_schedules(*job['args'], **job['options'], progress=progress)
+    if not alternatives:
+        return (None, "failed", [], solve_info), []
+    # 案は目的関数値の良い順なので、先頭を結果として返す
+    best = alternatives[0]
+    best_info = {**solve_info, 'objective': best['objective'], 'best_bound': best['best_bound'], 'solver_status': best['solver_status'],
+                 'search_timeline': best['search_timeline']}
+    return (best['schedule'], "success", best['unfulfilled_requests'], best_info), alternatives
+
+
+def main():
+    # 結果は元の標準出力に pickle で書く。ライブラリが標準出力に書いても混ざらないよう、以降の出力は標準エラーに回す
+    events = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    emit_lock = threading.Lock()
+
+    def emit(event):
+        with emit_lock:
+            pickle.dump(event, events)
+            events.flush()
+
+    # 標準入力は別のスレッドで読み続け、ジョブは列に入れ、打ち切りはそのジョブの progress に伝える。
+    # progress はジョブを受け取った時点で作るので、解き始める前に届いた打ち切りも失われない
+    jobs = queue.Queue()
+    progresses = {}
+
+    def read_messages():
+        while True:
+            try:
+                message = pickle.load(sys.stdin.buffer)
+            except (EOFError, pickle.UnpicklingError):
+                jobs.put(None)
+                return
+            if message['type'] == "job":
+                progresses[message['id']] = _StreamingProgress(emit)
+                jobs.put(message)
+            elif message['type'] == "stop" and message['job_id'] in progresses:
+                progresses[message['job_id']].stop()
+
+    threading.Thread(target=read_messages, daemon=True).start()
+    try:
+        while (job := jobs.get()) is not None:
+            try:
+                result, alternatives = run_job(job, progresses[job['id']],
+                                               on_sweep_point=lambda point: emit({'type': "sweep_point", 'result': point}))
+            except Exception:
+                emit({'type': "error", 'error': traceback.format_exc()})
+            else:
+                emit({'type': "result", 'result': result, 'alternatives': alternatives})
+            finally:
+                progresses.pop(job['id'], None)
+    except BrokenPipeError:
+        # 親のプロセスが終わった
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    # 標準入力を読んでいるスレッドが終了処理の邪魔をしないよう、後片付けをせずに終える（結果は送り終わっている）
+    code = main()
+    sys.stderr.flush()
+    os._exit(code)